@@ -9,23 +9,24 @@ Arguments:
     <index>: path to the directory where the index is stored
     <queries>: 
     <output>: 
+    [--verbose]: print the terms, postings and results of every query
 
     python BooleanAND.py queries.txt hw2-results-adeepan.txt
 
 """
 
-import json
 import sys
+from segments import open_index
+from bm25 import query_terms
+from intersect import intersect
+from tokenizer import Tokenize
 
 
 def load(index_dir):
-    with open(f"{index_dir}/inverted-index.json", "r") as f:
-        inv_index = json.load(f)
-    with open(f"{index_dir}/lexicon.json", "r") as f:
-        lexicon = json.load(f)
+    index = open_index(index_dir)
     with open(f"{index_dir}/docno_list.txt", "r") as f:
         docno_list = [line.strip() for line in f.readlines()]
-    return inv_index, lexicon, docno_list
+    return index, docno_list
 
 
 def read_queries(queries_file):
@@ -39,49 +40,34 @@ def read_queries(queries_file):
     return queries
 
 
-def boolean_and(query, lexicon, inv_index):
+def boolean_and(query, index, verbose=False):
+    debug = print if verbose else lambda *args: None
     terms = []
     Tokenize(query, terms)
-    print(f"Tokenized query terms: {terms}")
+    debug(f"Tokenized query terms: {terms}")
 
     terms = [term.lower() for term in terms]
-    print(f"Lowercased terms: {terms}")
+    debug(f"Lowercased terms: {terms}")
 
-    valid_terms = [term for term in terms if term in lexicon]
-    print(f"Valid terms found in lexicon: {valid_terms}")
+    if index.stemmed:
+        terms = query_terms(terms, index)
+        debug(f"Stemmed terms: {terms}")
+
+    valid_terms = [term for term in terms if term in index]
+    debug(f"Valid terms found in lexicon: {valid_terms}")
 
     if not valid_terms:
         return []  # no valid terms found
 
-    valid_terms.sort(key=lambda term: len(inv_index[str(lexicon[term])]))
-    print(f"Terms sorted by postings list length: {valid_terms}")
-
-    # postings list for the first valid term
-    print(
-        f"Postings list for '{valid_terms[0]}': {inv_index[str(lexicon[valid_terms[0]])]}"
-    )
-
-    # start with the result set from the first term
-    result_set = [doc_id for doc_id, _ in inv_index[str(lexicon[valid_terms[0]])]]
-    print(f"Initial result set from first term '{valid_terms[0]}': {result_set}")
-
-    # intersect the result set with the postings lists of the other terms
-    for term in valid_terms[1:]:
-        postings = inv_index[str(lexicon[term])]
-        print(f"Postings list for '{term}': {postings}")
-        new_results = []
-        i, j = 0, 0
-        while i < len(result_set) and j < len(postings):
-            if result_set[i] == postings[j][0]:
-                new_results.append(result_set[i])
-                i += 1
-                j += 1
-            elif result_set[i] < postings[j][0]:
-                i += 1
-            else:
-                j += 1
-        result_set = new_results
-        print(f"Updated result set after processing term '{term}': {result_set}")
+    valid_terms.sort(key=index.doc_freq)
+    debug(f"Terms sorted by postings list length: {valid_terms}")
+    if verbose:
+        for term in valid_terms:
+            print(f"Postings list for '{term}': {list(zip(*index.postings(term)))}")
+
+    # skips the blocks of the longer lists that can't hold a candidate
+    result_set = intersect(valid_terms, index)
+    debug(f"Result set: {result_set}")
     return result_set
 
 
@@ -97,46 +83,30 @@ def write_results(output_file, results, docno_list):
                 rank += 1
 
 
-# Based on SimpleTokenizer by Trevor Strohman,
-# http://www.galagosearch.org/
-def Tokenize(text, tokens):
-    text = text.lower()
-    start = 0
-    i = 0
-    for currChar in text:
-        if not currChar.isdigit() and not currChar.isalpha():
-            if start != i:
-                token = text[start:i]
-                tokens.append(token)
-            start = i + 1
-        i = i + 1
-    if start != i:
-        tokens.append(text[start:i])
-
-
-def TokenizeStrings(strings, tokens):
-    for string in strings:
-        Tokenize(string, tokens)
-
-
-def main(index_dir, queries_file, output_file):
-    inv_index, lexicon, docno_list = load(index_dir)
+def main(index_dir, queries_file, output_file, verbose=False):
+    index, docno_list = load(index_dir)
     queries = read_queries(queries_file)
     results = {}
     for topic_id, query in queries:
-        print(f"\nProcessing query '{query}' (Topic ID: {topic_id})")
-        docs = boolean_and(query, lexicon, inv_index)
+        if verbose:
+            print(f"\nProcessing query '{query}' (Topic ID: {topic_id})")
+        docs = boolean_and(query, index, verbose)
         results[topic_id] = docs
     write_results(output_file, results, docno_list)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: BooleanAND <index_directory> <queries_file> <output_file>")
+    verbose = "--verbose" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--verbose"]
+    if len(args) != 3:
+        print(
+            "Usage: BooleanAND <index_directory> <queries_file> <output_file> "
+            "[--verbose]"
+        )
         sys.exit(1)
 
-    index_dir = sys.argv[1]
-    queries_file = sys.argv[2]
-    output_file = sys.argv[3]
+    index_dir = args[0]
+    queries_file = args[1]
+    output_file = args[2]
 
-    main(index_dir, queries_file, output_file)
+    main(index_dir, queries_file, output_file, verbose)
@@ -0,0 +1,48 @@
+"""
+This program runs Boolean queries with AND, OR, NOT, parentheses and quoted
+phrases (see boolean_query.py) over an index created by IndexEngine, and writes
+the matching documents of every topic in the same format as BooleanAND.
+
+Usage:
+    python BooleanQuery.py <index> <queries> <output> [--verbose]
+
+Arguments:
+    <index>: path to the directory where the index is stored
+    <queries>: topic ids and queries on alternating lines, as for BooleanAND
+    <output>: path of the results file
+    [--verbose]: print the plan and the number of results of every query
+
+    python BooleanQuery.py storage queries.txt hw2-results-adeepan.txt
+"""
+
+import sys
+from BooleanAND import load, read_queries, write_results
+from boolean_query import BooleanQueryEngine, explain
+
+
+def main(index_dir, queries_file, output_file, verbose=False):
+    index, docno_list = load(index_dir)
+    engine = BooleanQueryEngine(index)
+    results = {}
+    for topic_id, query in read_queries(queries_file):
+        plan = engine.plan(query)
+        docs = engine.evaluate(plan)
+        if verbose:
+            print(f"{topic_id}: {query}")
+            print(f"  plan: {explain(plan)}")
+            print(f"  {len(docs)} documents")
+        results[topic_id] = docs
+    write_results(output_file, results, docno_list)
+
+
+if __name__ == "__main__":
+    verbose = "--verbose" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--verbose"]
+    if len(args) != 3:
+        print(
+            "Usage: BooleanQuery <index_directory> <queries_file> <output_file> "
+            "[--verbose]"
+        )
+        sys.exit(1)
+
+    main(args[0], args[1], args[2], verbose)
@@ -3,50 +3,125 @@ This program retrieves and displays a document and its metadata from a document
 that was created by IndexEngine. It supports fetching documents by DOCNO or internal ID.
 
 Usage:
-    python GetDoc.py <document_store> <id|docno> <identifier>
+    python GetDoc.py <document_store> <id|docno> <identifier> [<identifier> ...]
     
 Arguments:
     <document_store>: path to the directory where the documents are stored
     <id|docno>: specify whether to search by internal ID or DOCNO
-    <identifier>: either the internal ID or DOCNO of the document to retrieve
+    <identifier>: either the internal ID or DOCNO of the document to retrieve; several
+              identifiers, or "-" to read them from standard input one per line, are
+              fetched in one run
 
     GetDoc /home/smucker/latimes-index docno LA010290-0030
     GetDoc /home/smucker/latimes-index id 6832
+    GetDoc /home/smucker/latimes-index docno - < docnos.txt
+
+DOCNOs are looked up and metadata is read in the metadata table (see
+metadata_table.py), the document in the document store (see doc_store.py);
+stores built before the table existed are read from the per-document files.
 
 """
 
 import os
 import sys
+from metadata_table import format_metadata, has_table
+from segments import open_doc_store, open_metadata_table
 
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python GetDoc.py <document_store> <id|docno> <identifier>")
+    if len(sys.argv) < 4:
+        print(
+            "Usage: python GetDoc.py <document_store> <id|docno> <identifier> "
+            "[<identifier> ...]"
+        )
         sys.exit(1)
 
     document_store = sys.argv[1]
     search_type = sys.argv[2]
-    identifier = sys.argv[3]
-
-    docnos = load_docnos(document_store)
+    identifiers = sys.argv[3:]
+    if identifiers == ["-"]:
+        identifiers = [line.strip() for line in sys.stdin if line.strip()]
 
-    if search_type == "docno":
-        docno = identifier
-        if docno not in docnos:
-            print(f"Error: Document with DOCNO {docno} not found.")
-            sys.exit(1)
-        internal_id = docnos.index(docno)
-    elif search_type == "id":
-        internal_id = int(identifier)
-        if internal_id >= len(docnos):
-            print(f"Error: Document with internal ID {internal_id} not found.")
-            sys.exit(1)
-        docno = docnos[internal_id]
-    else:
+    lookup = DocumentLookup(document_store)
+    if search_type not in ("docno", "id"):
         print("Error: The second argument must be either 'id' or 'docno'.")
         sys.exit(1)
 
-    display_document(document_store, docno, internal_id)
+    # a batch goes on past documents that aren't found
+    found_all = True
+    for identifier in identifiers:
+        if search_type == "docno":
+            docno = identifier
+            internal_id = lookup.doc_id(docno)
+            if internal_id is None:
+                print(f"Error: Document with DOCNO {docno} not found.")
+                found_all = False
+                continue
+        else:
+            internal_id = int(identifier)
+            docno = lookup.docno(internal_id)
+            if docno is None:
+                print(f"Error: Document with internal ID {internal_id} not found.")
+                found_all = False
+                continue
+
+        lookup.display(docno, internal_id)
+
+    if not found_all:
+        sys.exit(1)
+
+
+class DocumentLookup:
+    """Maps DOCNOs to internal ids and back and displays documents.
+
+    Everything is opened once, so a batch of identifiers costs a binary search
+    in the metadata table (see metadata_table.py) and a document store read
+    each. Stores built before the table existed load docno_list.txt into a dict.
+    """
+
+    def __init__(self, document_store):
+        self.document_store = document_store
+        if has_table(document_store):
+            self.table = open_metadata_table(document_store)
+            self.doc_store = open_doc_store(document_store)
+        else:
+            self.table = None
+            self.docnos = load_docnos(document_store)
+            self.docno_ids = {docno: i for i, docno in enumerate(self.docnos)}
+
+    def doc_id(self, docno):
+        if self.table is not None:
+            return self.table.doc_id(docno)
+        return self.docno_ids.get(docno)
+
+    def docno(self, internal_id):
+        if self.table is not None:
+            metadata = self.table.get(internal_id)
+            return metadata["docno"] if metadata is not None else None
+        if not 0 <= internal_id < len(self.docnos):
+            return None
+        return self.docnos[internal_id]
+
+    def display(self, docno, internal_id):
+        if self.table is None:
+            display_document(self.document_store, docno, internal_id)
+            return
+        metadata = self.table.get(internal_id)
+        doc = self.doc_store.get(internal_id)
+        if metadata is None or doc is None:
+            print(f"Error: Document {internal_id} not found in the document store.")
+            sys.exit(1)
+        print(
+            format_metadata(
+                docno,
+                internal_id,
+                metadata["date"],
+                metadata["headline"],
+                metadata["length"],
+            )
+        )
+        print("raw document:")
+        print(f"{doc}\n")
 
 
 def load_docnos(document_store):
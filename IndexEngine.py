@@ -1,17 +1,43 @@
 """
 This program reads a gzip-compressed LATimes file (latimes.gz), extracts metadata (DOCNO, HEADLINE), and text from each document, and:
-- Tokenizes text from the TEXT, HEADLINE, and GRAPHIC tags (without removing stopwords or stemming)
+- Tokenizes text from the TEXT, HEADLINE, and GRAPHIC tags (without removing stopwords, and stemming only with --stem)
 - Calculates and stores document lengths
 - Converts tokens to integer IDs using a lexicon
-- Builds an in-memory inverted index, mapping term IDs to document IDs and term frequencies
+- Builds an in-memory inverted index, mapping term IDs to document IDs and term frequencies,
+  and saves it as a binary, memory-mapped index (see binary_index.py), optionally with the
+  positions of every term in every document
 - Stores each document as a separate file in a directory structure based on the document's date (YY/MM/DD), using the DOCNO as the filename
+- Appends each document to a packed document store read on demand by internal ID (see doc_store.py)
+- Writes the DOCNO, date, headline and length of every document to a memory-mapped columnar table (see metadata_table.py)
+- Optionally stores the sentences of every document with their token ids for query-biased snippets (see sentence_store.py)
 
 Usage:
-    python index_engine.py <path_to_gz_file> <output_directory>
-    
+    python index_engine.py <path_to_gz_file> <output_directory> [--jobs N] [--memory-budget MB] [--stem] [--positions] [--sentences] [--append | --update] [--no-doc-files]
+
 Arguments:
-    <path_to_gz_file>: path to the latimes.gz file containing the documents
+    <path_to_gz_file>: path to the latimes.gz file containing the documents, to an
+              uncompressed copy of it or to a directory of gz parts read in name order.
+              A reader thread decompresses it ahead of the indexer (see trec_parser.py)
     <output_directory>: directory where the documents and metadata will be stored
+    --jobs N: tokenize and invert ranges of documents in N worker processes and merge
+              them into one index (same term ids and doc ids as the sequential build)
+    --memory-budget MB: keep at most about MB megabytes of postings in memory, flushing
+              sorted runs to disk and k-way merging them into the final index
+    --stem: index Porter stems of the tokens (see stemmer.py); queries against the index
+              are stemmed the same way
+    --positions: also store the token positions of every posting, for phrase and
+              proximity queries (see proximity.py). Segments appended later store them
+              if the existing index does
+    --sentences: also store the sentences of every document with their token ids, so
+              snippets don't parse the raw documents (see sentence_store.py). Segments
+              appended later store them if the existing index does
+    --append: add the documents to an existing index as a new segment instead of
+              rebuilding it (see segments.py); small segments are merged in the background.
+              The new segment is stemmed if the existing index is
+    --update: like --append, and delete the previous versions of documents whose DOCNO
+              is already in the index (see tombstones.py)
+    --no-doc-files: keep the documents and their metadata only in the document store and
+              metadata table, without the two files per document under YYYY/MM/DD
 
 Example:
     python IndexEngine.py /home/smucker/latimes.gz /home/smucker/latimes-index
@@ -19,99 +45,271 @@ Example:
 """
 
 from datetime import datetime
+import argparse
 import json
 import os
-import gzip
 import sys
-import re
-from collections import defaultdict
+from collections import defaultdict, deque
+from multiprocessing import Pool
+from binary_index import BinaryIndex, write_index
+from doc_store import DocStoreWriter
+from metadata_table import MetadataTableWriter, format_metadata
+from segments import (
+    load_manifest,
+    locked,
+    new_segment,
+    next_doc_id,
+    save_manifest,
+    segment_path,
+    start_background_merge,
+)
+from sentence_store import SentenceStoreWriter, has_sentences, sentence_record
+from spimi import POSITION_BYTES, POSTING_BYTES, merge_runs, remove_runs, write_run
+from stemmer import stem_tokens
+from tokenizer import Tokenize
+from tombstones import load_doc_ids, mark_deleted
+from trec_parser import parse_file
 
 # global vars
 docnos = []
 docno_to_id = {}
 lexicon = {}
 postings = defaultdict(list)
+# positions of the postings of every term one after another, with --positions
+positions = defaultdict(list)
 curr_tid = 0
 doc_lengths = []
 
+# internal id of the first document, non-zero when appending a segment
+id_offset = 0
+
+# index Porter stems instead of tokens
+stemming = False
+
+# also index the positions of the tokens
+positional = False
+
+# also store the sentences of every document for snippets
+store_sentences = False
+
+# also write a .txt and a .metadata.txt file per document
+doc_files = True
+
+# postings are flushed to run files once this many are held in memory
+max_postings_in_memory = None
+num_postings_in_memory = 0
+run_files = []
+
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python IndexEngine.py <path_to_gz_file> <output_dir>")
-        sys.exit(1)
+    global max_postings_in_memory, stemming, positional, store_sentences, doc_files
+    parser = argparse.ArgumentParser(
+        description="Index the LA Times collection and store its documents."
+    )
+    parser.add_argument(
+        "input_gz",
+        help="path to the latimes.gz file, an uncompressed copy or a directory of parts",
+    )
+    parser.add_argument(
+        "output_dir", help="directory where the index and documents are stored"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes that tokenize and invert documents",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="flush postings to run files on disk when they reach this size "
+        "and merge the runs at the end",
+    )
+    parser.add_argument(
+        "--stem",
+        action="store_true",
+        help="index the Porter stems of the tokens",
+    )
+    parser.add_argument(
+        "--positions",
+        action="store_true",
+        help="store the positions of the terms in every document",
+    )
+    parser.add_argument(
+        "--sentences",
+        action="store_true",
+        help="store the sentences of every document for snippets",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="add the documents to an existing index as a new segment",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="append the documents and delete their previous versions",
+    )
+    parser.add_argument(
+        "--no-doc-files",
+        action="store_true",
+        help="store the documents and metadata only in the document store "
+        "and metadata table",
+    )
+    args = parser.parse_args()
+    args.append = args.append or args.update
 
-    input_gz = sys.argv[1]
-    output_dir = sys.argv[2]
+    input_gz = args.input_gz
+    output_dir = args.output_dir
 
     if not os.path.exists(input_gz):
         print(f"Error: File '{input_gz}' does not exist.")
         sys.exit(1)
 
-    if os.path.exists(output_dir):
+    if args.append:
+        if not os.path.exists(output_dir):
+            print(f"Error: Output directory '{output_dir}' does not exist.")
+            sys.exit(1)
+    elif os.path.exists(output_dir):
         print(f"Error: Output directory '{output_dir}' already exists.")
         sys.exit(1)
 
-    os.makedirs(output_dir, exist_ok=True)
-
+    if args.memory_budget is not None:
+        max_postings_in_memory = args.memory_budget * 1024 * 1024 // POSTING_BYTES
+    stemming = args.stem
+    positional = args.positions
+    store_sentences = args.sentences
+    doc_files = not args.no_doc_files
+
+    if args.append:
+        append_segment(input_gz, output_dir, args.jobs, args.update)
+        start_background_merge(output_dir)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        build(input_gz, output_dir, output_dir, args.jobs)
+
+
+def append_segment(input_gz, output_dir, jobs, update=False):
+    global id_offset, stemming, positional, store_sentences
+    # one writer at a time: the new documents take the ids after the last segment
+    with locked(output_dir):
+        manifest = load_manifest(output_dir)
+        id_offset = next_doc_id(output_dir, manifest)
+        previous = load_doc_ids(output_dir) if update else {}
+        # segments are tokenized like the rest of the index
+        root = BinaryIndex(output_dir)
+        stemming = root.stemmed
+        positional = root.positional
+        store_sentences = has_sentences(output_dir)
+        name = new_segment(output_dir, manifest)
+        build(input_gz, output_dir, segment_path(output_dir, name), jobs)
+        manifest["segments"].append(
+            {"name": name, "base": id_offset, "num_docs": len(doc_lengths)}
+        )
+        save_manifest(output_dir, manifest)
+        if update:
+            replaced = [
+                doc_id for docno in docnos for doc_id in previous.get(docno, [])
+            ]
+            mark_deleted(output_dir, replaced)
+
+
+def build(input_gz, output_dir, index_dir, jobs):
+    """Index input_gz into index_dir, storing the documents under output_dir."""
     docno_list_file = os.path.join(output_dir, "docno_list.txt")
-    docno_id_map_file = os.path.join(output_dir, "docno_id_map.json")
-
-    with open(docno_list_file, "w") as map_out:
-        with gzip.open(input_gz, "rt") as f:
-            doc = ""
-            within = False
-            for line in f:
-                if "<DOC>" in line:
-                    within = True
-                    doc = line
-                elif "</DOC>" in line:
-                    doc += line
-                    process(doc, output_dir, map_out, len(docnos))
-                    docnos.append(doc.split("</DOCNO>")[0].split("<DOCNO>")[1].strip())
-                    doc = ""
-                    within = False
-                elif within:
-                    doc += line
+    docno_id_map_file = os.path.join(index_dir, "docno_id_map.json")
+
+    stores = (
+        DocStoreWriter(index_dir),
+        MetadataTableWriter(index_dir),
+        SentenceStoreWriter(index_dir) if store_sentences else None,
+    )
+    with open(docno_list_file, "a") as map_out:
+        if jobs > 1:
+            index_parallel(parse_file(input_gz), output_dir, map_out, stores, jobs)
+        else:
+            for doc in parse_file(input_gz):
+                process(doc, output_dir, map_out, stores, len(docnos))
+                docnos.append(doc.docno)
+    for store in stores:
+        if store is not None:
+            store.close()
     with open(docno_id_map_file, "w") as f:
         json.dump(docno_to_id, f, indent=4)
 
-    save(output_dir)
+    save(output_dir, index_dir)
 
 
-def process(doc, output_dir, map_out, iid):
-    global curr_tid
-    docno = extract(doc, "DOCNO")
-    headline = extract(doc, "HEADLINE")
-    year, month, day = parse_docno_to_date(docno)
-    text_content = (
-        extract(doc, "TEXT")
-        + " "
-        + extract(doc, "HEADLINE")
-        + " "
-        + extract(doc, "GRAPHIC")
-    )
+def analyze(doc, stem=False):
+    """Tokenize a TrecDocument (see trec_parser.py)."""
+    text_content = doc.text + " " + doc.headline + " " + doc.graphic
     tokens = []
     Tokenize(text_content, tokens)
+    if stem:
+        tokens = stem_tokens(tokens)
+    return doc.docno, doc.headline, tokens
+
+
+def process(doc, output_dir, map_out, stores, iid):
+    global curr_tid
+    docno, headline, tokens = analyze(doc, stemming)
     length = len(tokens)
     doc_lengths.append(length)
 
-    tf = defaultdict(int)
-    for token in tokens:
-        if token not in lexicon:
-            lexicon[token] = curr_tid
-            curr_tid += 1
-        tid = lexicon[token]
-        tf[tid] += 1
+    if positional:
+        # the frequency of a term is the number of its positions
+        occurrences = defaultdict(list)
+        for i, token in enumerate(tokens):
+            if token not in lexicon:
+                lexicon[token] = curr_tid
+                curr_tid += 1
+            occurrences[lexicon[token]].append(i)
+        for tid, where in occurrences.items():
+            postings[tid].append((iid, len(where)))
+            positions[tid].extend(where)
+        check_memory(output_dir, len(occurrences), length)
+    else:
+        tf = defaultdict(int)
+        for token in tokens:
+            if token not in lexicon:
+                lexicon[token] = curr_tid
+                curr_tid += 1
+            tf[lexicon[token]] += 1
+        for tid, freq in tf.items():
+            postings[tid].append((iid, freq))
+        check_memory(output_dir, len(tf))
+
+    docno_to_id[docno] = iid + id_offset
+    map_out.write(docno + "\n")
+    sentences = sentence_record(doc.raw) if store_sentences else None
+    add_to_stores(stores, doc, length, sentences)
 
-    for tid, freq in tf.items():
-        postings[tid].append((iid, freq))
+    if doc_files:
+        metadata = metadata_record(docno, headline, iid + id_offset, length)
+        store_document(doc.raw, output_dir, docno, metadata)
 
-    docno_to_id[docno] = iid
-    map_out.write(docno + "\n")
+
+def add_to_stores(stores, doc, length, sentences=None):
+    doc_store, metadata_table, sentence_store = stores
+    doc_store.add(doc.raw)
+    metadata_table.add(doc.docno, docno_date(doc.docno), doc.headline, length)
+    if sentence_store is not None:
+        sentence_store.add_record(sentences)
+
+
+def metadata_record(docno, headline, iid, length):
+    year, month, day = parse_docno_to_date(docno)
 
     # normalize the headline to a single line
     headline = " ".join(headline.split())
 
+    return format_metadata(docno, iid, format_date(year, month, day), headline, length)
+
+
+def store_document(doc, output_dir, docno, metadata):
+    year, month, day = parse_docno_to_date(docno)
+
     date_path = os.path.join(output_dir, year, month, day)
     os.makedirs(date_path, exist_ok=True)
 
@@ -121,56 +319,167 @@ def process(doc, output_dir, map_out, iid):
 
     metadata_filename = os.path.join(date_path, f"{docno}.metadata.txt")
     with open(metadata_filename, "w") as metadata_file:
-        metadata_file.write(f"docno: {docno}\n")
-        metadata_file.write(f"internal id: {iid}\n")
-        metadata_file.write(f"date: {format_date(year, month, day)}\n")
-        metadata_file.write(f"headline: {headline}\n")
-        metadata_file.write(f"document length: {length}\n")
-
-
-# Based on SimpleTokenizer by Trevor Strohman,
-# http://www.galagosearch.org/
-def Tokenize(text, tokens):
-    text = text.lower()
-    start = 0
-    i = 0
-    for currChar in text:
-        if not currChar.isdigit() and not currChar.isalpha():
-            if start != i:
-                token = text[start:i]
-                tokens.append(token)
-            start = i + 1
-        i = i + 1
-    if start != i:
-        tokens.append(text[start:i])
-
-
-def save(output_dir):
-    inverted_index_file = os.path.join(output_dir, "inverted-index.json")
-    lexicon_file = os.path.join(output_dir, "lexicon.json")
-    doc_lengths_file = os.path.join(output_dir, "doc-lengths.txt")
+        metadata_file.write(metadata)
+
+
+def index_parallel(documents, output_dir, map_out, stores, jobs, batch_size=500):
+    """Tokenize and invert ranges of documents in worker processes.
+
+    Every range is inverted with a local lexicon and merged into the global
+    index in collection order, which gives the same term ids, doc ids and
+    postings as the sequential build.
+    """
+    pending = deque()
+    with Pool(jobs) as pool:
+        for first_iid, docs in document_ranges(documents, batch_size):
+            task = (
+                output_dir,
+                first_iid,
+                id_offset,
+                stemming,
+                positional,
+                store_sentences,
+                doc_files,
+                docs,
+            )
+            pending.append((docs, pool.apply_async(invert_range, (task,))))
+            # bound the number of ranges held in memory
+            if len(pending) > 2 * jobs:
+                docs, result = pending.popleft()
+                merge_range(docs, result.get(), output_dir, map_out, stores)
+        while pending:
+            docs, result = pending.popleft()
+            merge_range(docs, result.get(), output_dir, map_out, stores)
+
+
+def document_ranges(documents, batch_size):
+    docs = []
+    first_iid = 0
+    for doc in documents:
+        docs.append(doc)
+        if len(docs) == batch_size:
+            yield first_iid, docs
+            first_iid += len(docs)
+            docs = []
+    if docs:
+        yield first_iid, docs
+
+
+def invert_range(task):
+    (
+        output_dir,
+        first_iid,
+        offset,
+        stem,
+        with_positions,
+        with_sentences,
+        write_files,
+        docs,
+    ) = task
+    local_lexicon = {}
+    local_postings = []
+    local_positions = []
+    doc_info = []
+    for iid, doc in enumerate(docs, start=first_iid):
+        docno, headline, tokens = analyze(doc, stem)
+        occurrences = defaultdict(list)
+        for i, token in enumerate(tokens):
+            tid = local_lexicon.get(token)
+            if tid is None:
+                tid = local_lexicon[token] = len(local_postings)
+                local_postings.append([])
+                local_positions.append([])
+            occurrences[tid].append(i)
+
+        for tid, where in occurrences.items():
+            local_postings[tid].append((iid, len(where)))
+            if with_positions:
+                local_positions[tid].extend(where)
+
+        if write_files:
+            metadata = metadata_record(docno, headline, iid + offset, len(tokens))
+            store_document(doc.raw, output_dir, docno, metadata)
+        sentences = sentence_record(doc.raw) if with_sentences else None
+        doc_info.append((docno, len(tokens), sentences))
+    # local term ids follow first occurrence, so terms are returned in that order
+    return doc_info, list(local_lexicon), local_postings, local_positions
+
+
+def merge_range(docs, inverted, output_dir, map_out, stores):
+    global curr_tid
+    doc_info, terms, local_postings, local_positions = inverted
+    for doc, (docno, length, sentences) in zip(docs, doc_info):
+        iid = len(docnos)
+        doc_lengths.append(length)
+        docno_to_id[docno] = iid + id_offset
+        map_out.write(docno + "\n")
+        add_to_stores(stores, doc, length, sentences)
+        docnos.append(docno)
+
+    for term, plist, where in zip(terms, local_postings, local_positions):
+        if term not in lexicon:
+            lexicon[term] = curr_tid
+            curr_tid += 1
+        postings[lexicon[term]].extend(plist)
+        if positional:
+            positions[lexicon[term]].extend(where)
+    check_memory(
+        output_dir,
+        sum(len(plist) for plist in local_postings),
+        sum(len(where) for where in local_positions),
+    )
 
-    with open(inverted_index_file, "w") as f:
-        json.dump(postings, f)
-    with open(lexicon_file, "w") as f:
-        json.dump(lexicon, f)
-    with open(doc_lengths_file, "w") as f:
-        for length in doc_lengths:
-            f.write(f"{length}\n")
 
+def check_memory(output_dir, added, added_positions=0):
+    global num_postings_in_memory
+    # positions are counted as the number of postings taking the same memory
+    num_postings_in_memory += added + added_positions * POSITION_BYTES // POSTING_BYTES
+    if (
+        max_postings_in_memory is not None
+        and num_postings_in_memory >= max_postings_in_memory
+    ):
+        flush_postings(output_dir)
 
-def extract(doc, tag):
-    start_tag = f"<{tag}>"
-    end_tag = f"</{tag}>"
 
-    start = doc.find(start_tag)
-    end = doc.find(end_tag)
+def flush_postings(output_dir):
+    global num_postings_in_memory
+    runs_dir = os.path.join(output_dir, "runs")
+    os.makedirs(runs_dir, exist_ok=True)
+    run_file = os.path.join(runs_dir, f"run-{len(run_files):04d}.bin")
+    write_run(run_file, postings, positions if positional else None)
+    run_files.append(run_file)
+    postings.clear()
+    positions.clear()
+    num_postings_in_memory = 0
 
-    if start == -1 or end == -1:
-        return ""
-    content = doc[start + len(start_tag) : end].strip()
-    content = re.sub(r"<[^>]+>", "", content)
-    return content
+
+def save(output_dir, index_dir):
+    doc_lengths_file = os.path.join(output_dir, "doc-lengths.txt")
+
+    if run_files:
+        if postings:
+            flush_postings(output_dir)
+        postings_lists = merge_runs(run_files, positional)
+    else:
+        postings_lists = (
+            (tid, [doc_id for doc_id, _ in plist], [freq for _, freq in plist])
+            + ((positions[tid],) if positional else ())
+            for tid, plist in postings.items()
+        )
+    write_index(
+        index_dir,
+        lexicon,
+        postings_lists,
+        doc_lengths,
+        stemmed=stemming,
+        positional=positional,
+    )
+    if run_files:
+        remove_runs(run_files)
+        os.rmdir(os.path.join(output_dir, "runs"))
+    with open(doc_lengths_file, "a") as f:
+        for length in doc_lengths:
+            f.write(f"{length}\n")
 
 
 def parse_docno_to_date(docno):
@@ -180,6 +489,11 @@ def parse_docno_to_date(docno):
     return year, month, day
 
 
+def docno_date(docno):
+    """Return the date of a document as a YYYYMMDD integer."""
+    return int("".join(parse_docno_to_date(docno)))
+
+
 def format_date(year, month, day):
     date_obj = datetime.strptime(f"{year}-{month}-{day}", "%Y-%m-%d")
     formatted_date = date_obj.strftime("%B %d, %Y")
@@ -0,0 +1,96 @@
+"""
+This program runs a TREC-style BM25 batch: every topic in a queries file is
+scored against the binary index and the top 1000 documents per topic are written
+in the "topic Q0 docno rank score run" format. Queries are spread over a pool of
+worker processes; each worker opens the index read-only with mmap, so all of them
+share the same pages of the OS page cache instead of holding their own copy.
+
+Results are written in the order of the queries file regardless of which worker
+finished first. When several worker counts are given the batch is run once per
+count and the throughput of each run is reported.
+
+Usage:
+    python batch_bm25.py <index_dir> <queries_file> <output_file> [workers]
+
+Arguments:
+    <index_dir>: path to the directory where the index is stored
+    <queries_file>: topic ids and queries on alternating lines
+    <output_file>: file the run is written to
+    [workers]: number of worker processes, or a comma-separated list of counts
+               to compare (default: number of CPUs)
+
+    python batch_bm25.py latimes-index queries.txt hw4-results-adeepan.txt 1,2,4,8
+
+"""
+
+import os
+import sys
+import time
+from multiprocessing import Pool
+from bm25 import Tokenize, compute_bm25, load_queries, query_terms, write_run
+from segments import open_index
+
+RUN_TAG = "adeepanBM25"
+
+# per-worker state, set up by init_worker
+index = None
+docno_list = None
+
+
+def load_docno_list(index_dir):
+    with open(os.path.join(index_dir, "docno_list.txt"), "r") as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def init_worker(index_dir):
+    global index, docno_list
+    index = open_index(index_dir)
+    docno_list = load_docno_list(index_dir)
+
+
+def run_query(query):
+    query_id, query_text = query
+    query_tokens = []
+    Tokenize(query_text, query_tokens)
+    query_tokens = query_terms(query_tokens, index)
+    doc_lengths = index.doc_lengths
+    scores = compute_bm25(
+        query_tokens, doc_lengths, index.avg_doc_length, index, index.total_docs
+    )
+    ranked_docs = sorted(scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+    return query_id, ranked_docs[:1000]
+
+
+def run_batch(index_dir, queries, workers):
+    with Pool(workers, initializer=init_worker, initargs=(index_dir,)) as pool:
+        # imap keeps the order of the queries file
+        return dict(pool.imap(run_query, queries.items()))
+
+
+def main(index_dir, queries_file, output_file, worker_counts):
+    queries = load_queries(queries_file)
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = run_batch(index_dir, queries, workers)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{workers} worker(s): {len(queries)} queries in {elapsed:.2f} s, "
+            f"{len(queries) / elapsed:.1f} queries/s"
+        )
+    write_run(output_file, results, load_docno_list(index_dir), RUN_TAG)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print(
+            "Usage: python batch_bm25.py <index_dir> <queries_file> <output_file> "
+            "[workers]"
+        )
+        sys.exit(1)
+
+    if len(sys.argv) == 5:
+        worker_counts = [int(count) for count in sys.argv[4].split(",")]
+    else:
+        worker_counts = [os.cpu_count()]
+
+    main(sys.argv[1], sys.argv[2], sys.argv[3], worker_counts)
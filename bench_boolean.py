@@ -0,0 +1,115 @@
+"""
+Compares the linear merge (intersect.intersect_linear) against the skipping
+intersection BooleanAND uses (intersect.intersect) on query sets that mix terms
+of different document frequencies, checks that both return the same doc ids,
+and reports the mean latency of each per query set.
+
+Terms are drawn from three bands of the lexicon sorted by document frequency,
+given as percentiles of the terms:
+
+    rare        the 10% of terms with the lowest document frequency
+    medium      the 10% of terms around the median
+    frequent    the 5% of terms with the highest document frequency
+
+Usage:
+    python bench_boolean.py <index_dir> [queries_per_set]
+
+Arguments:
+    [queries_per_set]: number of random queries of every set (default: 200)
+"""
+
+import random
+import sys
+import time
+from intersect import intersect, intersect_linear
+from segments import open_index
+
+SEED = 42
+
+BANDS = {
+    "rare": (0.0, 0.1),
+    "medium": (0.45, 0.55),
+    "frequent": (0.95, 1.0),
+}
+
+QUERY_SETS = [
+    ("rare", "frequent"),
+    ("medium", "frequent"),
+    ("frequent", "frequent"),
+    ("medium", "medium"),
+    ("rare", "medium", "frequent"),
+    ("medium", "frequent", "frequent"),
+]
+
+
+def band_terms(index):
+    """Return the terms of the first segment in every band, by global df."""
+    lexicon = sorted(
+        (index.doc_freq(term), term)
+        for term, record in index.segments[0][1].items()
+        if record[3]
+    )
+    return {
+        band: [
+            term
+            for _, term in lexicon[int(low * len(lexicon)) : int(high * len(lexicon))]
+        ]
+        for band, (low, high) in BANDS.items()
+    }
+
+
+def time_queries(function, queries, index):
+    results = []
+    start = time.perf_counter()
+    for terms in queries:
+        results.append(function(terms, index))
+    return time.perf_counter() - start, results
+
+
+def main(index_dir, queries_per_set):
+    index = open_index(index_dir)
+    terms = band_terms(index)
+    print(
+        f"{index.total_docs} documents, "
+        + ", ".join(
+            f"{band} terms df {index.doc_freq(terms[band][0])}"
+            f"-{index.doc_freq(terms[band][-1])}"
+            for band in BANDS
+            if terms[band]
+        )
+    )
+
+    rng = random.Random(SEED)
+    print(
+        f"{'query set':<34}{'results':>9}{'linear ms':>11}{'skipping ms':>13}"
+        f"{'speedup':>9}"
+    )
+    mismatches = 0
+    for query_set in QUERY_SETS:
+        if not all(terms[band] for band in query_set):
+            print(f"{' AND '.join(query_set):<34} no terms in a band, skipped")
+            continue
+        queries = [
+            [rng.choice(terms[band]) for band in query_set]
+            for _ in range(queries_per_set)
+        ]
+        linear, expected = time_queries(intersect_linear, queries, index)
+        skipping, results = time_queries(intersect, queries, index)
+        mismatches += sum(a != b for a, b in zip(expected, results))
+        mean_results = sum(len(docs) for docs in results) / len(results)
+        print(
+            f"{' AND '.join(query_set):<34}{mean_results:>9.1f}"
+            f"{linear / len(queries) * 1000:>11.3f}"
+            f"{skipping / len(queries) * 1000:>13.3f}"
+            f"{linear / skipping:>8.2f}x"
+        )
+    print(f"{mismatches} queries differ between the two intersections")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python bench_boolean.py <index_dir> [queries_per_set]")
+        sys.exit(1)
+
+    queries_per_set = int(sys.argv[2]) if len(sys.argv) == 3 else 200
+    main(sys.argv[1], queries_per_set)
@@ -0,0 +1,144 @@
+"""
+Compares planned Boolean query evaluation (boolean_query.py) against a naive
+evaluation of the same query tree, which decodes every postings list in full
+and combines Python sets from left to right, on sets of long disjunctive
+queries. Phrases are checked against the documents the same way in both.
+Checks that both return the same documents and reports the mean latency of
+each per query set.
+
+Terms are drawn from the bands of bench_boolean.py; phrases are pairs of
+adjacent tokens of random documents.
+
+Usage:
+    python bench_boolean_query.py <index_dir> [queries_per_set] [or_terms]
+
+Arguments:
+    [queries_per_set]: number of random queries of every set (default: 50)
+    [or_terms]: number of terms of every disjunction (default: 20)
+"""
+
+import random
+import sys
+import time
+from bench_boolean import band_terms
+from boolean_query import BooleanQueryEngine, parse_query
+from IndexEngine import analyze
+from segments import open_index
+from trec_parser import parse_document
+
+SEED = 42
+
+QUERY_SETS = {
+    "OR": "{or}",
+    "rare AND OR": "{rare} AND {or}",
+    "OR AND NOT frequent": "{or} AND NOT {frequent}",
+    "OR AND OR AND NOT": "{or} AND {or} AND NOT ({medium} OR {medium})",
+    "OR of phrases": "{phrases}",
+    "medium AND OR of phrases": "{medium} AND ({phrases})",
+}
+
+
+def naive_evaluate(node, index, engine, universe):
+    op = node[0]
+    if op == "term":
+        doc_ids, _ = index.postings(node[1])
+        return set(doc_ids) - index.deleted
+    if op == "phrase":
+        docs = naive_evaluate(
+            ("and", [("term", t) for t in node[1]]), index, engine, universe
+        )
+        return set(engine.phrase_matches(sorted(docs), node[1], node[2]))
+    if op == "not":
+        return universe - naive_evaluate(node[1], index, engine, universe)
+    children = node[1]
+    if op == "and":
+        # terms that aren't in the index are left out, as in plan_query
+        known = [c for c in children if c[0] != "term" or index.doc_freq(c[1])]
+        if not any(c[0] != "not" for c in known):
+            return set()
+        children = known
+    results = [naive_evaluate(child, index, engine, universe) for child in children]
+    if op == "and":
+        return set.intersection(*results)
+    return set.union(*results)
+
+
+def random_phrase(engine, docs, rng):
+    while True:
+        doc_id = rng.choice(docs)
+        raw = engine.doc_store.get(doc_id)
+        _, _, tokens = analyze(parse_document(raw.encode("utf-8")))
+        if len(tokens) >= 2:
+            i = rng.randrange(len(tokens) - 1)
+            return f'"{tokens[i]} {tokens[i + 1]}"'
+
+
+def random_query(template, terms, engine, docs, or_terms, rng):
+    def disjunction():
+        bands = list(terms)
+        words = [rng.choice(terms[rng.choice(bands)]) for _ in range(or_terms)]
+        return "(" + " OR ".join(words) + ")"
+
+    query = template
+    while "{or}" in query:
+        query = query.replace("{or}", disjunction(), 1)
+    while "{phrases}" in query:
+        phrases = [random_phrase(engine, docs, rng) for _ in range(or_terms // 5)]
+        query = query.replace("{phrases}", " OR ".join(phrases), 1)
+    for band in terms:
+        while "{" + band + "}" in query:
+            query = query.replace("{" + band + "}", rng.choice(terms[band]), 1)
+    return query
+
+
+def main(index_dir, queries_per_set, or_terms):
+    index = open_index(index_dir)
+    engine = BooleanQueryEngine(index)
+    terms = band_terms(index)
+    docs = engine.all_docs()
+    universe = set(docs)
+    rng = random.Random(SEED)
+
+    print(
+        f"{'query set':<28}{'results':>9}{'naive ms':>10}{'planned ms':>12}"
+        f"{'speedup':>9}"
+    )
+    mismatches = 0
+    for name, template in QUERY_SETS.items():
+        queries = [
+            random_query(template, terms, engine, docs, or_terms, rng)
+            for _ in range(queries_per_set)
+        ]
+        start = time.perf_counter()
+        expected = []
+        for query in queries:
+            node = parse_query(query, index)
+            expected.append(sorted(naive_evaluate(node, index, engine, universe)))
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [engine.search(query) for query in queries]
+        planned = time.perf_counter() - start
+
+        mismatches += sum(a != b for a, b in zip(expected, results))
+        mean_results = sum(len(docs) for docs in results) / len(results)
+        print(
+            f"{name:<28}{mean_results:>9.1f}"
+            f"{naive / len(queries) * 1000:>10.2f}"
+            f"{planned / len(queries) * 1000:>12.2f}"
+            f"{naive / planned:>8.2f}x"
+        )
+    print(f"{mismatches} queries differ between the two evaluations")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print(
+            "Usage: python bench_boolean_query.py <index_dir> [queries_per_set] "
+            "[or_terms]"
+        )
+        sys.exit(1)
+
+    queries_per_set = int(sys.argv[2]) if len(sys.argv) >= 3 else 50
+    or_terms = int(sys.argv[3]) if len(sys.argv) == 4 else 20
+    main(sys.argv[1], queries_per_set, or_terms)
@@ -0,0 +1,127 @@
+"""
+Replays a Zipfian query log against the BM25 top-k path (wand.py) without and
+with the result cache (result_cache.py) at several memory bounds, and reports
+the hit rate, evictions and queries/s of each run. Checks that cached results
+are identical to computed ones.
+
+The query population is the topics of the queries file, padded with queries
+of two or three random words of the topics up to UNIVERSE_SIZE queries. Query
+i of the population (in a random order) is drawn with probability
+proportional to 1 / i^s.
+
+Usage:
+    python bench_cache.py <index_dir> <queries_file> [num_queries] [cache_sizes_kb] [s]
+
+Arguments:
+    [num_queries]: length of the replayed log (default: 2000)
+    [cache_sizes_kb]: comma-separated memory bounds in KB (default: 16,64,256,1024)
+    [s]: Zipf exponent (default: 1.0)
+"""
+
+import random
+import sys
+import time
+from collections import Counter
+from bm25 import Tokenize, load_queries, query_terms
+from result_cache import ResultCache, cache_key, cached_top_k
+from segments import index_version, open_index
+from wand import top_k_bm25
+
+UNIVERSE_SIZE = 2000
+K = 10
+SEED = 42
+
+
+def query_universe(topics, size, rng):
+    queries = list(dict.fromkeys(topics))
+    words = sorted({word for topic in queries for word in topic.split()})
+    seen = set(queries)
+    while len(queries) < size and len(words) >= 3:
+        query = " ".join(rng.sample(words, rng.choice((2, 3))))
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries
+
+
+def zipf_log(universe, num_queries, s, rng):
+    ranked = universe[:]
+    rng.shuffle(ranked)
+    weights = [1 / rank**s for rank in range(1, len(ranked) + 1)]
+    return rng.choices(ranked, weights=weights, k=num_queries)
+
+
+def main(index_dir, queries_file, num_queries, cache_sizes, s):
+    index = open_index(index_dir)
+    doc_lengths = index.doc_lengths
+    with open(f"{index_dir}/docno_list.txt", "r") as f:
+        docno_list = [line.strip() for line in f.readlines()]
+    version = index_version(index_dir)
+
+    rng = random.Random(SEED)
+    universe = query_universe(load_queries(queries_file).values(), UNIVERSE_SIZE, rng)
+    log = zipf_log(universe, num_queries, s, rng)
+    terms_log = []
+    for query in log:
+        query_tokens = []
+        Tokenize(query, query_tokens)
+        terms_log.append(query_terms(query_tokens, index))
+
+    def top_k(terms):
+        return top_k_bm25(
+            terms, index, doc_lengths, docno_list, index.avg_doc_length, k=K
+        )
+
+    counts = Counter(log)
+    head = sum(count for _, count in counts.most_common(10))
+    print(
+        f"{len(log)} queries, {len(counts)} distinct, "
+        f"top 10 queries {head / len(log):.1%} of the log, s={s}"
+    )
+
+    reference = {}
+    start = time.perf_counter()
+    for terms in terms_log:
+        reference[cache_key(terms, K)] = top_k(terms)
+    uncached = time.perf_counter() - start
+    print(
+        f"{'cache':>10}{'hit rate':>10}{'entries':>9}{'evictions':>11}"
+        f"{'queries/s':>11}{'speedup':>9}"
+    )
+    print(f"{'none':>10}{'':>10}{'':>9}{'':>11}{len(log) / uncached:>11.1f}")
+
+    mismatches = 0
+    for size_kb in cache_sizes:
+        cache = ResultCache(size_kb * 1024)
+        results = []
+        start = time.perf_counter()
+        for terms in terms_log:
+            results.append(cached_top_k(cache, version, terms, K, lambda: top_k(terms)))
+        elapsed = time.perf_counter() - start
+        mismatches += sum(
+            ranked != reference[cache_key(terms, K)]
+            for terms, ranked in zip(terms_log, results)
+        )
+        stats = cache.stats()
+        print(
+            f"{f'{size_kb} KB':>10}{stats['hit_rate']:>10.1%}{stats['entries']:>9}"
+            f"{stats['evictions']:>11}{len(log) / elapsed:>11.1f}"
+            f"{uncached / elapsed:>8.2f}x"
+        )
+    print(f"{mismatches} cached results differ from computed ones")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4, 5, 6):
+        print(
+            "Usage: python bench_cache.py <index_dir> <queries_file> "
+            "[num_queries] [cache_sizes_kb] [s]"
+        )
+        sys.exit(1)
+
+    num_queries = int(sys.argv[3]) if len(sys.argv) >= 4 else 2000
+    cache_sizes = [16, 64, 256, 1024]
+    if len(sys.argv) >= 5:
+        cache_sizes = [int(size) for size in sys.argv[4].split(",")]
+    s = float(sys.argv[5]) if len(sys.argv) == 6 else 1.0
+    main(sys.argv[1], sys.argv[2], num_queries, cache_sizes, s)
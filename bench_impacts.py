@@ -0,0 +1,99 @@
+"""
+Compares quantized impact retrieval (impact_index.py) with the float BM25 path:
+per-query latency, and MAP / P@10 of both runs as computed by evaluate.py.
+Exits with status 1 if the MAP of the impact run is not within MAP_TOLERANCE of
+the float run.
+
+Usage:
+    python bench_impacts.py <index_dir> <queries_file> <qrels_file> [max_postings]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from binary_index import BinaryIndex
+from bm25 import Tokenize, compute_bm25, load_queries, query_terms, write_run
+from evaluate import (
+    compute_average_precision,
+    compute_precision_at_k,
+    read_qrels,
+    read_results,
+)
+from impact_index import ImpactIndex, impact_top_k
+
+MAP_TOLERANCE = 0.005
+
+
+def evaluate_run(qrels, results, docno_list, run_tag):
+    with tempfile.TemporaryDirectory() as tmp:
+        run_file = os.path.join(tmp, f"{run_tag}.txt")
+        write_run(run_file, results, docno_list, run_tag)
+        run = read_results(run_file)
+    average_precision = compute_average_precision(qrels, run)
+    precision_at_10 = compute_precision_at_k(qrels, run, k=10)
+    return (
+        sum(average_precision.values()) / len(average_precision),
+        sum(precision_at_10.values()) / len(precision_at_10),
+    )
+
+
+def main(index_dir, queries_file, qrels_file, max_postings):
+    index = BinaryIndex(index_dir)
+    impacts = ImpactIndex(index_dir)
+    doc_lengths = index.doc_lengths
+    with open(f"{index_dir}/docno_list.txt", "r") as f:
+        docno_list = [line.strip() for line in f.readlines()]
+    queries = load_queries(queries_file)
+    qrels = read_qrels(qrels_file)
+
+    runs = {"float": {}, "impact": {}}
+    elapsed = {"float": 0.0, "impact": 0.0}
+    for topic_id, query_text in queries.items():
+        query_tokens = []
+        Tokenize(query_text, query_tokens)
+        query_tokens = query_terms(query_tokens, index)
+
+        start = time.perf_counter()
+        scores = compute_bm25(
+            query_tokens, doc_lengths, index.avg_doc_length, index, index.total_docs
+        )
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+        runs["float"][int(topic_id)] = ranked[:1000]
+        elapsed["float"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        runs["impact"][int(topic_id)] = impact_top_k(
+            query_tokens, index, impacts, docno_list, 1000, max_postings
+        )
+        elapsed["impact"] += time.perf_counter() - start
+
+    print(
+        f"{impacts.bits}-bit impacts, {impacts.order} order, "
+        f"max_postings={max_postings}"
+    )
+    metrics = {}
+    for name, results in runs.items():
+        metrics[name] = evaluate_run(qrels, results, docno_list, name)
+        mean_map, mean_p10 = metrics[name]
+        print(
+            f"{name:<8} MAP {mean_map:.4f}   P@10 {mean_p10:.4f}   "
+            f"{elapsed[name] / len(queries) * 1000:.2f} ms/query"
+        )
+    delta = metrics["impact"][0] - metrics["float"][0]
+    status = "within" if abs(delta) <= MAP_TOLERANCE else "OUTSIDE"
+    print(f"MAP difference {delta:+.4f} ({status} tolerance of {MAP_TOLERANCE})")
+    return abs(delta) <= MAP_TOLERANCE
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print(
+            "Usage: python bench_impacts.py <index_dir> <queries_file> "
+            "<qrels_file> [max_postings]"
+        )
+        sys.exit(1)
+
+    max_postings = int(sys.argv[4]) if len(sys.argv) == 5 else None
+    within = main(sys.argv[1], sys.argv[2], sys.argv[3], max_postings)
+    sys.exit(0 if within else 1)
@@ -0,0 +1,88 @@
+"""
+Compares pure-Python BM25 scoring (compute_bm25) with the NumPy-vectorized
+engine (bm25_numpy.py) on the longest postings lists of an index and on a TREC
+topics file, and checks that the rankings are identical.
+
+Usage:
+    python bench_numpy.py <index_dir> <queries_file> [num_terms]
+"""
+
+import sys
+import time
+from binary_index import BinaryIndex
+from bm25 import Tokenize, compute_bm25, load_queries, query_terms
+from bm25_numpy import ArrayPostings, compute_bm25_numpy, top_k
+
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(index_dir, queries_file, num_terms):
+    index = BinaryIndex(index_dir)
+    postings = ArrayPostings(index)
+    doc_lengths = index.doc_lengths
+    avg_doc_length = index.avg_doc_length
+    total_docs = index.total_docs
+    with open(f"{index_dir}/docno_list.txt", "r") as f:
+        docno_list = [line.strip() for line in f.readlines()]
+
+    def python_path(query_tokens):
+        scores = compute_bm25(
+            query_tokens, doc_lengths, avg_doc_length, index, total_docs
+        )
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+        return ranked[:1000]
+
+    def numpy_path(query_tokens):
+        scores = compute_bm25_numpy(
+            query_tokens, postings.doc_lengths, avg_doc_length, postings, total_docs
+        )
+        return top_k(scores, docno_list, 1000)
+
+    longest = sorted(index.items(), key=lambda item: -item[1][3])[:num_terms]
+    print(
+        f"{'term':<16} {'df':>8} {'python ms':>10} {'numpy ms':>10} {'cached ms':>10}"
+    )
+    for term, record in longest:
+        _, python_time = time_call(python_path, [term])
+        postings.postings.cache_clear()
+        _, numpy_time = time_call(numpy_path, [term])
+        _, cached_time = time_call(numpy_path, [term])
+        print(
+            f"{term:<16} {record[3]:>8} {python_time * 1000:>10.2f} "
+            f"{numpy_time * 1000:>10.2f} {cached_time * 1000:>10.2f}"
+        )
+
+    queries = load_queries(queries_file)
+    python_total, numpy_total = 0.0, 0.0
+    mismatches = 0
+    postings.postings.cache_clear()
+    for query_text in queries.values():
+        query_tokens = []
+        Tokenize(query_text, query_tokens)
+        query_tokens = query_terms(query_tokens, index)
+        expected, elapsed = time_call(python_path, query_tokens)
+        python_total += elapsed
+        ranked, elapsed = time_call(numpy_path, query_tokens)
+        numpy_total += elapsed
+        if ranked != expected:
+            mismatches += 1
+
+    print(
+        f"\n{len(queries)} queries: python {python_total / len(queries) * 1000:.2f} "
+        f"ms/query, numpy {numpy_total / len(queries) * 1000:.2f} ms/query "
+        f"({python_total / numpy_total:.1f}x)"
+    )
+    print(f"rankings that differ: {mismatches}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python bench_numpy.py <index_dir> <queries_file> [num_terms]")
+        sys.exit(1)
+
+    num_terms = int(sys.argv[3]) if len(sys.argv) == 4 else 10
+    main(sys.argv[1], sys.argv[2], num_terms)
@@ -0,0 +1,94 @@
+"""
+Measures parse throughput in documents/s and MB/s of the streaming TREC parser
+(trec_parser.py) against the line-by-line reader it replaced, which built every
+document by string concatenation and searched it once per extracted field.
+The streaming parser is timed with the input read on the calling thread and
+with the reader thread that decompresses ahead of it. Checks that both parsers
+return the same DOCNO, HEADLINE, TEXT, GRAPHIC and raw document for every
+document.
+
+Usage:
+    python bench_parser.py <path_to_gz_file>
+"""
+
+import gzip
+import sys
+import time
+from trec_parser import TrecDocument, extract, parse_file
+
+
+def read_documents(input_gz):
+    with gzip.open(input_gz, "rt") as f:
+        doc = ""
+        within = False
+        for line in f:
+            if "<DOC>" in line:
+                within = True
+                doc = line
+            elif "</DOC>" in line:
+                doc += line
+                yield doc
+                doc = ""
+                within = False
+            elif within:
+                doc += line
+
+
+def parse_line_by_line(input_gz):
+    for doc in read_documents(input_gz):
+        # the indexer extracted HEADLINE twice, for the metadata and the text
+        extract(doc, "HEADLINE")
+        yield TrecDocument(
+            extract(doc, "DOCNO"),
+            extract(doc, "HEADLINE"),
+            extract(doc, "TEXT"),
+            extract(doc, "GRAPHIC"),
+            doc,
+        )
+
+
+def parse_unthreaded(input_gz):
+    return parse_file(input_gz, threaded=False)
+
+
+def time_parser(fn, input_gz):
+    # documents are dropped as they are produced, as the indexer does
+    start = time.perf_counter()
+    num_docs = 0
+    num_bytes = 0
+    for doc in fn(input_gz):
+        num_docs += 1
+        num_bytes += len(doc.raw)
+    return time.perf_counter() - start, num_docs, num_bytes
+
+
+def main(input_gz):
+    mismatches = 0
+    for expected, doc in zip(parse_line_by_line(input_gz), parse_file(input_gz)):
+        if expected != doc:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch in {expected.docno}")
+
+    print(f"{'parser':<14}{'seconds':>10}{'docs/s':>12}{'MB/s':>10}")
+    baseline = None
+    for name, fn in (
+        ("line-by-line", parse_line_by_line),
+        ("streaming", parse_unthreaded),
+        ("reader thread", parse_file),
+    ):
+        elapsed, num_docs, num_bytes = time_parser(fn, input_gz)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<14}{elapsed:>10.2f}{num_docs / elapsed:>12.0f}"
+            f"{num_bytes / elapsed / 1e6:>10.1f}   x{baseline / elapsed:.2f}"
+        )
+    print(f"{mismatches} mismatching documents")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python bench_parser.py <path_to_gz_file>")
+        sys.exit(1)
+
+    main(sys.argv[1])
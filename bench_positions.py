@@ -0,0 +1,144 @@
+"""
+Measures what the positional index (IndexEngine --positions) costs and what it
+buys:
+
+- the build time and the size of the index files of a build without and with
+  positions
+- the mean latency of phrase and proximity queries on both indexes: the
+  positional index checks the positions of the candidates (proximity.py), the
+  other one the tokens of the candidate documents in the document store
+
+Phrases are the pairs of adjacent words of every query and runs of two to four
+adjacent tokens of random documents; every phrase is also run as "..."~k.
+Checks that both indexes return the same documents.
+
+Usage:
+    python bench_positions.py <path_to_gz_file> <queries_file> [phrases] [k]
+
+Arguments:
+    [phrases]: number of random document phrases (default: 200)
+    [k]: proximity of the "..."~k queries (default: 5)
+"""
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from BooleanAND import read_queries
+from boolean_query import BooleanQueryEngine
+from IndexEngine import analyze
+from segments import open_index
+from trec_parser import parse_document
+
+SEED = 42
+
+INDEX_FILES = ["postings.bin", "terms.bin", "positions.bin", "positions.idx"]
+
+
+def build(input_gz, output_dir, positions):
+    command = [sys.executable, "IndexEngine.py", input_gz, output_dir]
+    if positions:
+        command.append("--positions")
+    start = time.perf_counter()
+    subprocess.run(
+        command,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return time.perf_counter() - start
+
+
+def file_sizes(index_dir):
+    return {
+        name: os.path.getsize(os.path.join(index_dir, name))
+        for name in INDEX_FILES
+        if os.path.exists(os.path.join(index_dir, name))
+    }
+
+
+def query_phrases(queries_file):
+    phrases = []
+    for _, query in read_queries(queries_file):
+        words = query.split()
+        phrases.extend(f'"{a} {b}"' for a, b in zip(words, words[1:]))
+    return phrases
+
+
+def document_phrases(engine, num_phrases, rng):
+    docs = engine.all_docs()
+    phrases = []
+    while len(phrases) < num_phrases:
+        raw = engine.doc_store.get(rng.choice(docs))
+        _, _, tokens = analyze(parse_document(raw.encode("utf-8")))
+        length = rng.randint(2, 4)
+        if len(tokens) > length:
+            i = rng.randrange(len(tokens) - length)
+            phrases.append('"' + " ".join(tokens[i : i + length]) + '"')
+    return phrases
+
+
+def time_queries(engine, queries):
+    start = time.perf_counter()
+    results = [engine.search(query) for query in queries]
+    return time.perf_counter() - start, results
+
+
+def main(input_gz, queries_file, num_phrases, k):
+    input_gz = os.path.abspath(input_gz)
+    with tempfile.TemporaryDirectory() as tmp:
+        engines = {}
+        base_time = base_size = None
+        for name, positions in (("plain", False), ("positional", True)):
+            index_dir = os.path.join(tmp, name)
+            elapsed = build(input_gz, index_dir, positions)
+            sizes = file_sizes(index_dir)
+            size = sum(sizes.values())
+            base_time = base_time or elapsed
+            base_size = base_size or size
+            print(
+                f"{name:<11} index {elapsed:7.1f} s ({elapsed / base_time - 1:+.1%})"
+                f"   {size / 2**20:8.1f} MB ({size / base_size - 1:+.1%})   "
+                + ", ".join(f"{file} {sizes[file] / 2**20:.1f} MB" for file in sizes)
+            )
+            engines[name] = BooleanQueryEngine(open_index(index_dir))
+
+        rng = random.Random(SEED)
+        phrase_sets = {
+            "query phrases": query_phrases(queries_file),
+            "document phrases": document_phrases(engines["plain"], num_phrases, rng),
+        }
+        print(
+            f"{'query set':<24}{'queries':>8}{'results':>9}{'documents ms':>14}"
+            f"{'positions ms':>14}{'speedup':>9}"
+        )
+        mismatches = 0
+        for name, phrases in phrase_sets.items():
+            for suffix in ("", f"~{k}"):
+                queries = [phrase + suffix for phrase in phrases]
+                plain, expected = time_queries(engines["plain"], queries)
+                positional, results = time_queries(engines["positional"], queries)
+                mismatches += sum(a != b for a, b in zip(expected, results))
+                mean_results = sum(len(docs) for docs in results) / len(results)
+                print(
+                    f"{name + suffix:<24}{len(queries):>8}{mean_results:>9.1f}"
+                    f"{plain / len(queries) * 1000:>14.2f}"
+                    f"{positional / len(queries) * 1000:>14.2f}"
+                    f"{plain / positional:>8.2f}x"
+                )
+        print(f"{mismatches} queries differ between the two indexes")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4, 5):
+        print(
+            "Usage: python bench_positions.py <path_to_gz_file> <queries_file> "
+            "[phrases] [k]"
+        )
+        sys.exit(1)
+
+    num_phrases = int(sys.argv[3]) if len(sys.argv) >= 4 else 200
+    k = int(sys.argv[4]) if len(sys.argv) == 5 else 5
+    main(sys.argv[1], sys.argv[2], num_phrases, k)
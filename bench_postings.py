@@ -0,0 +1,71 @@
+"""
+Compares the size and decode throughput of the postings formats: the old
+inverted-index.json, the uncompressed "raw" binary codec and the block-packed
+codec (see postings_codec.py). Every postings list of an existing binary index is
+re-encoded in each format and then decoded back in full.
+
+Usage:
+    python bench_postings.py <index_dir>
+"""
+
+import json
+import sys
+import time
+from binary_index import BinaryIndex
+from postings_codec import decode_blocks, encode_postings
+
+
+def decode_all(encoded, codec):
+    count = 0
+    for data, df in encoded:
+        for doc_ids, _ in decode_blocks(data, 0, df, codec):
+            count += len(doc_ids)
+    return count
+
+
+def decode_all_json(encoded):
+    count = 0
+    for data in encoded:
+        count += len(json.loads(data))
+    return count
+
+
+def main(index_dir):
+    index = BinaryIndex(index_dir)
+    lists = [index.postings(term) for term, _ in index.items()]
+    num_postings = sum(len(doc_ids) for doc_ids, _ in lists)
+    print(f"{len(lists)} terms, {num_postings} postings")
+    print(f"{'format':<8} {'size (MB)':>10} {'bytes/post':>10} {'M posts/s':>10}")
+
+    encoded_json = [json.dumps(list(zip(*plist))) for plist in lists]
+    size = sum(len(data) for data in encoded_json)
+    start = time.perf_counter()
+    decode_all_json(encoded_json)
+    elapsed = time.perf_counter() - start
+    report("json", size, num_postings, elapsed)
+
+    for codec in ("raw", "packed"):
+        encoded = [
+            (encode_postings(doc_ids, freqs, codec), len(doc_ids))
+            for doc_ids, freqs in lists
+        ]
+        size = sum(len(data) for data, _ in encoded)
+        start = time.perf_counter()
+        decode_all(encoded, codec)
+        elapsed = time.perf_counter() - start
+        report(codec, size, num_postings, elapsed)
+
+
+def report(name, size, num_postings, elapsed):
+    print(
+        f"{name:<8} {size / 1e6:>10.2f} {size / num_postings:>10.2f} "
+        f"{num_postings / elapsed / 1e6:>10.2f}"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python bench_postings.py <index_dir>")
+        sys.exit(1)
+
+    main(sys.argv[1])
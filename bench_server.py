@@ -0,0 +1,104 @@
+"""
+Load generator for search_server.py: a number of client threads send /search
+requests for the queries of a TREC topics file as fast as the server answers
+them, and the throughput, the latency percentiles and the count of every
+response status are reported.
+
+Usage:
+    python bench_server.py <server_url> <queries_file> [clients] [requests]
+
+Arguments:
+    <server_url>: e.g. http://127.0.0.1:8080
+    [clients]: number of concurrent clients (default: 8)
+    [requests]: total number of requests (default: 500)
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from bench_topk import percentile
+from bm25 import load_queries
+
+# the server answers with 503/504 well before this
+CLIENT_TIMEOUT = 60
+
+
+def fetch(url):
+    """Return the status of a GET request to url."""
+    try:
+        with urlopen(url, timeout=CLIENT_TIMEOUT) as response:
+            json.load(response)
+            return response.status
+    except HTTPError as e:
+        return e.code
+    except (URLError, OSError):
+        return "connection error"
+
+
+def client(urls, latencies, statuses, lock):
+    for url in urls:
+        start = time.perf_counter()
+        status = fetch(url)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+
+def main(server_url, queries_file, num_clients, num_requests):
+    queries = list(load_queries(queries_file).values())
+    urls = [
+        f"{server_url}/search?{urlencode({'q': queries[i % len(queries)]})}"
+        for i in range(num_requests)
+    ]
+
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    # every client sends every num_clients-th request
+    clients = [
+        threading.Thread(
+            target=client, args=(urls[i::num_clients], latencies, statuses, lock)
+        )
+        for i in range(num_clients)
+    ]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{num_requests} requests, {num_clients} clients, {elapsed:.2f} s")
+    print(f"throughput {num_requests / elapsed:8.1f} requests/s")
+    print(
+        f"latency    p50 {percentile(latencies, 50) * 1000:8.2f} ms"
+        f"   p95 {percentile(latencies, 95) * 1000:8.2f} ms"
+        f"   p99 {percentile(latencies, 99) * 1000:8.2f} ms"
+        f"   max {max(latencies) * 1000:8.2f} ms"
+    )
+    print(
+        "statuses   "
+        + "   ".join(
+            f"{status}: {count}"
+            for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))
+        )
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4, 5):
+        print(
+            "Usage: python bench_server.py <server_url> <queries_file> "
+            "[clients] [requests]"
+        )
+        sys.exit(1)
+
+    num_clients = int(sys.argv[3]) if len(sys.argv) >= 4 else 8
+    num_requests = int(sys.argv[4]) if len(sys.argv) == 5 else 500
+    main(sys.argv[1].rstrip("/"), sys.argv[2], num_clients, num_requests)
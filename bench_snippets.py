@@ -0,0 +1,109 @@
+"""
+Compares the single-scan snippet scorer (query_biased_summary.py) against the
+per-sentence scorer it replaced, sentence_score over a list of query tokens,
+on short and long queries and on documents of the index and long documents
+made of the TEXT of several of them. The scan is timed on the raw documents
+and on their precomputed sentences (IndexEngine --sentences); the sentences
+are split and tokenized outside the timing. Checks that all three return the
+same snippet and reports the mean time per document.
+
+Queries are random tokens of random documents, like a pasted paragraph.
+
+Usage:
+    python bench_snippets.py <index_dir> [docs] [long_docs]
+
+Arguments:
+    [docs]: number of random documents of every set (default: 200)
+    [long_docs]: number of documents joined into a long document (default: 20)
+"""
+
+import random
+import sys
+import time
+from query_biased_summary import (
+    extract_text_tag,
+    generate_query_biased_snippet,
+    sentence_score,
+    split_sentences,
+    stored_snippet,
+)
+from segments import open_doc_store
+from sentence_store import DocumentSentences, sentence_record
+from tokenizer import Tokenize
+
+SEED = 42
+
+QUERY_LENGTHS = [5, 50, 500]
+
+
+def reference_snippet(doc_text, query_tokens):
+    query_tokens = list(query_tokens)
+    best_score = 0
+    best = "No relevant content found."
+    for sentence in split_sentences(doc_text):
+        sentence_tokens = []
+        Tokenize(sentence, sentence_tokens)
+        score = sentence_score(sentence_tokens, query_tokens)
+        if score > best_score:
+            best_score, best = score, sentence
+    return best
+
+
+def document_sets(doc_store, num_docs, long_docs, rng):
+    docs = [doc_store.get(doc_id) for doc_id in range(len(doc_store))]
+    docs = [doc for doc in docs if doc is not None and extract_text_tag(doc)]
+    long = []
+    for _ in range(num_docs):
+        texts = [extract_text_tag(doc) for doc in rng.sample(docs, long_docs)]
+        long.append("<TEXT>" + " ".join(texts) + "</TEXT>")
+    return {"documents": rng.sample(docs, num_docs), f"{long_docs} documents": long}
+
+
+def random_query(docs, length, rng):
+    tokens = []
+    while len(tokens) < length:
+        Tokenize(rng.choice(docs), tokens)
+    return rng.sample(tokens, length)
+
+
+def time_snippets(snippet, docs, queries):
+    start = time.perf_counter()
+    results = [snippet(doc, query) for doc, query in zip(docs, queries)]
+    return time.perf_counter() - start, results
+
+
+def main(index_dir, num_docs, long_docs):
+    rng = random.Random(SEED)
+    doc_sets = document_sets(open_doc_store(index_dir), num_docs, long_docs, rng)
+
+    print(
+        f"{'documents':<16}{'query':>7}{'reference ms':>14}{'scan ms':>10}"
+        f"{'speedup':>9}{'stored ms':>11}{'speedup':>9}"
+    )
+    mismatches = 0
+    for name, docs in doc_sets.items():
+        sentences = [DocumentSentences(sentence_record(doc)) for doc in docs]
+        for length in QUERY_LENGTHS:
+            queries = [random_query(docs, length, rng) for _ in docs]
+            reference, expected = time_snippets(reference_snippet, docs, queries)
+            scan, results = time_snippets(generate_query_biased_snippet, docs, queries)
+            stored, stored_results = time_snippets(stored_snippet, sentences, queries)
+            mismatches += sum(a != b for a, b in zip(expected, results))
+            mismatches += sum(a != b for a, b in zip(expected, stored_results))
+            print(
+                f"{name:<16}{length:>7}"
+                f"{reference / len(docs) * 1000:>14.2f}"
+                f"{scan / len(docs) * 1000:>10.2f}{reference / scan:>8.2f}x"
+                f"{stored / len(docs) * 1000:>11.3f}{reference / stored:>8.1f}x"
+            )
+    print(f"{mismatches} snippets differ from the reference")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python bench_snippets.py <index_dir> [docs] [long_docs]")
+        sys.exit(1)
+
+    num_docs = int(sys.argv[2]) if len(sys.argv) >= 3 else 200
+    long_docs = int(sys.argv[3]) if len(sys.argv) == 4 else 20
+    main(sys.argv[1], num_docs, long_docs)
@@ -0,0 +1,107 @@
+"""
+Measures what Porter stemming (stemmer.py) costs and what it changes:
+
+- stemming throughput on the tokens of the first documents of the collection,
+  uncached PorterStemmer against the LRU-cached stem_tokens, with the cache's
+  hit rate
+- the time of a full unstemmed and a stemmed IndexEngine build
+- MAP and P@10 of the BM25 runs of both indexes, as computed by evaluate.py
+
+Usage:
+    python bench_stemming.py <path_to_gz_file> <queries_file> <qrels_file> [num_docs]
+
+Arguments:
+    [num_docs]: documents used for the stemming throughput (default: 10000)
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from bench_impacts import evaluate_run
+from binary_index import BinaryIndex
+from bm25 import calculate_bm25, load_queries
+from evaluate import read_qrels
+from IndexEngine import analyze
+from porterstemmer import PorterStemmer
+from stemmer import stem, stem_tokens
+from trec_parser import parse_file
+
+
+def stemming_throughput(input_gz, num_docs):
+    docs = [analyze(doc)[2] for doc in islice(parse_file(input_gz), num_docs)]
+    num_tokens = sum(len(tokens) for tokens in docs)
+
+    stemmer = PorterStemmer()
+    start = time.perf_counter()
+    for tokens in docs:
+        [stemmer.stem(token, 0, len(token) - 1) for token in tokens]
+    uncached = time.perf_counter() - start
+
+    stem.cache_clear()
+    start = time.perf_counter()
+    for tokens in docs:
+        stem_tokens(tokens)
+    cached = time.perf_counter() - start
+
+    info = stem.cache_info()
+    print(f"{len(docs)} documents, {num_tokens} tokens")
+    print(f"uncached  {num_tokens / uncached / 1e6:8.2f} M tokens/s")
+    print(
+        f"cached    {num_tokens / cached / 1e6:8.2f} M tokens/s   "
+        f"{info.hits / (info.hits + info.misses):.1%} hits, "
+        f"{info.currsize} types cached"
+    )
+
+
+def build(input_gz, output_dir, stem_flag):
+    command = [sys.executable, "IndexEngine.py", input_gz, output_dir]
+    if stem_flag:
+        command.append("--stem")
+    start = time.perf_counter()
+    subprocess.run(command, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start
+
+
+def evaluate_index(index_dir, queries, qrels):
+    index = BinaryIndex(index_dir)
+    with open(os.path.join(index_dir, "docno_list.txt"), "r") as f:
+        docno_list = [line.strip() for line in f.readlines()]
+    results = calculate_bm25(
+        queries, index, index.doc_lengths, docno_list, index.avg_doc_length
+    )
+    results = {int(topic_id): ranked for topic_id, ranked in results.items()}
+    return evaluate_run(qrels, results, docno_list, "bm25"), index.num_terms
+
+
+def main(input_gz, queries_file, qrels_file, num_docs):
+    input_gz = os.path.abspath(input_gz)
+    stemming_throughput(input_gz, num_docs)
+
+    queries = load_queries(queries_file)
+    qrels = read_qrels(qrels_file)
+    with tempfile.TemporaryDirectory() as tmp:
+        base_time = None
+        for name, stem_flag in (("unstemmed", False), ("stemmed", True)):
+            index_dir = os.path.join(tmp, name)
+            elapsed = build(input_gz, index_dir, stem_flag)
+            base_time = base_time or elapsed
+            (mean_map, mean_p10), num_terms = evaluate_index(index_dir, queries, qrels)
+            print(
+                f"{name:<10} index {elapsed:7.1f} s ({elapsed / base_time - 1:+.1%})   "
+                f"{num_terms} terms   MAP {mean_map:.4f}   P@10 {mean_p10:.4f}"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print(
+            "Usage: python bench_stemming.py <path_to_gz_file> <queries_file> "
+            "<qrels_file> [num_docs]"
+        )
+        sys.exit(1)
+
+    num_docs = int(sys.argv[4]) if len(sys.argv) == 5 else 10000
+    main(sys.argv[1], sys.argv[2], sys.argv[3], num_docs)
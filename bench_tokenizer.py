@@ -0,0 +1,71 @@
+"""
+Measures tokenizer throughput in MB/s on the indexed text (TEXT, HEADLINE and
+GRAPHIC) of every document of a collection: the per-character reference loop
+against the regex tokenizer and its generator variant (tokenizer.py). Checks
+that all of them return the same tokens for every document.
+
+Usage:
+    python bench_tokenizer.py <path_to_gz_file>
+"""
+
+import sys
+import time
+from tokenizer import iter_tokens, iter_tokens_per_char, tokenize
+from trec_parser import parse_file
+
+
+def document_texts(input_gz):
+    return [
+        doc.text + " " + doc.headline + " " + doc.graphic
+        for doc in parse_file(input_gz)
+    ]
+
+
+def time_tokenizer(fn, texts):
+    # the tokens are dropped as they are produced, as the indexer does
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return time.perf_counter() - start
+
+
+def main(input_gz):
+    texts = document_texts(input_gz)
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+    non_ascii = sum(1 for text in texts if not text.isascii())
+    print(
+        f"{len(texts)} documents, {megabytes:.1f} MB of text, "
+        f"{non_ascii} with non-ASCII characters"
+    )
+
+    tokenizers = [
+        ("per-char", lambda text: list(iter_tokens_per_char(text))),
+        ("fast", tokenize),
+        ("generator", lambda text: list(iter_tokens(text))),
+        ("gen 1 KB", lambda text: list(iter_tokens(text, 1024))),
+    ]
+    reference_time = None
+    for name, fn in tokenizers:
+        elapsed = time_tokenizer(fn, texts)
+        reference_time = reference_time or elapsed
+        print(
+            f"{name:<10} {elapsed:8.2f} s {megabytes / elapsed:8.1f} MB/s "
+            f"{reference_time / elapsed:6.1f}x"
+        )
+
+    mismatches = 0
+    for text in texts:
+        reference = tokenizers[0][1](text)
+        if any(fn(text) != reference for _, fn in tokenizers[1:]):
+            mismatches += 1
+    print(f"documents with different tokens: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python bench_tokenizer.py <path_to_gz_file>")
+        sys.exit(1)
+
+    main(sys.argv[1])
@@ -0,0 +1,74 @@
+"""
+Measures per-query BM25 latency of the exhaustive evaluator (compute_bm25 and a
+full sort) against Block-Max WAND top-k retrieval (wand.py) on a TREC topics
+file, checks that both return the same ranking, and reports p50/p99 latencies.
+
+Usage:
+    python bench_topk.py <index_dir> <queries_file> [k]
+"""
+
+import sys
+import time
+from bm25 import Tokenize, compute_bm25, load_queries, query_terms
+from segments import open_index
+from wand import top_k_bm25
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def report(name, latencies):
+    print(
+        f"{name:<12} p50 {percentile(latencies, 50) * 1000:8.2f} ms"
+        f"   p99 {percentile(latencies, 99) * 1000:8.2f} ms"
+        f"   mean {sum(latencies) / len(latencies) * 1000:8.2f} ms"
+    )
+
+
+def main(index_dir, queries_file, k):
+    index = open_index(index_dir)
+    doc_lengths = index.doc_lengths
+    avg_doc_length = index.avg_doc_length
+    with open(f"{index_dir}/docno_list.txt", "r") as f:
+        docno_list = [line.strip() for line in f.readlines()]
+    queries = load_queries(queries_file)
+
+    exhaustive, wand = [], []
+    mismatches = 0
+    for query_text in queries.values():
+        query_tokens = []
+        Tokenize(query_text, query_tokens)
+        query_tokens = query_terms(query_tokens, index)
+
+        start = time.perf_counter()
+        scores = compute_bm25(
+            query_tokens, doc_lengths, avg_doc_length, index, index.total_docs
+        )
+        expected = sorted(scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+        expected = expected[:k]
+        exhaustive.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ranked = top_k_bm25(
+            query_tokens, index, doc_lengths, docno_list, avg_doc_length, k
+        )
+        wand.append(time.perf_counter() - start)
+
+        if ranked != expected:
+            mismatches += 1
+
+    print(f"{len(queries)} queries, k={k}")
+    report("exhaustive", exhaustive)
+    report("block-max", wand)
+    print(f"rankings that differ: {mismatches}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python bench_topk.py <index_dir> <queries_file> [k]")
+        sys.exit(1)
+
+    k = int(sys.argv[3]) if len(sys.argv) == 4 else 1000
+    main(sys.argv[1], sys.argv[2], k)
@@ -0,0 +1,286 @@
+"""
+Binary, memory-mapped inverted index written by IndexEngine.
+
+Instead of one large inverted-index.json that has to be parsed before the first
+query, the index is split into a few flat files that are opened with mmap, so a
+query only touches the dictionary entries and postings lists of its own terms:
+
+    terms.bin        fixed-width term dictionary, one record per term, sorted by term
+    terms.str        the term strings referenced by terms.bin
+    postings.bin     postings lists, one after another in term id order
+    doc-lengths.bin  document lengths as an array of unsigned 32-bit ints
+    index-meta.json  collection statistics (number of docs, total length, ...)
+    deleted.bin      optional bitmap of deleted doc ids (tombstones, see tombstones.py)
+    positions.bin    optional positions lists, one after another in term id order
+    positions.idx    offset and size of the positions list of every term id
+
+A term record holds the offset/length of the term string, the term id, the
+document frequency and the offset/size of the term's postings list. Postings
+lists are compressed block by block (see postings_codec.py); the codec used is
+recorded in index-meta.json. The positions files are only written for a
+positional index (IndexEngine --positions), see proximity.py.
+
+Usage (convert an index built before the binary format existed):
+    python binary_index.py <index_dir>
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from contextlib import nullcontext
+from postings_codec import decode_blocks, encode_positions, encode_postings
+
+TERMS_FILE = "terms.bin"
+TERM_STRINGS_FILE = "terms.str"
+POSTINGS_FILE = "postings.bin"
+DOC_LENGTHS_FILE = "doc-lengths.bin"
+META_FILE = "index-meta.json"
+DELETED_FILE = "deleted.bin"
+POSITIONS_FILE = "positions.bin"
+POSITIONS_INDEX_FILE = "positions.idx"
+
+# string offset, string length, term id, df, postings offset, postings size
+TERM_RECORD = struct.Struct("<QIIIQQ")
+
+
+def write_index(
+    output_dir,
+    lexicon,
+    postings_lists,
+    doc_lengths,
+    codec="packed",
+    deleted=frozenset(),
+    stemmed=False,
+    positional=False,
+):
+    """Write the binary index files.
+
+    postings_lists yields (tid, doc_ids, freqs) in increasing tid order, or
+    (tid, doc_ids, freqs, positions) if positional, with the positions of every
+    posting one after another. Doc ids in deleted have been purged from the
+    postings and don't count towards the collection statistics. stemmed records
+    that the terms are Porter stems.
+    """
+    entries = {}
+    position_entries = {}
+    offset = 0
+    positions_offset = 0
+    positions_file = os.path.join(output_dir, POSITIONS_FILE)
+    with open(os.path.join(output_dir, POSTINGS_FILE), "wb") as f, (
+        open(positions_file, "wb") if positional else nullcontext()
+    ) as positions_out:
+        for tid, doc_ids, freqs, *positions in postings_lists:
+            data = encode_postings(doc_ids, freqs, codec, doc_lengths)
+            f.write(data)
+            entries[tid] = (len(doc_ids), offset, len(data))
+            offset += len(data)
+            if positional:
+                data = encode_positions(freqs, positions[0])
+                positions_out.write(data)
+                position_entries[tid] = (positions_offset, len(data))
+                positions_offset += len(data)
+
+    if positional:
+        positions_index = array("Q")
+        for tid in range(max(lexicon.values(), default=-1) + 1):
+            positions_index.extend(position_entries.get(tid, (0, 0)))
+        with open(os.path.join(output_dir, POSITIONS_INDEX_FILE), "wb") as f:
+            positions_index.tofile(f)
+
+    str_offset = 0
+    with open(os.path.join(output_dir, TERMS_FILE), "wb") as terms_out, open(
+        os.path.join(output_dir, TERM_STRINGS_FILE), "wb"
+    ) as strings_out:
+        for term in sorted(lexicon, key=lambda t: t.encode("utf-8")):
+            tid = lexicon[term]
+            df, postings_offset, size = entries.get(tid, (0, 0, 0))
+            encoded = term.encode("utf-8")
+            strings_out.write(encoded)
+            terms_out.write(
+                TERM_RECORD.pack(
+                    str_offset, len(encoded), tid, df, postings_offset, size
+                )
+            )
+            str_offset += len(encoded)
+
+    with open(os.path.join(output_dir, DOC_LENGTHS_FILE), "wb") as f:
+        array("I", doc_lengths).tofile(f)
+
+    meta = {
+        "num_docs": len(doc_lengths),
+        "total_length": sum(
+            length for doc_id, length in enumerate(doc_lengths) if doc_id not in deleted
+        ),
+        "num_terms": len(lexicon),
+        "codec": codec,
+        "block_max": codec == "packed",
+    }
+    if deleted:
+        meta["deleted_docs"] = len(deleted)
+    if stemmed:
+        meta["stemmed"] = True
+    if positional:
+        meta["positions"] = True
+    with open(os.path.join(output_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+def read_deleted(index_dir):
+    """Return the set of deleted doc ids recorded in index_dir."""
+    path = os.path.join(index_dir, DELETED_FILE)
+    if not os.path.exists(path):
+        return frozenset()
+    with open(path, "rb") as f:
+        bitmap = f.read()
+    return frozenset(
+        8 * i + bit
+        for i, byte in enumerate(bitmap)
+        if byte
+        for bit in range(8)
+        if byte >> bit & 1
+    )
+
+
+def write_deleted(index_dir, deleted):
+    bitmap = bytearray(max(deleted) // 8 + 1 if deleted else 0)
+    for doc_id in deleted:
+        bitmap[doc_id >> 3] |= 1 << (doc_id & 7)
+    path = os.path.join(index_dir, DELETED_FILE)
+    with open(path + ".tmp", "wb") as f:
+        f.write(bitmap)
+    os.replace(path + ".tmp", path)
+
+
+def open_mmap(path):
+    # mmap refuses empty files, e.g. the postings of an empty collection
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BinaryIndex:
+    """Read-only view of an index directory written by write_index."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.terms = open_mmap(os.path.join(index_dir, TERMS_FILE))
+        self.strings = open_mmap(os.path.join(index_dir, TERM_STRINGS_FILE))
+        self.postings_data = open_mmap(os.path.join(index_dir, POSTINGS_FILE))
+        self.num_terms = len(self.terms) // TERM_RECORD.size
+        # indexes written before compression was added store raw postings
+        self.codec = self.meta.get("codec", "raw")
+        self.block_max = self.meta.get("block_max", False)
+        self.stemmed = self.meta.get("stemmed", False)
+        self.positional = self.meta.get("positions", False)
+        if self.positional:
+            self.positions_data = open_mmap(os.path.join(index_dir, POSITIONS_FILE))
+            self.positions_index = array("Q")
+            with open(os.path.join(index_dir, POSITIONS_INDEX_FILE), "rb") as f:
+                self.positions_index.frombytes(f.read())
+        # doc ids of purged documents stay allocated but are not counted
+        self.total_docs = self.meta["num_docs"] - self.meta.get("deleted_docs", 0)
+        self.avg_doc_length = (
+            self.meta["total_length"] / self.total_docs if self.total_docs else 0.0
+        )
+        self._doc_lengths = None
+        self.deleted = read_deleted(index_dir)
+        # (base doc id, index) pairs, the same as SegmentedIndex in segments.py
+        self.segments = [(0, self)]
+
+    @property
+    def doc_lengths(self):
+        if self._doc_lengths is None:
+            lengths = array("I")
+            with open(os.path.join(self.index_dir, DOC_LENGTHS_FILE), "rb") as f:
+                lengths.frombytes(f.read())
+            self._doc_lengths = lengths
+        return self._doc_lengths
+
+    def _record(self, i):
+        return TERM_RECORD.unpack_from(self.terms, i * TERM_RECORD.size)
+
+    def _term_at(self, i):
+        str_offset, str_len = struct.unpack_from(
+            "<QI", self.terms, i * TERM_RECORD.size
+        )
+        return self.strings[str_offset : str_offset + str_len]
+
+    def lookup(self, term):
+        """Return the term record (see TERM_RECORD) or None by binary search."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._term_at(lo) == key:
+            return self._record(lo)
+        return None
+
+    def items(self):
+        """Yield (term, record) for every term, in term order."""
+        for i in range(self.num_terms):
+            yield self._term_at(i).decode("utf-8"), self._record(i)
+
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+
+    def term_id(self, term):
+        record = self.lookup(term)
+        return record[2] if record else None
+
+    def doc_freq(self, term):
+        record = self.lookup(term)
+        return record[3] if record else 0
+
+    def blocks(self, term):
+        """Yield the postings of term as (doc_ids, freqs), one block at a time."""
+        record = self.lookup(term)
+        if record is None:
+            return iter(())
+        _, _, _, df, offset, _ = record
+        return decode_blocks(self.postings_data, offset, df, self.codec, self.block_max)
+
+    def positions_offset(self, record):
+        """Return the offset of the positions list of a term record."""
+        return self.positions_index[2 * record[2]]
+
+    def postings(self, term):
+        """Return (doc_ids, freqs) arrays for term, both empty if unknown."""
+        doc_ids, freqs = array("I"), array("I")
+        for block_docs, block_freqs in self.blocks(term):
+            doc_ids.extend(block_docs)
+            freqs.extend(block_freqs)
+        return doc_ids, freqs
+
+
+def convert_json_index(index_dir):
+    with open(os.path.join(index_dir, "inverted-index.json"), "r") as f:
+        inv_index = json.load(f)
+    with open(os.path.join(index_dir, "lexicon.json"), "r") as f:
+        lexicon = json.load(f)
+    with open(os.path.join(index_dir, "doc-lengths.txt"), "r") as f:
+        doc_lengths = [int(line.strip()) for line in f]
+
+    def postings_lists():
+        for tid in sorted(int(key) for key in inv_index):
+            plist = inv_index[str(tid)]
+            yield tid, [doc_id for doc_id, _ in plist], [freq for _, freq in plist]
+
+    write_index(index_dir, lexicon, postings_lists(), doc_lengths)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python binary_index.py <index_dir>")
+        sys.exit(1)
+
+    convert_json_index(sys.argv[1])
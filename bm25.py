@@ -1,60 +1,71 @@
 import math
 from collections import defaultdict
-from IndexEngine import Tokenize
+from stemmer import stem_tokens
+from tokenizer import Tokenize
+
+K1 = 1.2
+B = 0.75
 
 
 def calculate_average_doc_length(doc_lengths):
     return sum(doc_lengths) / len(doc_lengths)
 
 
-def compute_bm25(
-    query_tokens, doc_lengths, avg_doc_length, lexicon, inverted_index, total_docs
-):
-    K1 = 1.2
-    B = 0.75
-    scores = defaultdict(float)
+def bm25_idf(total_docs, doc_freq):
+    return math.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
 
-    for term in query_tokens:
-        if term not in lexicon:
-            continue
 
-        term_id = lexicon[term]
-        postings = inverted_index.get(str(term_id), [])
-        doc_freq = len(postings)
+def bm25_term_score(freq, doc_length, avg_doc_length, idf):
+    # same arithmetic as the posting loop of compute_bm25, so that scores
+    # computed by other evaluators compare equal
+    K = K1 * ((1 - B) + B * (doc_length / avg_doc_length))
+    return idf * ((freq * (K1 + 1)) / (freq + K))
 
-        for doc_id, freq in postings:
-            doc_length = doc_lengths[int(doc_id)]
-            K = K1 * ((1 - B) + B * (doc_length / avg_doc_length))
 
-            idf = math.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
-            term_score = idf * ((freq * (K1 + 1)) / (freq + K))
+def query_terms(query_tokens, index):
+    """Return the query tokens as index terms, stemmed if the index is."""
+    return stem_tokens(query_tokens) if index.stemmed else query_tokens
 
-            scores[doc_id] += term_score
+
+def compute_bm25(query_tokens, doc_lengths, avg_doc_length, index, total_docs):
+    scores = defaultdict(float)
+    deleted = index.deleted
+
+    for term in query_tokens:
+        doc_freq = index.doc_freq(term)
+        idf = bm25_idf(total_docs, doc_freq)
+
+        for doc_ids, freqs in index.blocks(term):
+            for doc_id, freq in zip(doc_ids, freqs):
+                if doc_id in deleted:
+                    continue
+                doc_length = doc_lengths[doc_id]
+                K = K1 * ((1 - B) + B * (doc_length / avg_doc_length))
+                term_score = idf * ((freq * (K1 + 1)) / (freq + K))
+
+                scores[doc_id] += term_score
 
     return scores
 
 
-def calculate_bm25(
-    queries, inverted_index, lexicon, doc_lengths, docno_list, avg_doc_length
-):
+def calculate_bm25(queries, index, doc_lengths, docno_list, avg_doc_length):
     results = defaultdict(list)
-    total_docs = len(doc_lengths)
+    total_docs = index.total_docs
 
     for query_id, query_text in queries.items():
         query_tokens = []
         Tokenize(query_text, query_tokens)
 
         doc_scores = compute_bm25(
-            query_tokens,
+            query_terms(query_tokens, index),
             doc_lengths,
             avg_doc_length,
-            lexicon,
-            inverted_index,
+            index,
             total_docs,
         )
 
         ranked_docs = sorted(
-            doc_scores.items(), key=lambda x: (-x[1], docno_list[int(x[0])])
+            doc_scores.items(), key=lambda x: (-x[1], docno_list[x[0]])
         )
         results[query_id] = ranked_docs[:1000]
 
@@ -70,3 +81,11 @@ def load_queries(file_path):
             query_text = lines[i + 1].strip()
             queries[query_id] = query_text
     return queries
+
+
+def write_run(output_file, results, docno_list, run_tag):
+    with open(output_file, "w") as f:
+        for query_id, ranked_docs in results.items():
+            for rank, (doc_id, score) in enumerate(ranked_docs, start=1):
+                docno = docno_list[doc_id]
+                f.write(f"{query_id} Q0 {docno} {rank} {score} {run_tag}\n")
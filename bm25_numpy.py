@@ -0,0 +1,126 @@
+"""
+NumPy-vectorized BM25 scoring over array-backed postings.
+
+A drop-in alternative to compute_bm25/calculate_bm25 (requires numpy). Postings
+lists are decoded into int32 doc id and frequency arrays (a whole packed list is
+decoded with one cumulative sum over its concatenated gaps), the term
+contributions of a whole list are computed in one vectorized expression with
+the same arithmetic as compute_bm25, and they are accumulated into a dense score
+array. The top k is chosen with argpartition and ties are broken by docno, so
+the ranking is the same as calculate_bm25's.
+"""
+
+from functools import lru_cache
+import numpy as np
+from bm25 import B, K1, Tokenize, bm25_idf, query_terms
+from postings_codec import BLOCK_SIZE, TYPECODES, read_skip_table
+
+DTYPES = {width: np.dtype(typecode) for width, typecode in TYPECODES.items()}
+
+
+class ArrayPostings:
+    """Decodes the postings of a BinaryIndex or SegmentedIndex into NumPy arrays."""
+
+    def __init__(self, index, cache_size=1024):
+        self.index = index
+        self.doc_lengths = np.array(index.doc_lengths, dtype=np.int32)
+        self.deleted = np.array(sorted(index.deleted), dtype=np.int64)
+        self.postings = lru_cache(maxsize=cache_size)(self._postings)
+
+    def _postings(self, term):
+        """Return (doc_ids, freqs) of term as int32 arrays, with global doc ids."""
+        doc_parts, freq_parts = [], []
+        for base, segment in self.index.segments:
+            record = segment.lookup(term)
+            if record is not None:
+                doc_ids, freqs = decode_postings(segment, record)
+                doc_parts.append(doc_ids + base if base else doc_ids)
+                freq_parts.append(freqs)
+        if not doc_parts:
+            return np.empty(0, np.int32), np.empty(0, np.int32)
+        if len(doc_parts) == 1:
+            return doc_parts[0], freq_parts[0]
+        return np.concatenate(doc_parts), np.concatenate(freq_parts)
+
+
+def decode_postings(index, record):
+    """Decode the postings list of a term record of a BinaryIndex."""
+    _, _, _, df, offset, _ = record
+    data = index.postings_data
+    if index.codec == "raw":
+        doc_ids = np.frombuffer(data, np.uint32, df, offset)
+        freqs = np.frombuffer(data, np.uint32, df, offset + 4 * df)
+        return doc_ids.astype(np.int32), freqs.astype(np.int32)
+
+    skip_table = read_skip_table(data, offset, df, index.block_max)
+    end_offsets = skip_table[1]
+    blocks_start = offset + 4 * len(end_offsets) * len(skip_table)
+    gaps = np.empty(df, np.int64)
+    freqs = np.empty(df, np.int32)
+    for i in range(len(end_offsets)):
+        pos = blocks_start + (end_offsets[i - 1] if i else 0)
+        first = i * BLOCK_SIZE
+        count = min(BLOCK_SIZE, df - first)
+        header = data[pos]
+        gap_dtype = DTYPES[header & 0x0F]
+        freq_dtype = DTYPES[header >> 4]
+        pos += 1
+        gaps[first : first + count] = np.frombuffer(data, gap_dtype, count, pos)
+        pos += count * gap_dtype.itemsize
+        freqs[first : first + count] = np.frombuffer(data, freq_dtype, count, pos)
+    # the first gap of every block continues from the previous block, so one
+    # cumulative sum restores all doc ids
+    return np.cumsum(gaps).astype(np.int32), freqs
+
+
+def compute_bm25_numpy(query_tokens, doc_lengths, avg_doc_length, postings, total_docs):
+    """Return a dense array of BM25 scores indexed by doc id.
+
+    doc_lengths is the int32 array of ArrayPostings. Documents that match no
+    query term score 0.0; every matching document has a positive score.
+    """
+    scores = np.zeros(len(doc_lengths), np.float64)
+    for term in query_tokens:
+        doc_ids, freqs = postings.postings(term)
+        if not len(doc_ids):
+            continue
+        idf = bm25_idf(total_docs, len(doc_ids))
+        K = K1 * ((1 - B) + B * (doc_lengths[doc_ids] / avg_doc_length))
+        scores[doc_ids] += idf * ((freqs * (K1 + 1)) / (freqs + K))
+    # deleted documents are dropped like documents that match nothing
+    scores[postings.deleted] = 0.0
+    return scores
+
+
+def top_k(scores, docno_list, k):
+    matching = np.count_nonzero(scores)
+    k = min(k, matching)
+    if k == 0:
+        return []
+    kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    # every document tied with the k-th score takes part in the docno tie-break
+    candidates = np.nonzero(scores >= kth_score)[0].tolist()
+    candidate_scores = scores[candidates].tolist()
+    ranked = sorted(
+        zip(candidates, candidate_scores), key=lambda x: (-x[1], docno_list[x[0]])
+    )
+    return ranked[:k]
+
+
+def calculate_bm25_numpy(
+    queries, postings, doc_lengths, docno_list, avg_doc_length, k=1000
+):
+    results = {}
+    total_docs = postings.index.total_docs
+
+    for query_id, query_text in queries.items():
+        query_tokens = []
+        Tokenize(query_text, query_tokens)
+        query_tokens = query_terms(query_tokens, postings.index)
+
+        scores = compute_bm25_numpy(
+            query_tokens, doc_lengths, avg_doc_length, postings, total_docs
+        )
+        results[query_id] = top_k(scores, docno_list, k)
+
+    return results
@@ -0,0 +1,383 @@
+"""
+Boolean queries with AND, OR, NOT, parentheses, quoted phrases and proximity.
+
+    smoking AND (tobacco OR cigarettes) AND NOT "passive smoking"
+    "smoking ban"~5
+
+A quoted phrase followed by ~k matches documents where all of its terms occur
+within k positions of each other, in any order (see proximity.py).
+
+Words next to each other without an operator are ANDed, so a plain BooleanAND
+query means the same here. NOT binds tighter than AND, which binds tighter than
+OR; operators are only recognized in upper case. A word is tokenized like the
+documents (a word such as U.S. becomes the AND of its tokens) and stemmed if
+the index is. A term that isn't in the index is left out of an AND, as
+BooleanAND leaves it out of a query, unless the AND has no other positive
+operand; then, like on its own or in an OR, it matches no document.
+
+A query is parsed into a tree and then planned:
+
+- nested ANDs and ORs are flattened, NOT NOT x becomes x and NOT (a OR b)
+  becomes NOT a AND NOT b
+- the NOTs of an AND are pushed down into a difference: the positive operands
+  are evaluated first and the negated ones only remove candidates from them
+- every node gets an estimate of the number of documents it matches (the df of
+  a term, the smallest estimate of an AND, the sum of an OR); the operands of an
+  AND are evaluated from the smallest estimate up
+- an AND with an operand that can't match anything (other than an unknown
+  term) is planned as empty and isn't evaluated at all
+
+Only the first operand of an AND is evaluated over the whole index. The others
+are evaluated within its candidates, so a term costs a skip table probe per
+candidate (see intersect.py) instead of a pass over its postings, and the
+evaluation stops as soon as no candidate is left. An OR whose estimate is less
+than twice the number of candidates is evaluated as a union instead, which
+then costs less than probing for most of its matches. A phrase is the AND of its
+terms, after which the positions of the terms are checked in the candidates
+left; an index built without positions checks the tokens of the candidate
+documents in the document store instead. A NOT on its own (or in an OR) is the
+complement over all documents.
+
+Benchmark (long disjunctive queries, planned against naive evaluation):
+    python bench_boolean_query.py storage
+"""
+
+import re
+from IndexEngine import analyze
+from intersect import filter_candidates, intersect
+from proximity import matches, positional_filter
+from segments import open_doc_store
+from stemmer import stem_tokens
+from tokenizer import Tokenize
+from trec_parser import parse_document
+
+QUERY_TOKEN = re.compile(r'\(|\)|"[^"]*"?(?:~\d+)?|[^\s()"]+')
+
+PHRASE = re.compile(r'"([^"]*)"?(?:~(\d+))?')
+
+EMPTY = ("empty",)
+
+
+def query_words(text, index):
+    """Return the index terms of a word or phrase of a query."""
+    tokens = []
+    Tokenize(text, tokens)
+    return stem_tokens(tokens) if index.stemmed else tokens
+
+
+def parse_query(query, index):
+    """Return the tree of a query, or None if it has no terms.
+
+    Nodes are ("term", term), ("phrase", terms, k), ("and", children),
+    ("or", children) and ("not", child); k is None for an exact phrase.
+    """
+    tokens = QUERY_TOKEN.findall(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == "OR":
+            take()
+            children.append(parse_and())
+        return combine("or", children)
+
+    def parse_and():
+        children = [parse_not()]
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND":
+                take()
+            children.append(parse_not())
+        return combine("and", children)
+
+    def parse_not():
+        if peek() == "NOT":
+            take()
+            child = parse_not()
+            return None if child is None else ("not", child)
+        return parse_primary()
+
+    def parse_primary():
+        token = peek()
+        if token is None or token in (")", "AND", "OR"):
+            raise ValueError(f"expected a term at position {pos} of {query!r}")
+        take()
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"missing ')' in {query!r}")
+            take()
+            return node
+        if token.startswith('"'):
+            text, k = PHRASE.fullmatch(token).groups()
+            terms = query_words(text, index)
+            k = None if k is None else int(k)
+            if len(terms) > 1 and (k is None or len(set(terms)) > 1):
+                return ("phrase", tuple(terms), k)
+        else:
+            terms = query_words(token, index)
+        return combine("and", [("term", term) for term in terms])
+
+    node = parse_or()
+    if pos < len(tokens):
+        raise ValueError(f"unexpected {tokens[pos]!r} in {query!r}")
+    return node
+
+
+def combine(op, children):
+    # operands without terms (e.g. only punctuation) are left out
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return (op, children)
+
+
+def plan_query(node, index):
+    """Return the evaluation plan of a query tree.
+
+    Plan nodes end with their estimated number of matching documents:
+    ("term", term, est), ("phrase", terms, k, est), ("and", positives,
+    negatives, est), ("or", children, est), ("not", child, est) and EMPTY.
+    """
+    num_docs = index.total_docs
+    if node is None:
+        return EMPTY
+    op = node[0]
+
+    if op == "term":
+        df = index.doc_freq(node[1])
+        return ("term", node[1], df) if df else EMPTY
+
+    if op == "phrase":
+        est = min(index.doc_freq(term) for term in node[1])
+        return ("phrase", node[1], node[2], est) if est else EMPTY
+
+    if op == "not":
+        child = node[1]
+        if child[0] == "not":
+            return plan_query(child[1], index)
+        if child[0] == "or":
+            return plan_query(("and", [("not", c) for c in child[1]]), index)
+        child = plan_query(child, index)
+        if child == EMPTY:
+            return ("and", [], [], num_docs)
+        return ("not", child, num_docs - child[-1])
+
+    if op == "or":
+        children = []
+        for child in flatten("or", node[1]):
+            child = plan_query(child, index)
+            if child[0] == "and" and not child[1] and not child[2]:
+                # one operand matches every document
+                return child
+            if child != EMPTY:
+                children.append(child)
+        children = unique(children)
+        if not children:
+            return EMPTY
+        if len(children) == 1:
+            return children[0]
+        # the likeliest operands first, they leave fewer candidates to the others
+        children.sort(key=lambda child: -child[-1])
+        return ("or", children, min(num_docs, sum(child[-1] for child in children)))
+
+    positives, negatives = [], []
+    unknown = False
+    for child in flatten("and", node[1]):
+        if child[0] == "term" and not index.doc_freq(child[1]):
+            # left out like BooleanAND leaves it out of a query
+            unknown = True
+            continue
+        child = plan_query(child, index)
+        if child == EMPTY:
+            return EMPTY
+        if child[0] == "not":
+            negatives.append(child[1])
+        elif child[0] == "and":
+            positives.extend(child[1])
+            negatives.extend(child[2])
+        else:
+            positives.append(child)
+    if unknown and not positives:
+        return EMPTY
+    positives = unique(positives)
+    negatives = unique(negatives)
+    positives.sort(key=lambda child: child[-1])
+    negatives.sort(key=lambda child: -child[-1])
+    est = positives[0][-1] if positives else num_docs
+    if not positives and len(negatives) == 1:
+        return ("not", negatives[0], num_docs - negatives[0][-1])
+    if len(positives) == 1 and not negatives:
+        return positives[0]
+    return ("and", positives, negatives, est)
+
+
+def unique(plans):
+    # a repeated operand, e.g. both tokens of U.S. U.S., is evaluated once
+    result = []
+    for plan in plans:
+        if plan not in result:
+            result.append(plan)
+    return result
+
+
+def flatten(op, children):
+    for child in children:
+        if child[0] == op:
+            yield from flatten(op, child[1])
+        else:
+            yield child
+
+
+def explain(plan):
+    """Return a plan as text, with the estimate of every node."""
+    op = plan[0]
+    if op == "empty":
+        return "EMPTY"
+    if op == "term":
+        return f"{plan[1]}[{plan[2]}]"
+    if op == "phrase":
+        proximity = "" if plan[2] is None else f"~{plan[2]}"
+        return f'"{" ".join(plan[1])}"{proximity}[{plan[3]}]'
+    if op == "not":
+        return f"NOT {explain(plan[1])}"
+    if op == "or":
+        children = " OR ".join(explain(child) for child in plan[1])
+        return f"({children})[{plan[2]}]"
+    operands = [explain(child) for child in plan[1]]
+    operands += [f"NOT {explain(child)}" for child in plan[2]]
+    return f"({' AND '.join(operands) or 'ALL'})[{plan[3]}]"
+
+
+def difference(candidates, excluded):
+    excluded = set(excluded)
+    return [doc_id for doc_id in candidates if doc_id not in excluded]
+
+
+class BooleanQueryEngine:
+    def __init__(self, index, doc_store=None):
+        self.index = index
+        # only opened once a query has a phrase
+        self._doc_store = doc_store
+
+    @property
+    def doc_store(self):
+        if self._doc_store is None:
+            self._doc_store = open_doc_store(self.index.index_dir)
+        return self._doc_store
+
+    def plan(self, query):
+        return plan_query(parse_query(query, self.index), self.index)
+
+    def search(self, query):
+        """Return the sorted doc ids of the documents that match a query."""
+        return self.evaluate(self.plan(query))
+
+    def all_docs(self):
+        deleted = self.index.deleted
+        return [
+            doc_id
+            for doc_id in range(len(self.index.doc_lengths))
+            if doc_id not in deleted
+        ]
+
+    def evaluate(self, plan, candidates=None):
+        """Return the documents matching plan, among candidates if given."""
+        op = plan[0]
+        if op == "empty" or candidates == []:
+            return []
+
+        if op == "term":
+            if candidates is not None:
+                return filter_candidates(candidates, plan[1], self.index)
+            return intersect([plan[1]], self.index)
+
+        if op == "phrase":
+            _, terms, k, _ = plan
+            if candidates is None:
+                candidates = intersect(list(set(terms)), self.index)
+            else:
+                for term in sorted(set(terms), key=self.index.doc_freq):
+                    candidates = filter_candidates(candidates, term, self.index)
+            return self.phrase_matches(candidates, terms, k)
+
+        if op == "not":
+            if candidates is None:
+                candidates = self.all_docs()
+            return self.exclude(plan[1], candidates)
+
+        if op == "or":
+            if candidates is None:
+                matched = set()
+                for child in plan[1]:
+                    if child[0] == "term":
+                        # the postings go into the set in C, deleted ones included
+                        matched.update(self.index.postings(child[1])[0])
+                    else:
+                        matched.update(self.evaluate(child))
+                matched.difference_update(self.index.deleted)
+                return sorted(matched)
+            if 2 * len(candidates) >= plan[2]:
+                # probing most of the matches costs more than the union itself
+                matched = set(self.evaluate(plan))
+                return [doc_id for doc_id in candidates if doc_id in matched]
+            # every operand only looks at the candidates nothing has matched yet
+            matched = []
+            remaining = candidates
+            for child in plan[1]:
+                found = self.evaluate(child, remaining)
+                if found:
+                    matched.extend(found)
+                    remaining = difference(remaining, found)
+                    if not remaining:
+                        break
+            return sorted(matched)
+
+        _, positives, negatives, _ = plan
+        if not positives and candidates is None:
+            candidates = self.all_docs()
+        for child in positives:
+            candidates = self.evaluate(child, candidates)
+            if not candidates:
+                return []
+        for child in negatives:
+            candidates = self.exclude(child, candidates)
+            if not candidates:
+                return []
+        return candidates
+
+    def exclude(self, plan, candidates):
+        """Return the candidates that don't match plan."""
+        if plan[0] == "term":
+            return filter_candidates(candidates, plan[1], self.index, keep=False)
+        return difference(candidates, self.evaluate(plan, candidates))
+
+    def phrase_matches(self, candidates, terms, k=None):
+        """Return the candidates in which terms form a phrase, or occur within k."""
+        if self.index.positional:
+            return positional_filter(candidates, terms, self.index, k)
+        matched = []
+        for doc_id, raw in self.doc_store.get_many(candidates):
+            doc = parse_document(raw.encode("utf-8"))
+            _, _, tokens = analyze(doc, self.index.stemmed)
+            if matches(token_positions(tokens, terms), k):
+                matched.append(doc_id)
+        return matched
+
+
+def token_positions(tokens, terms):
+    """Return the positions of every term in a list of tokens."""
+    positions = {term: [] for term in terms}
+    for i, token in enumerate(tokens):
+        if token in positions:
+            positions[token].append(i)
+    return [positions[term] for term in terms]
@@ -0,0 +1,125 @@
+"""
+Packs the per-document files of a storage tree built by IndexEngine
+(YYYY/MM/DD/<DOCNO>.txt and <DOCNO>.metadata.txt) into the document store
+(see doc_store.py) and the metadata table (see metadata_table.py) read by
+GetDoc and interactive_bm25, for the root of the index and each of its
+segments. A store or table that already exists is left as it is.
+
+Documents replaced with --update share their files with their newest version,
+which is the only one left in the tree, so they are packed with that version;
+they are deleted from the index either way.
+
+Usage:
+    python convert_storage.py <document_store> [--remove-files]
+
+Arguments:
+    <document_store>: the output directory of IndexEngine
+    --remove-files: delete the per-document files (and emptied date directories)
+              once the stores and tables are written
+"""
+
+import os
+import sys
+from doc_store import DOCS_META_FILE, DocStoreWriter
+from GetDoc import docno_to_date, load_docnos
+from metadata_table import MetadataTableWriter, has_table
+from segments import load_manifest, segment_path
+
+
+def document_files(document_store, docno):
+    year, month, day = docno_to_date(docno)
+    date_path = os.path.join(document_store, year, month, day)
+    return (
+        os.path.join(date_path, f"{docno}.txt"),
+        os.path.join(date_path, f"{docno}.metadata.txt"),
+    )
+
+
+def read_document(document_store, docno):
+    doc_path, _ = document_files(document_store, docno)
+    with open(doc_path, "r") as f:
+        # IndexEngine writes the document followed by a line end
+        return f.read()[:-1]
+
+
+def read_metadata(document_store, docno):
+    """Return the date, headline and length of a document's metadata file."""
+    _, metadata_path = document_files(document_store, docno)
+    metadata = {}
+    with open(metadata_path, "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            metadata[key] = value.strip()
+    date = int("".join(docno_to_date(docno)))
+    return date, metadata["headline"], int(metadata["document length"])
+
+
+def index_parts(document_store, num_docs):
+    """Return (index_dir, first id, number of documents) of the root and segments."""
+    segments = load_manifest(document_store)["segments"]
+    root_docs = num_docs - sum(seg["num_docs"] for seg in segments)
+    parts = [(document_store, 0, root_docs)]
+    for seg in segments:
+        path = segment_path(document_store, seg["name"])
+        parts.append((path, seg["base"], seg["num_docs"]))
+    return parts
+
+
+def convert(document_store):
+    """Write the missing stores and tables; return how many were written."""
+    docnos = load_docnos(document_store)
+    written = 0
+    for index_dir, base, num_docs in index_parts(document_store, len(docnos)):
+        part_docnos = docnos[base : base + num_docs]
+        if not os.path.exists(os.path.join(index_dir, DOCS_META_FILE)):
+            doc_store = DocStoreWriter(index_dir)
+            for docno in part_docnos:
+                doc_store.add(read_document(document_store, docno))
+            doc_store.close()
+            written += 1
+        if not has_table(index_dir):
+            table = MetadataTableWriter(index_dir)
+            for docno in part_docnos:
+                table.add(docno, *read_metadata(document_store, docno))
+            table.close()
+            written += 1
+    return written
+
+
+def remove_files(document_store):
+    """Delete the per-document files; return the number of files deleted."""
+    removed = 0
+    date_dirs = set()
+    for docno in set(load_docnos(document_store)):
+        for path in document_files(document_store, docno):
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        date_dirs.add(os.path.dirname(path))
+    # remove the emptied day, month and year directories
+    for date_path in sorted(date_dirs, reverse=True):
+        for path in (
+            date_path,
+            os.path.dirname(date_path),
+            os.path.dirname(os.path.dirname(date_path)),
+        ):
+            if os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+    return removed
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[2:] not in ([], ["--remove-files"]):
+        print("Usage: python convert_storage.py <document_store> [--remove-files]")
+        sys.exit(1)
+
+    document_store = sys.argv[1]
+    written = convert(document_store)
+    print(f"Wrote {written} document stores and metadata tables.")
+    if len(sys.argv) == 3:
+        removed = remove_files(document_store)
+        print(f"Removed {removed} document and metadata files.")
+
+
+if __name__ == "__main__":
+    main()
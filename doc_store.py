@@ -0,0 +1,167 @@
+"""
+Packed store of the raw documents, read on demand by internal id.
+
+The documents are appended to documents.bin in blocks of a few documents each,
+optionally zlib-compressed per block so that neighbouring articles share a
+dictionary. documents.idx holds the offset table:
+
+    block offsets in documents.bin     (num_blocks + 1) x uint64
+    start/end of every document        num_docs x 2 x uint32, relative to the
+                                       start of its (uncompressed) block
+
+documents-meta.json records the number of documents, the number of documents
+per block and the compression. Reading a document touches only its own block,
+and recently viewed documents are kept in a small LRU cache.
+
+Together with the metadata table (see metadata_table.py), a tree built with
+--no-doc-files needs no file per document; convert_storage.py packs the files
+of an existing storage tree into both.
+"""
+
+import json
+import os
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from binary_index import open_mmap
+
+DOCS_FILE = "documents.bin"
+DOCS_INDEX_FILE = "documents.idx"
+DOCS_META_FILE = "documents-meta.json"
+
+
+class DocStoreWriter:
+    # data, offset table and meta file, see the module docstring
+    files = (DOCS_FILE, DOCS_INDEX_FILE, DOCS_META_FILE)
+
+    def __init__(self, output_dir, compress=True, docs_per_block=16):
+        self.output_dir = output_dir
+        self.compress = compress
+        self.docs_per_block = docs_per_block
+        self.out = open(os.path.join(output_dir, self.files[0]), "wb")
+        self.block_offsets = array("Q", [0])
+        self.doc_bounds = array("I")
+        self.block = []
+        self.block_size = 0
+        self.num_docs = 0
+
+    def add(self, doc):
+        """Append the next document; documents must be added in internal id order."""
+        self.add_record(doc.encode("utf-8"))
+
+    def add_record(self, data):
+        self.doc_bounds.append(self.block_size)
+        self.doc_bounds.append(self.block_size + len(data))
+        self.block.append(data)
+        self.block_size += len(data)
+        self.num_docs += 1
+        if len(self.block) == self.docs_per_block:
+            self.flush_block()
+
+    def flush_block(self):
+        data = b"".join(self.block)
+        if self.compress:
+            data = zlib.compress(data)
+        self.out.write(data)
+        self.block_offsets.append(self.block_offsets[-1] + len(data))
+        self.block = []
+        self.block_size = 0
+
+    def close(self):
+        if self.block:
+            self.flush_block()
+        self.out.close()
+        with open(os.path.join(self.output_dir, self.files[1]), "wb") as f:
+            self.block_offsets.tofile(f)
+            self.doc_bounds.tofile(f)
+        meta = {
+            "num_docs": self.num_docs,
+            "docs_per_block": self.docs_per_block,
+            "compression": "zlib" if self.compress else "none",
+        }
+        with open(os.path.join(self.output_dir, self.files[2]), "w") as f:
+            json.dump(meta, f, indent=4)
+
+
+class DocStore:
+    files = DocStoreWriter.files
+
+    def __init__(self, index_dir, cache_size=64):
+        data_file, index_file, meta_file = self.files
+        with open(os.path.join(index_dir, meta_file), "r") as f:
+            self.meta = json.load(f)
+        self.num_docs = self.meta["num_docs"]
+        self.docs_per_block = self.meta["docs_per_block"]
+        self.compressed = self.meta["compression"] == "zlib"
+        self.data = open_mmap(os.path.join(index_dir, data_file))
+        self.index = open_mmap(os.path.join(index_dir, index_file))
+        self.num_blocks = (
+            self.num_docs + self.docs_per_block - 1
+        ) // self.docs_per_block
+        self.bounds_offset = 8 * (self.num_blocks + 1)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # the store may be shared by the threads of search_server.py
+        self.cache_lock = threading.Lock()
+
+    def __len__(self):
+        return self.num_docs
+
+    def _read_block(self, block):
+        offsets = array("Q")
+        offsets.frombytes(self.index[8 * block : 8 * (block + 2)])
+        data = self.data[offsets[0] : offsets[1]]
+        return zlib.decompress(data) if self.compressed else data
+
+    def get(self, doc_id):
+        """Return the raw text of a document, or None for an unknown id."""
+        with self.cache_lock:
+            if doc_id in self.cache:
+                self.cache.move_to_end(doc_id)
+                return self.cache[doc_id]
+        if not 0 <= doc_id < self.num_docs:
+            return None
+
+        block = self._read_block(doc_id // self.docs_per_block)
+        doc = self._doc_in_block(block, doc_id)
+
+        with self.cache_lock:
+            self.cache[doc_id] = doc
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return doc
+
+    def get_many(self, doc_ids):
+        """Yield (doc_id, raw text) for increasing doc ids, skipping unknown ones.
+
+        Each block is decompressed once for all the documents it holds, and the
+        cache is neither read nor filled.
+        """
+        current, block = None, None
+        for doc_id in doc_ids:
+            if not 0 <= doc_id < self.num_docs:
+                continue
+            if doc_id // self.docs_per_block != current:
+                current = doc_id // self.docs_per_block
+                block = self._read_block(current)
+            yield doc_id, self._doc_in_block(block, doc_id)
+
+    def records(self):
+        """Yield the stored bytes of every document in id order, for copying."""
+        for doc_id in range(self.num_docs):
+            if doc_id % self.docs_per_block == 0:
+                block = self._read_block(doc_id // self.docs_per_block)
+            yield self._record_in_block(block, doc_id)
+
+    def _record_in_block(self, block, doc_id):
+        bounds = array("I")
+        pos = self.bounds_offset + 8 * doc_id
+        bounds.frombytes(self.index[pos : pos + 8])
+        return block[bounds[0] : bounds[1]]
+
+    def _doc_in_block(self, block, doc_id):
+        return self.decode(self._record_in_block(block, doc_id))
+
+    def decode(self, data):
+        return data.decode("utf-8")
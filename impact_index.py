@@ -0,0 +1,229 @@
+"""
+Precomputed, quantized BM25 impact scores.
+
+The BM25 weight of a posting only depends on its frequency, its document length
+and collection statistics that are fixed once the index is built, so it can be
+computed once at index time. This optional build stage reads the binary index,
+computes the weight of every posting, quantizes it linearly to 8 or 16 bits
+(1 .. 2^bits - 1, scaled by the largest weight in the collection) and writes:
+
+    impacts.idx         (num_terms + 1) x uint64 offsets into impacts.bin, by term id
+    impacts.bin         the impacts of every term
+    impacts-meta.json   bits, layout, scale and the statistics the weights used
+
+In "doc" order the impacts of a term are an array aligned with its postings
+list. In "impact" order a term is a list of segments, one per distinct impact in
+decreasing order, each holding the (increasing) doc ids with that impact:
+
+    number of segments          uint32
+    impact, count per segment   2 x uint32 each
+    doc ids of all segments     uint32
+
+Queries then only add integers. With impact-ordered postings the segments of all
+query terms can be processed highest impact first (score-at-a-time), which makes
+it possible to stop after a budget of postings with the most important ones
+already added. Nothing bounds what stopping early costs in ranking quality;
+bench_impacts.py measures it.
+
+The weights use the statistics of the index when the impacts were built, so
+they go stale when those change: appending a segment changes them, and
+compacting the index (tombstones.py) purges postings, which removes the impact
+files. ImpactIndex refuses impacts whose statistics no longer match the index;
+they have to be built again.
+
+Usage:
+    python impact_index.py <index_dir> [bits] [doc|impact]
+"""
+
+import heapq
+import json
+import os
+import sys
+from array import array
+from collections import Counter, defaultdict
+from binary_index import META_FILE, BinaryIndex, open_mmap
+from bm25 import bm25_idf, bm25_term_score
+from segments import has_segments
+
+IMPACTS_FILE = "impacts.bin"
+IMPACTS_INDEX_FILE = "impacts.idx"
+IMPACTS_META_FILE = "impacts-meta.json"
+
+TYPECODES = {8: "B", 16: "H"}
+
+
+def term_weights(index, term, record, doc_lengths):
+    idf = bm25_idf(index.total_docs, record[3])
+    doc_ids, freqs = index.postings(term)
+    weights = [
+        bm25_term_score(freq, doc_lengths[doc_id], index.avg_doc_length, idf)
+        for doc_id, freq in zip(doc_ids, freqs)
+    ]
+    return doc_ids, weights
+
+
+def build_impacts(index_dir, bits=16, order="impact"):
+    index = BinaryIndex(index_dir)
+    doc_lengths = index.doc_lengths
+
+    max_weight = 0.0
+    for term, record in index.items():
+        _, weights = term_weights(index, term, record, doc_lengths)
+        max_weight = max(max_weight, max(weights, default=0.0))
+    levels = (1 << bits) - 1
+    scale = levels / max_weight if max_weight else 1.0
+
+    offsets = array("Q", [0] * (index.num_terms + 1))
+    size = 0
+    by_tid = sorted(index.items(), key=lambda item: item[1][2])
+    with open(os.path.join(index_dir, IMPACTS_FILE), "wb") as f:
+        for term, record in by_tid:
+            doc_ids, weights = term_weights(index, term, record, doc_lengths)
+            impacts = [max(1, min(levels, round(w * scale))) for w in weights]
+            if order == "doc":
+                data = array(TYPECODES[bits], impacts).tobytes()
+            else:
+                segments = defaultdict(list)
+                for doc_id, impact in zip(doc_ids, impacts):
+                    segments[impact].append(doc_id)
+                header = array("I", [len(segments)])
+                segment_docs = array("I")
+                for impact in sorted(segments, reverse=True):
+                    header.extend((impact, len(segments[impact])))
+                    segment_docs.extend(segments[impact])
+                data = header.tobytes() + segment_docs.tobytes()
+            f.write(data)
+            size += len(data)
+            offsets[record[2] + 1] = size
+    # terms without postings keep the offset of the previous term
+    for tid in range(1, len(offsets)):
+        offsets[tid] = max(offsets[tid], offsets[tid - 1])
+    with open(os.path.join(index_dir, IMPACTS_INDEX_FILE), "wb") as f:
+        offsets.tofile(f)
+
+    meta = {
+        "bits": bits,
+        "order": order,
+        "scale": scale,
+        "num_docs": index.total_docs,
+        "avg_doc_length": index.avg_doc_length,
+    }
+    with open(os.path.join(index_dir, IMPACTS_META_FILE), "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+class ImpactIndex:
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, IMPACTS_META_FILE), "r") as f:
+            self.meta = json.load(f)
+        if not impacts_current(index_dir, self.meta):
+            raise ValueError(
+                f"the impacts of {index_dir} were built for other collection "
+                "statistics, run impact_index.py again"
+            )
+        self.bits = self.meta["bits"]
+        self.order = self.meta["order"]
+        self.scale = self.meta["scale"]
+        self.data = open_mmap(os.path.join(index_dir, IMPACTS_FILE))
+        self.offsets = open_mmap(os.path.join(index_dir, IMPACTS_INDEX_FILE))
+
+    def _term_data(self, tid):
+        bounds = array("Q")
+        bounds.frombytes(self.offsets[8 * tid : 8 * (tid + 2)])
+        return bounds[0], bounds[1]
+
+    def doc_impacts(self, tid):
+        """Impacts of a term in postings order (doc-ordered layout only)."""
+        start, end = self._term_data(tid)
+        impacts = array(TYPECODES[self.bits])
+        impacts.frombytes(self.data[start:end])
+        return impacts
+
+    def segments(self, tid):
+        """Yield (impact, doc_ids) in decreasing impact (impact-ordered layout)."""
+        start, _ = self._term_data(tid)
+        num_segments = array("I")
+        num_segments.frombytes(self.data[start : start + 4])
+        header = array("I")
+        header.frombytes(self.data[start + 4 : start + 4 + 8 * num_segments[0]])
+        pos = start + 4 + 8 * num_segments[0]
+        for i in range(0, len(header), 2):
+            impact, count = header[i], header[i + 1]
+            doc_ids = array("I")
+            doc_ids.frombytes(self.data[pos : pos + 4 * count])
+            pos += 4 * count
+            yield impact, doc_ids
+
+
+def impacts_current(index_dir, meta):
+    """Return whether impacts with meta were built for the index as it is now."""
+    if has_segments(index_dir):
+        return False
+    with open(os.path.join(index_dir, META_FILE), "r") as f:
+        index_meta = json.load(f)
+    # the statistics of BinaryIndex, from index-meta.json alone
+    num_docs = index_meta["num_docs"] - index_meta.get("deleted_docs", 0)
+    avg_doc_length = index_meta["total_length"] / num_docs if num_docs else 0.0
+    return meta["num_docs"] == num_docs and meta["avg_doc_length"] == avg_doc_length
+
+
+def weighted_segments(segments, count):
+    for impact, doc_ids in segments:
+        yield count * impact, doc_ids
+
+
+def impact_top_k(query_tokens, index, impacts, docno_list, k=1000, max_postings=None):
+    """Rank documents by their summed quantized impacts.
+
+    Returns (doc_id, score) pairs like calculate_bm25, with scores mapped back
+    to the BM25 scale. With impact-ordered postings, max_postings stops
+    score-at-a-time processing after that many postings.
+    """
+    counts = Counter(query_tokens)
+    scores = defaultdict(int)
+    if impacts.order == "doc":
+        for term, count in counts.items():
+            tid = index.term_id(term)
+            if tid is None:
+                continue
+            doc_ids, _ = index.postings(term)
+            for doc_id, impact in zip(doc_ids, impacts.doc_impacts(tid)):
+                scores[doc_id] += count * impact
+    else:
+        # merge the segments of all query terms, highest contribution first
+        streams = []
+        for term, count in counts.items():
+            tid = index.term_id(term)
+            if tid is not None:
+                streams.append(weighted_segments(impacts.segments(tid), count))
+        processed = 0
+        for contribution, doc_ids in heapq.merge(
+            *streams, key=lambda segment: -segment[0]
+        ):
+            if max_postings is not None and processed >= max_postings:
+                break
+            for doc_id in doc_ids:
+                scores[doc_id] += contribution
+            processed += len(doc_ids)
+
+    for doc_id in index.deleted:
+        scores.pop(doc_id, None)
+    ranked = heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+    return [(doc_id, score / impacts.scale) for doc_id, score in ranked]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python impact_index.py <index_dir> [bits] [doc|impact]")
+        sys.exit(1)
+
+    bits = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    order = sys.argv[3] if len(sys.argv) > 3 else "impact"
+    if bits not in TYPECODES or order not in ("doc", "impact"):
+        print("Error: bits must be 8 or 16 and the order either 'doc' or 'impact'.")
+        sys.exit(1)
+    # impacts depend on collection statistics that change with every segment
+    if has_segments(sys.argv[1]):
+        print("Error: impacts can only be built for an index without segments.")
+        sys.exit(1)
+    build_impacts(sys.argv[1], bits, order)
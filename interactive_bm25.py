@@ -1,16 +1,36 @@
-import json
 import os
 import re
 import time
-from bm25 import calculate_bm25, Tokenize
-from query_biased_summary import generate_query_biased_snippet, extract_text_tag
+from bm25 import Tokenize, query_terms
+from query_biased_summary import (
+    extract_text_tag,
+    generate_query_biased_snippet,
+    stored_snippet,
+)
 from collections import defaultdict
 from GetDoc import docno_to_date
+from metadata_table import has_table
+from result_cache import ResultCache, cached_top_k
+from segments import (
+    index_version,
+    open_doc_store,
+    open_index,
+    open_metadata_table,
+    open_sentence_store,
+)
+from sentence_store import has_sentences
+from wand import top_k_bm25
 
 DOCUMENTS_PATH = "storage"
 
 
-def load_metadata(base_dir, docno):
+def load_metadata(base_dir, docno, doc_id=None, metadata_table=None):
+    if metadata_table is not None:
+        metadata = metadata_table.get(doc_id)
+        if metadata is None:
+            return {"headline": "Unknown Title", "date": "Unknown Date"}
+        return metadata
+
     year, month, day = docno_to_date(docno)
     metadata_path = os.path.join(base_dir, year, month, day, f"{docno}.metadata.txt")
 
@@ -32,65 +52,71 @@ def load_metadata(base_dir, docno):
     return metadata
 
 
-def display_results(ranked_results, documents, query_tokens, docno_list):
+def display_results(
+    ranked_results,
+    doc_store,
+    query_tokens,
+    docno_list,
+    metadata_table=None,
+    sentence_store=None,
+):
     print("\nTop 10 Results:")
     for rank, (doc_id, score) in enumerate(ranked_results, start=1):
         docno = docno_list[int(doc_id)]
-        doc_text = documents.get(docno, "Document not found.")
+        # the stored sentences spare reading and parsing the raw document
+        store = doc_store if sentence_store is None else sentence_store
+        doc = store.get(doc_id)
 
-        if doc_text == "Document not found.":
+        if doc is None:
             print(f"{rank}. Document not found. (Unknown Date)")
             print(f"Document not found. ({docno})")
             continue
 
-        metadata = load_metadata(DOCUMENTS_PATH, docno)
+        metadata = load_metadata(DOCUMENTS_PATH, docno, doc_id, metadata_table)
         headline = metadata["headline"]
         date = metadata["date"]
-        snippet = generate_query_biased_snippet(doc_text, query_tokens)
+        if sentence_store is None:
+            snippet = generate_query_biased_snippet(doc, query_tokens)
+        else:
+            snippet = stored_snippet(doc, query_tokens)
 
         print(f"{rank}. {headline} ({date})")
         print(f"{snippet} ({docno})\n")
 
 
 def load_data(base_dir):
-    index_path = os.path.join(base_dir, "inverted-index.json")
-    lexicon_path = os.path.join(base_dir, "lexicon.json")
-    doclengths_path = os.path.join(base_dir, "doc-lengths.txt")
     docno_list_path = os.path.join(base_dir, "docno_list.txt")
-    documents_path = base_dir
-
-    with open(index_path, "r") as f:
-        inverted_index = json.load(f)
-
-    with open(lexicon_path, "r") as f:
-        lexicon = json.load(f)
 
-    with open(doclengths_path, "r") as f:
-        doc_lengths = [int(line.strip()) for line in f.readlines()]
+    index = open_index(base_dir)
 
     with open(docno_list_path, "r") as f:
         docno_list = [line.strip() for line in f.readlines()]
 
-    documents = {}
-    for root, _, files in os.walk(documents_path):
-        for file in files:
-            if file.endswith(".txt") and not file.endswith(".metadata.txt"):
-                doc_path = os.path.join(root, file)
-                docno = os.path.splitext(file)[0]
-                with open(doc_path, "r") as doc_file:
-                    documents[docno] = doc_file.read()
+    # documents are only read when they are displayed
+    doc_store = open_doc_store(base_dir)
+    print(f"Opened store of {len(doc_store)} documents in {DOCUMENTS_PATH}.")
+    # stores built before the metadata table fall back to the metadata files
+    metadata_table = None
+    if has_table(base_dir):
+        metadata_table = open_metadata_table(base_dir)
+    # and the snippets of indexes built without --sentences to the documents
+    sentence_store = None
+    if has_sentences(base_dir):
+        sentence_store = open_sentence_store(base_dir)
 
-    print(f"Loaded {len(documents)} documents from {DOCUMENTS_PATH}.")
-
-    return inverted_index, lexicon, doc_lengths, docno_list, documents
+    return index, docno_list, doc_store, metadata_table, sentence_store
 
 
 def main():
     print("Loading data from storage...")
-    inverted_index, lexicon, doc_lengths, docno_list, documents = load_data(
+    index, docno_list, doc_store, metadata_table, sentence_store = load_data(
         DOCUMENTS_PATH
     )
-    avg_doc_length = sum(doc_lengths) / len(doc_lengths)
+    doc_lengths = index.doc_lengths
+    avg_doc_length = index.avg_doc_length
+    # the index is loaded once, so its version doesn't change while it's open
+    cache = ResultCache()
+    version = index_version(DOCUMENTS_PATH)
     print("Data loaded.")
 
     while True:
@@ -102,14 +128,27 @@ def main():
         start_time = time.time()
         query_tokens = []
         Tokenize(query, query_tokens)
-        queries = {1: " ".join(query_tokens)}
-
-        ranked_results = calculate_bm25(
-            queries, inverted_index, lexicon, doc_lengths, docno_list, avg_doc_length
+        # snippets match the unstemmed query tokens against the text
+        terms = query_terms(query_tokens, index)
+        ranked_results = cached_top_k(
+            cache,
+            version,
+            terms,
+            10,
+            lambda: top_k_bm25(
+                terms, index, doc_lengths, docno_list, avg_doc_length, k=10
+            ),
         )
         elapsed_time = time.time() - start_time
 
-        display_results(ranked_results[1][:10], documents, query_tokens, docno_list)
+        display_results(
+            ranked_results,
+            doc_store,
+            query_tokens,
+            docno_list,
+            metadata_table,
+            sentence_store,
+        )
 
         print(f"\nRetrieval took {elapsed_time:.2f} seconds.")
 
@@ -124,10 +163,13 @@ def main():
                 break
             elif action.isdigit() and 1 <= int(action) <= 10:
                 rank = int(action)
-                doc_id = ranked_results[1][rank - 1][0]
+                doc_id = ranked_results[rank - 1][0]
                 docno = docno_list[doc_id]
                 print(f"\nDocument {docno}:\n")
-                print(documents.get(docno, "Document content not found."))
+                doc_text = doc_store.get(doc_id)
+                if doc_text is None:
+                    doc_text = "Document content not found."
+                print(doc_text)
             else:
                 print("Invalid input. Please try again.")
 
@@ -0,0 +1,205 @@
+"""
+Conjunctive (AND) intersection of postings lists.
+
+intersect_linear is the merge BooleanAND started with: every block of every
+postings list is decoded and walked in step with the candidates. intersect
+avoids most of that work:
+
+- in every segment the terms are intersected rarest first, so the candidates
+  only get fewer, and the first list is the only one decoded in full
+- for every candidate the skip table of the next list (the last doc id of every
+  block, see postings_codec.py) is searched by galloping from the current block,
+  so only the blocks that may hold a candidate are decoded; inside a block the
+  candidate is found by galloping from the current position too
+- a list that is dense compared to the candidates (fewer than DENSE_RATIO
+  postings per candidate) would have most of its blocks decoded anyway; its
+  blocks between the first and the last candidate are decoded into a set and
+  the candidates are filtered by membership, both in C
+
+Both return the same sorted global doc ids, without deleted documents.
+filter_candidates applies the skipping or the set to a list of candidates that
+came from elsewhere, e.g. the other operands of a Boolean query (see
+boolean_query.py), keeping either the candidates that contain the term or, for
+a NOT, the ones that don't.
+
+Benchmark (query sets of rare, medium and frequent terms):
+    python bench_boolean.py storage
+"""
+
+from bisect import bisect_left
+from postings_codec import decode_block, read_skip_table
+
+DENSE_RATIO = 8
+
+
+def gallop(values, target, lo=0):
+    """Return the first index >= lo with values[index] >= target, or len(values).
+
+    The distance from lo is found by exponential search first, so a target
+    close to lo costs a few probes whatever the length of values.
+    """
+    n = len(values)
+    hi = lo
+    step = 1
+    while hi < n and values[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(values, target, lo, min(hi, n))
+
+
+class TermPostings:
+    """Postings of a term in one segment, decoded one block at a time on demand."""
+
+    def __init__(self, segment, term, record):
+        _, _, _, self.df, self.offset, _ = record
+        self.data = segment.postings_data
+        if segment.codec == "raw":
+            # no skip table: the whole list is a single block
+            self.doc_ids, self.freqs = segment.postings(term)
+            self.skip_table = None
+            self.last_docs = [self.doc_ids[-1]]
+            self.block = 0
+        else:
+            self.skip_table = read_skip_table(
+                self.data, self.offset, self.df, segment.block_max
+            )
+            self.last_docs = self.skip_table[0]
+            self.doc_ids = []
+            self.freqs = []
+            self.block = -1
+
+    def load(self, block):
+        if block != self.block:
+            self.doc_ids, self.freqs = decode_block(
+                self.data, self.offset, self.df, self.skip_table, block
+            )
+            self.block = block
+
+    def blocks_between(self, first_doc, last_doc):
+        """Yield the doc ids of every block that may hold first_doc..last_doc."""
+        first = gallop(self.last_docs, first_doc)
+        last = min(gallop(self.last_docs, last_doc, first), len(self.last_docs) - 1)
+        for block in range(first, last + 1):
+            self.load(block)
+            yield self.doc_ids
+
+
+def skip_intersect(candidates, postings, keep=True):
+    result = []
+    last_docs = postings.last_docs
+    block = 0
+    postings.load(block)
+    pos = 0
+    for i, doc_id in enumerate(candidates):
+        if doc_id > last_docs[block]:
+            block = gallop(last_docs, doc_id, block + 1)
+            if block == len(last_docs):
+                if not keep:
+                    result.extend(candidates[i:])
+                break
+            postings.load(block)
+            pos = 0
+        doc_ids = postings.doc_ids
+        # doc_id <= the last doc id of the block, so pos stays in the block
+        pos = gallop(doc_ids, doc_id, pos)
+        if (doc_ids[pos] == doc_id) == keep:
+            result.append(doc_id)
+    return result
+
+
+def dense_intersect(candidates, postings, keep=True):
+    members = set()
+    for doc_ids in postings.blocks_between(candidates[0], candidates[-1]):
+        members.update(doc_ids)
+    if keep:
+        return [doc_id for doc_id in candidates if doc_id in members]
+    return [doc_id for doc_id in candidates if doc_id not in members]
+
+
+def intersect(terms, index):
+    """Return the sorted doc ids of the documents that contain every term."""
+    result = []
+    for base, segment in index.segments:
+        records = [(segment.lookup(term), term) for term in terms]
+        # compaction can leave a term without postings in a segment
+        if not records or any(record is None or not record[3] for record, _ in records):
+            continue
+        records.sort(key=lambda item: item[0][3])
+
+        candidates = None
+        for record, term in records:
+            postings = TermPostings(segment, term, record)
+            if candidates is None:
+                candidates = []
+                for doc_ids in postings.blocks_between(0, postings.last_docs[-1]):
+                    candidates.extend(doc_ids)
+            elif postings.df < DENSE_RATIO * len(candidates):
+                candidates = dense_intersect(candidates, postings)
+            else:
+                candidates = skip_intersect(candidates, postings)
+            if not candidates:
+                break
+        result.extend(
+            base + doc_id for doc_id in candidates if base + doc_id not in index.deleted
+        )
+    return result
+
+
+def segment_candidates(candidates, index):
+    """Yield (base, segment, local doc ids) for the candidates of every segment."""
+    for i, (base, segment) in enumerate(index.segments):
+        lo = bisect_left(candidates, base)
+        hi = len(candidates)
+        if i + 1 < len(index.segments):
+            hi = bisect_left(candidates, index.segments[i + 1][0], lo)
+        if lo < hi:
+            yield base, segment, [doc_id - base for doc_id in candidates[lo:hi]]
+
+
+def filter_candidates(candidates, term, index, keep=True):
+    """Return the candidates (sorted global doc ids) whose documents contain term.
+
+    With keep=False, return the candidates whose documents don't contain it.
+    """
+    result = []
+    for base, segment, local in segment_candidates(candidates, index):
+        record = segment.lookup(term)
+        if record is None or not record[3]:
+            if not keep:
+                result.extend(base + doc_id for doc_id in local)
+            continue
+        postings = TermPostings(segment, term, record)
+        if postings.df < DENSE_RATIO * len(local):
+            local = dense_intersect(local, postings, keep)
+        else:
+            local = skip_intersect(local, postings, keep)
+        result.extend(base + doc_id for doc_id in local)
+    return result
+
+
+def intersect_linear(terms, index):
+    """Intersect by merging every block of every list, rarest term first."""
+    terms = sorted(terms, key=index.doc_freq)
+    if not terms:
+        return []
+    doc_ids, _ = index.postings(terms[0])
+    result_set = [doc_id for doc_id in doc_ids if doc_id not in index.deleted]
+    for term in terms[1:]:
+        new_results = []
+        i = 0
+        for postings, _ in index.blocks(term):
+            j = 0
+            while i < len(result_set) and j < len(postings):
+                if result_set[i] == postings[j]:
+                    new_results.append(result_set[i])
+                    i += 1
+                    j += 1
+                elif result_set[i] < postings[j]:
+                    i += 1
+                else:
+                    j += 1
+            if i == len(result_set):
+                break
+        result_set = new_results
+    return result_set
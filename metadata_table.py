@@ -0,0 +1,164 @@
+"""
+Columnar table of the metadata of every document, looked up by internal id.
+
+IndexEngine writes the DOCNO, date, headline and length of the documents into
+doc-table.bin, memory-mapped by the readers, so rendering a result costs a few
+array lookups instead of opening and parsing a .metadata.txt file. The file
+holds one column after another:
+
+    headline offsets   (num_docs + 1) x uint64 into the headline strings
+    docno offsets      (num_docs + 1) x uint32 into the docno strings
+    dates              num_docs x uint32, as YYYYMMDD
+    lengths            num_docs x uint32, in tokens
+    docno order        num_docs x uint32, the internal ids sorted by DOCNO
+    docno strings      UTF-8, one after another
+    headline strings   UTF-8, one after another, normalized to a single line
+
+doc-table.json records the number of documents and the size of both string
+columns. The docno order is binary searched to find the internal id of a
+DOCNO, so neither direction needs docno_list.txt to be loaded. Segments (see
+segments.py) have a table of their own.
+"""
+
+import json
+import os
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from binary_index import open_mmap
+
+TABLE_FILE = "doc-table.bin"
+TABLE_META_FILE = "doc-table.json"
+
+
+def format_date(date):
+    """Format a YYYYMMDD date as, e.g., "January 02, 1989"."""
+    return datetime(date // 10000, date // 100 % 100, date % 100).strftime("%B %d, %Y")
+
+
+def format_metadata(docno, iid, date, headline, length):
+    """Return the text of a .metadata.txt file."""
+    return (
+        f"docno: {docno}\n"
+        f"internal id: {iid}\n"
+        f"date: {date}\n"
+        f"headline: {headline}\n"
+        f"document length: {length}\n"
+    )
+
+
+def has_table(index_dir):
+    return os.path.exists(os.path.join(index_dir, TABLE_META_FILE))
+
+
+class MetadataTableWriter:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.headline_offsets = array("Q", [0])
+        self.docno_offsets = array("I", [0])
+        self.dates = array("I")
+        self.lengths = array("I")
+        self.docno_list = []
+        self.docnos = bytearray()
+        self.headlines = bytearray()
+
+    def add(self, docno, date, headline, length):
+        """Append the next document; documents must be added in internal id order."""
+        self.docno_list.append(docno)
+        self.docnos += docno.encode("utf-8")
+        self.docno_offsets.append(len(self.docnos))
+        # normalize the headline to a single line
+        self.headlines += " ".join(headline.split()).encode("utf-8")
+        self.headline_offsets.append(len(self.headlines))
+        self.dates.append(date)
+        self.lengths.append(length)
+
+    def close(self):
+        # the sort is stable, so a repeated DOCNO keeps its ids in order
+        docno_order = array(
+            "I", sorted(range(len(self.docno_list)), key=self.docno_list.__getitem__)
+        )
+        with open(os.path.join(self.output_dir, TABLE_FILE), "wb") as f:
+            self.headline_offsets.tofile(f)
+            self.docno_offsets.tofile(f)
+            self.dates.tofile(f)
+            self.lengths.tofile(f)
+            docno_order.tofile(f)
+            f.write(self.docnos)
+            f.write(self.headlines)
+        meta = {
+            "num_docs": len(self.dates),
+            "docno_bytes": len(self.docnos),
+            "headline_bytes": len(self.headlines),
+        }
+        with open(os.path.join(self.output_dir, TABLE_META_FILE), "w") as f:
+            json.dump(meta, f, indent=4)
+
+
+class MetadataTable:
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, TABLE_META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.num_docs = n = self.meta["num_docs"]
+        self.data = open_mmap(os.path.join(index_dir, TABLE_FILE))
+
+        # the columns are views of the mapped file, nothing is copied
+        view = memoryview(self.data)
+        pos = 0
+        columns = []
+        for typecode, count in (
+            ("Q", n + 1),
+            ("I", n + 1),
+            ("I", n),
+            ("I", n),
+            ("I", n),
+        ):
+            size = count * array(typecode).itemsize
+            columns.append(view[pos : pos + size].cast(typecode))
+            pos += size
+        (
+            self.headline_offsets,
+            self.docno_offsets,
+            self.dates,
+            self.lengths,
+            self.docno_order,
+        ) = columns
+        self.docnos_start = pos
+        self.headlines_start = pos + self.meta["docno_bytes"]
+
+    def __len__(self):
+        return self.num_docs
+
+    def docno(self, doc_id):
+        start = self.docnos_start + self.docno_offsets[doc_id]
+        end = self.docnos_start + self.docno_offsets[doc_id + 1]
+        return self.data[start:end].decode("utf-8")
+
+    def headline(self, doc_id):
+        start = self.headlines_start + self.headline_offsets[doc_id]
+        end = self.headlines_start + self.headline_offsets[doc_id + 1]
+        return self.data[start:end].decode("utf-8")
+
+    def date(self, doc_id):
+        return format_date(self.dates[doc_id])
+
+    def length(self, doc_id):
+        return self.lengths[doc_id]
+
+    def doc_id(self, docno):
+        """Return the internal id of docno (the last one if repeated), or None."""
+        i = bisect_right(self.docno_order, docno, key=self.docno)
+        if i and self.docno(self.docno_order[i - 1]) == docno:
+            return self.docno_order[i - 1]
+        return None
+
+    def get(self, doc_id):
+        """Return the metadata of a document as a dict, or None for an unknown id."""
+        if not 0 <= doc_id < self.num_docs:
+            return None
+        return {
+            "docno": self.docno(doc_id),
+            "date": self.date(doc_id),
+            "headline": self.headline(doc_id),
+            "length": self.length(doc_id),
+        }
@@ -0,0 +1,219 @@
+"""
+Compressed postings lists for the binary index.
+
+A postings list is cut into blocks of BLOCK_SIZE postings. Doc ids are stored as
+gaps from the previous doc id (the first gap of a block is taken from the last
+doc id of the previous block), and each block packs its gaps and its term
+frequencies with the smallest byte width (1, 2 or 4 bytes) that fits the block's
+largest value. Byte-aligned packing keeps decoding in C: a block is turned back
+into integers with array.frombytes and itertools.accumulate instead of a Python
+loop over every byte.
+
+Layout of one postings list with n blocks:
+
+    last doc id of every block     n x uint32
+    end offset of every block      n x uint32, relative to the first block
+    max frequency of every block   n x uint32  (only with block maxima)
+    min doc length of every block  n x uint32  (only with block maxima)
+    blocks                         header byte, packed gaps, packed frequencies
+
+The header byte holds the gap width in the low nibble and the frequency width in
+the high nibble. The skip table in front of the blocks lets a reader jump to the
+block that may contain a given doc id without decoding the ones before it. The
+block maxima bound the BM25 score any posting of the block can reach (see
+wand.py); they are kept as raw frequencies and lengths rather than scores so the
+bounds stay valid whatever the collection statistics are at query time.
+
+A positional index (IndexEngine --positions) keeps the positions of every
+posting in a separate positions list, cut into the same blocks as the postings
+list so that a block's frequencies say where every posting's positions start:
+
+    end offset of every block      n x uint32, relative to the first block
+    blocks                         header byte, packed gaps
+
+The positions of a posting are stored as the first position followed by the
+gaps between positions, packed like the doc id gaps with the smallest byte width
+that fits the block's largest value (given by the header byte).
+
+The "raw" codec is the uncompressed layout of the first binary index (all doc ids
+followed by all frequencies as uint32) and is still readable.
+"""
+
+from array import array
+from itertools import accumulate
+from operator import sub
+
+BLOCK_SIZE = 128
+
+TYPECODES = {1: "B", 2: "H", 4: "I"}
+
+
+def byte_width(max_value):
+    if max_value < 1 << 8:
+        return 1
+    if max_value < 1 << 16:
+        return 2
+    return 4
+
+
+def encode_block(doc_ids, freqs, base):
+    gaps = array("I", [doc_ids[0] - base])
+    gaps.extend(b - a for a, b in zip(doc_ids, doc_ids[1:]))
+    gap_width = byte_width(max(gaps))
+    freq_width = byte_width(max(freqs))
+    return (
+        bytes([gap_width | (freq_width << 4)])
+        + array(TYPECODES[gap_width], gaps).tobytes()
+        + array(TYPECODES[freq_width], freqs).tobytes()
+    )
+
+
+def encode_postings(doc_ids, freqs, codec="packed", doc_lengths=None):
+    """Encode one postings list; doc_ids must be strictly increasing.
+
+    Block maxima are written to the skip table when doc_lengths is given.
+    """
+    if codec == "raw":
+        return array("I", doc_ids).tobytes() + array("I", freqs).tobytes()
+
+    last_docs = array("I")
+    end_offsets = array("I")
+    max_freqs = array("I")
+    min_lengths = array("I")
+    blocks = []
+    size = 0
+    base = 0
+    for start in range(0, len(doc_ids), BLOCK_SIZE):
+        block_docs = doc_ids[start : start + BLOCK_SIZE]
+        block_freqs = freqs[start : start + BLOCK_SIZE]
+        block = encode_block(block_docs, block_freqs, base)
+        blocks.append(block)
+        size += len(block)
+        base = block_docs[-1]
+        last_docs.append(base)
+        end_offsets.append(size)
+        if doc_lengths is not None:
+            max_freqs.append(max(block_freqs))
+            min_lengths.append(min(doc_lengths[doc_id] for doc_id in block_docs))
+    return (
+        last_docs.tobytes()
+        + end_offsets.tobytes()
+        + max_freqs.tobytes()
+        + min_lengths.tobytes()
+        + b"".join(blocks)
+    )
+
+
+def num_blocks(df):
+    return (df + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+
+def read_skip_table(data, offset, df, block_max=False):
+    """Return the skip table of a packed list as a tuple of arrays.
+
+    The tuple holds the last doc id and end offset of every block, followed by
+    the max frequency and min doc length of every block if block_max is set.
+    """
+    n = num_blocks(df)
+    skip_table = []
+    for i in range(4 if block_max else 2):
+        column = array("I")
+        column.frombytes(data[offset + 4 * n * i : offset + 4 * n * (i + 1)])
+        skip_table.append(column)
+    return tuple(skip_table)
+
+
+def decode_block(data, offset, df, skip_table, i):
+    """Decode block i of a packed list into (doc_ids, freqs)."""
+    last_docs, end_offsets = skip_table[:2]
+    n = len(last_docs)
+    start = offset + 4 * n * len(skip_table) + (end_offsets[i - 1] if i else 0)
+    count = min(BLOCK_SIZE, df - i * BLOCK_SIZE)
+    header = data[start]
+    gap_width = header & 0x0F
+    freq_width = header >> 4
+
+    pos = start + 1
+    gaps = array(TYPECODES[gap_width])
+    gaps.frombytes(data[pos : pos + count * gap_width])
+    pos += count * gap_width
+    freqs = array(TYPECODES[freq_width])
+    freqs.frombytes(data[pos : pos + count * freq_width])
+
+    doc_ids = accumulate(gaps, initial=last_docs[i - 1] if i else 0)
+    next(doc_ids)
+    return list(doc_ids), freqs.tolist()
+
+
+def decode_blocks(data, offset, df, codec="packed", block_max=False):
+    """Yield (doc_ids, freqs) one block at a time."""
+    if codec == "raw":
+        for start in range(0, df, BLOCK_SIZE):
+            count = min(BLOCK_SIZE, df - start)
+            doc_ids, freqs = array("I"), array("I")
+            pos = offset + 4 * start
+            doc_ids.frombytes(data[pos : pos + 4 * count])
+            pos = offset + 4 * (df + start)
+            freqs.frombytes(data[pos : pos + 4 * count])
+            yield doc_ids, freqs
+        return
+
+    skip_table = read_skip_table(data, offset, df, block_max)
+    for i in range(len(skip_table[0])):
+        yield decode_block(data, offset, df, skip_table, i)
+
+
+def encode_positions(freqs, positions):
+    """Encode the positions of one postings list.
+
+    positions holds the positions of every posting one after another, freqs[i]
+    of them for posting i, each posting's in increasing order.
+    """
+    end_offsets = array("I")
+    blocks = []
+    size = 0
+    pos = 0
+    for start in range(0, len(freqs), BLOCK_SIZE):
+        block_freqs = freqs[start : start + BLOCK_SIZE]
+        block_positions = positions[pos : pos + sum(block_freqs)]
+        pos += len(block_positions)
+        # gaps over the whole block, then the first of every posting made absolute
+        gaps = [block_positions[0]]
+        gaps.extend(map(sub, block_positions[1:], block_positions))
+        first = 0
+        for freq in block_freqs:
+            gaps[first] = block_positions[first]
+            first += freq
+        width = byte_width(max(gaps))
+        block = bytes([width]) + array(TYPECODES[width], gaps).tobytes()
+        blocks.append(block)
+        size += len(block)
+        end_offsets.append(size)
+    return end_offsets.tobytes() + b"".join(blocks)
+
+
+def read_position_offsets(data, offset, df):
+    """Return the end offset of every block of a positions list."""
+    end_offsets = array("I")
+    end_offsets.frombytes(data[offset : offset + 4 * num_blocks(df)])
+    return end_offsets
+
+
+def read_position_gaps(data, offset, end_offsets, block, count):
+    """Return the position gaps of a block, count being the sum of its freqs."""
+    start = offset + 4 * len(end_offsets) + (end_offsets[block - 1] if block else 0)
+    width = data[start]
+    gaps = array(TYPECODES[width])
+    gaps.frombytes(data[start + 1 : start + 1 + count * width])
+    return gaps
+
+
+def decode_block_positions(data, offset, end_offsets, block, freqs):
+    """Return the positions of every posting of a block, one list per posting."""
+    gaps = read_position_gaps(data, offset, end_offsets, block, sum(freqs))
+    positions = []
+    pos = 0
+    for freq in freqs:
+        positions.append(list(accumulate(gaps[pos : pos + freq])))
+        pos += freq
+    return positions
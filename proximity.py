@@ -0,0 +1,107 @@
+"""
+Phrase and proximity matching over the positions of a positional index.
+
+An index built with IndexEngine --positions stores the token positions of
+every posting (see postings_codec.py). Positions are only read for candidates
+that survived the doc-level intersection of the terms (see boolean_query.py):
+for every candidate the block holding it is found through the skip table, and
+only the candidate's own positions are decoded from it.
+
+Two matches are supported on the positions of the terms of a document:
+
+- a phrase matches where the terms occur one after another, in query order
+- within k matches where one occurrence of every term falls in a span of at
+  most k positions (last minus first), in any order
+
+The same matching applies to positions computed from the tokens of a document,
+which is how an index without positions checks phrases.
+
+Index size and build time with and without positions, and phrase latency
+against checking the documents:
+    python bench_positions.py latimes.gz queries.txt
+"""
+
+import heapq
+from itertools import accumulate
+from intersect import TermPostings, gallop, segment_candidates
+from postings_codec import read_position_gaps, read_position_offsets
+
+
+def is_phrase(position_lists):
+    """Return whether the terms occur one after another, the first one first."""
+    # the positions of the first term that the following terms keep in line
+    starts = set(position_lists[0])
+    for i, positions in enumerate(position_lists[1:], start=1):
+        starts.intersection_update([position - i for position in positions])
+        if not starts:
+            return False
+    return True
+
+
+def within(position_lists, k):
+    """Return whether an occurrence of every term falls in a span of k positions."""
+    # a window over the lists: the smallest current position moves forward
+    heap = [(positions[0], i, 0) for i, positions in enumerate(position_lists)]
+    heapq.heapify(heap)
+    last = max(position for position, _, _ in heap)
+    while True:
+        first, i, j = heapq.heappop(heap)
+        if last - first <= k:
+            return True
+        if j + 1 == len(position_lists[i]):
+            return False
+        position = position_lists[i][j + 1]
+        last = max(last, position)
+        heapq.heappush(heap, (position, i, j + 1))
+
+
+def matches(position_lists, k=None):
+    """Phrase match of the position lists, or within-k match if k is given."""
+    if not all(position_lists):
+        return False
+    if k is None:
+        return is_phrase(position_lists)
+    return within(position_lists, k)
+
+
+def candidate_positions(segment, term, record, candidates):
+    """Return the positions of term in each candidate, all of which contain it."""
+    postings = TermPostings(segment, term, record)
+    data = segment.positions_data
+    offset = segment.positions_offset(record)
+    end_offsets = read_position_offsets(data, offset, postings.df)
+    result = []
+    block = -1
+    pos = 0
+    for doc_id in candidates:
+        if block < 0 or doc_id > postings.last_docs[block]:
+            block = gallop(postings.last_docs, doc_id, block + 1)
+            postings.load(block)
+            # where the positions of every posting of the block start
+            starts = [0, *accumulate(postings.freqs)]
+            gaps = read_position_gaps(data, offset, end_offsets, block, starts[-1])
+            pos = 0
+        pos = gallop(postings.doc_ids, doc_id, pos)
+        result.append(list(accumulate(gaps[starts[pos] : starts[pos + 1]])))
+    return result
+
+
+def positional_filter(candidates, terms, index, k=None):
+    """Return the candidates in which terms form a phrase, or occur within k.
+
+    candidates are sorted global doc ids of documents that contain every term.
+    """
+    # a repeated term of a phrase has its positions decoded once
+    distinct = list(dict.fromkeys(terms))
+    if k is not None:
+        terms = distinct
+    result = []
+    for base, segment, local in segment_candidates(candidates, index):
+        positions = {}
+        for term in distinct:
+            record = segment.lookup(term)
+            positions[term] = candidate_positions(segment, term, record, local)
+        for j, doc_id in enumerate(local):
+            if matches([positions[term][j] for term in terms], k):
+                result.append(base + doc_id)
+    return result
@@ -1,10 +1,39 @@
+"""
+Query-biased snippets: the best scoring sentences of the TEXT of a document.
+
+A sentence scores 1 + the number of its tokens that are query terms + the
+number of distinct query terms in it + its longest run of consecutive query
+terms. The query is made a set once, and all the sentences of a document are
+scored in one scan of its tokens: the membership of every token is tested in
+C into a flag byte per token, the sentences with a match are found by searching
+the flags, and the runs of a sentence by splitting its flags. A sentence without
+a query term isn't visited at all.
+
+A snippet is the best sentence, or the n best windows of consecutive sentences
+that don't overlap, in document order. A window scores the matches and distinct
+query terms of all of its sentences and the longest run of any one of them.
+Ties go to the earlier window. The sentences come from the raw document, or
+from the sentence store of an index built with --sentences (see
+sentence_store.py).
+
+Benchmark (long queries and long documents, against sentence_score):
+    python bench_snippets.py storage
+"""
+
 import re
-from IndexEngine import Tokenize
+from bisect import bisect_right
+from tokenizer import Tokenize
+
+# the end of a sentence is checked first: most positions fail it, and the
+# lookbehinds for abbreviations only run after ., ? and !
+SENTENCE_END = re.compile(r"(?<=[.?!])(?<!\w\.\w.)(?<![A-Z][a-z]\.)\s")
+
+TAG = re.compile(r"<[^>]+>")
 
 
 def clean_text(text):
-    text = re.sub(r"<[^>]+>", " ", text)
-    return re.sub(r"\s+", " ", text).strip()
+    # str.split splits on the same whitespace as \s+ and drops it at both ends
+    return " ".join(TAG.sub(" ", text).split())
 
 
 def extract_text_tag(doc_text):
@@ -15,6 +44,11 @@ def extract_text_tag(doc_text):
 
 
 def sentence_score(sentence_tokens, query_tokens):
+    """Score one sentence token by token, the scorer snippets started with.
+
+    query_tokens is searched for every token, which a list makes O(|query|).
+    Kept as the reference for bench_snippets.py.
+    """
     run = 0
     max_run = 0
     unique_words = set()
@@ -42,23 +76,98 @@ def sentence_score(sentence_tokens, query_tokens):
     return score
 
 
-def generate_query_biased_snippet(doc_text, query_tokens):
+def split_sentences(doc_text):
+    """Return the cleaned sentences of the TEXT of a raw document.
+
+    A document without a TEXT has no sentences.
+    """
     text_content = extract_text_tag(doc_text)
     if not text_content:
-        return "No relevant content found."
+        return []
+    return [
+        sentence.strip() for sentence in SENTENCE_END.split(clean_text(text_content))
+    ]
+
 
-    clean_doc_text = clean_text(text_content)
+def sentence_stats(tokens, token_ends, query):
+    """Return (matches, matched terms, longest run) of every sentence.
 
-    sentences = re.split(r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|!)\s", clean_doc_text)
+    tokens are the tokens (or term ids) of all the sentences one after another,
+    token_ends where every sentence ends in them, and query a set.
+    """
+    flags = bytes(map(query.__contains__, tokens))
+    stats = [(0, (), 0)] * len(token_ends)
+    # only the sentences with a match are visited, found from their first match
+    match = flags.find(1)
+    while match >= 0:
+        i = bisect_right(token_ends, match)
+        start = token_ends[i - 1] if i else 0
+        end = token_ends[i]
+        sentence_flags = flags[start:end]
+        terms = query.intersection(tokens[start:end])
+        run = max(map(len, sentence_flags.split(b"\0")))
+        stats[i] = (sentence_flags.count(1), terms, run)
+        match = flags.find(1, end)
+    return stats
 
-    scored_sentences = []
+
+def window_scores(stats, window=1):
+    """Return the score of every window of window consecutive sentences."""
+    if window == 1:
+        return [1 + matches + len(terms) + run for matches, terms, run in stats]
+    scores = []
+    # a document shorter than a window is a single window
+    for start in range(max(len(stats) - window + 1, 1)):
+        part = stats[start : start + window]
+        terms = set().union(*(terms for _, terms, _ in part))
+        matches = sum(matches for matches, _, _ in part)
+        run = max(run for _, _, run in part)
+        scores.append(1 + matches + len(terms) + run)
+    return scores
+
+
+def best_windows(scores, n=1, window=1):
+    """Return the starts of the n best windows that don't overlap, in order."""
+    chosen = []
+    # sorted() is stable, so equal scores keep the earlier window first
+    for start in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        if all(abs(start - other) >= window for other in chosen):
+            chosen.append(start)
+            if len(chosen) == n:
+                break
+    return sorted(chosen)
+
+
+def snippet(sentences, tokens, token_ends, query, n=1, window=1):
+    """Return the n best windows of sentences joined by " ... "."""
+    if not len(sentences):
+        return "No relevant content found."
+    scores = window_scores(sentence_stats(tokens, token_ends, query), window)
+    return " ... ".join(
+        " ".join(
+            sentences[i] for i in range(start, min(start + window, len(sentences)))
+        )
+        for start in best_windows(scores, n, window)
+    )
+
+
+def generate_query_biased_snippet(doc_text, query_tokens, n=1, window=1):
+    sentences = split_sentences(doc_text)
+    tokens = []
+    token_ends = []
     for sentence in sentences:
-        tokens = []
         Tokenize(sentence, tokens)
-        score = sentence_score(tokens, query_tokens)
-        scored_sentences.append((score, sentence.strip()))
+        token_ends.append(len(tokens))
+    return snippet(sentences, tokens, token_ends, set(query_tokens), n, window)
+
+
+def stored_snippet(sentences, query_tokens, n=1, window=1):
+    """generate_query_biased_snippet over the sentences of a sentence store.
 
-    best_sentence = max(
-        scored_sentences, key=lambda x: x[0], default=(0, "No relevant sentence")
-    )[1]
-    return best_sentence
+    The query tokens become the document's term ids, and the stored token ids
+    are scored (see sentence_store.py).
+    """
+    query = sentences.term_ids(query_tokens)
+    return snippet(
+        sentences, sentences.token_ids, sentences.token_ends, query, n, window
+    )
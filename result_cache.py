@@ -0,0 +1,136 @@
+"""
+Cache of top-k BM25 results for repeated queries.
+
+Query streams are skewed towards a small set of head queries, which are
+answered from the cache instead of being scored again. An entry is keyed on
+the normalized query, the list of terms looked up in the index (after
+tokenizing and, for a stemmed index, stemming), and on k, and holds the ranked
+doc ids and scores in two compact arrays. The terms are not sorted: BM25 sums
+the term scores in query order, so a reordered query can differ in the last
+bit of a score and be ranked differently on a near tie.
+
+Entries are evicted least recently used first once the cache holds more than
+max_bytes (an estimate of the memory the entries take), and expire ttl
+seconds after they were computed. All entries are dropped when the index
+version changes (see segments.index_version), i.e. after an append, merge,
+deletion or compaction. The cache is safe to share between threads.
+
+Benchmark (replay of a Zipfian query log):
+    python bench_cache.py storage queries.txt
+"""
+
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# dict slot, OrderedDict links and entry tuple of every entry, roughly
+ENTRY_OVERHEAD = 200
+
+
+def cache_key(query_terms, k):
+    return tuple(query_terms), k
+
+
+def entry_size(key, doc_ids, scores):
+    terms, _ = key
+    return (
+        ENTRY_OVERHEAD
+        + sys.getsizeof(terms)
+        + sum(sys.getsizeof(term) for term in terms)
+        + sys.getsizeof(doc_ids)
+        + sys.getsizeof(scores)
+    )
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        # the entries were computed on another version of the index
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.bytes = 0
+            self.version = version
+
+    def get(self, key, version=None):
+        """Return the cached [(doc_id, score), ...] for key, or None."""
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None:
+                if time.monotonic() - entry[0] > self.ttl:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        _, doc_ids, scores, _ = entry
+        return list(zip(doc_ids, scores))
+
+    def put(self, key, ranked, version=None):
+        doc_ids = array("I", [doc_id for doc_id, _ in ranked])
+        scores = array("d", [score for _, score in ranked])
+        size = entry_size(key, doc_ids, scores)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            # results computed on an index that has changed since aren't kept
+            if version != self.version:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic(), doc_ids, scores, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[3]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def cached_top_k(cache, version, query_terms, k, compute):
+    """Return compute() for the query, from the cache when possible.
+
+    compute returns the ranked [(doc_id, score), ...] of the query; version is
+    the index version the results are computed on.
+    """
+    key = cache_key(query_terms, k)
+    ranked = cache.get(key, version)
+    if ranked is None:
+        ranked = compute()
+        cache.put(key, ranked, version)
+    return ranked
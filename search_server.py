@@ -0,0 +1,384 @@
+"""
+Long-running HTTP/JSON search service over an index built by IndexEngine.
+
+The index, document store and metadata table are opened once and shared by
+all requests, which are served concurrently by a ThreadingHTTPServer. Queries
+run in a pool of --max-concurrent threads:
+
+- a request that doesn't get a slot within --queue-timeout seconds is answered
+  with 503
+- a request whose work takes longer than --timeout seconds is answered with
+  504; the work itself can't be interrupted, so it keeps its slot until it ends
+
+When the index changes on disk (a segment is appended or merged, documents are
+deleted or compacted), the next request reopens it. With --merge-interval the
+server also runs the segment merge policy itself (see segments.py).
+
+Search results are kept in a result cache of --cache-mb megabytes (see
+result_cache.py), optionally expiring after --cache-ttl seconds; it is emptied
+when the index is reopened.
+
+Endpoints (GET, JSON responses):
+    /search?q=<query>[&k=10][&snippets=1]     ranked DOCNOs with headline, date
+                                              and optionally a snippet
+    /snippet?q=<query>&docno=<DOCNO>          query-biased snippet of a document
+        [&n=1][&window=1]                     (or &id=<internal id>): the n best
+                                              windows of that many sentences
+    /doc?docno=<DOCNO>                        metadata and raw text of a document
+                                              (or &id=<internal id>)
+    /stats                                    result cache counters
+
+Usage:
+    python search_server.py <index_dir> [--host HOST] [--port PORT]
+        [--max-concurrent N] [--timeout S] [--queue-timeout S] [--merge-interval S]
+        [--cache-mb MB] [--cache-ttl S]
+
+Example:
+    python search_server.py storage --port 8080
+    curl 'http://127.0.0.1:8080/search?q=police+officers&snippets=1'
+
+Load test (throughput and tail latency):
+    python bench_server.py http://127.0.0.1:8080 queries.txt
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from bm25 import Tokenize, query_terms
+from GetDoc import DocumentLookup
+from interactive_bm25 import load_metadata
+from query_biased_summary import generate_query_biased_snippet, stored_snippet
+from result_cache import ResultCache, cached_top_k
+from segments import (
+    BackgroundMerger,
+    index_version,
+    open_doc_store,
+    open_index,
+    open_sentence_store,
+)
+from sentence_store import has_sentences
+from wand import top_k_bm25
+
+MAX_K = 1000
+MAX_SNIPPET = 20
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SearchIndex:
+    """Everything a request reads, opened together so a reopen swaps all of it."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.version = index_version(index_dir)
+        self.index = open_index(index_dir)
+        # read now: a merge may remove the files of an unmerged segment later
+        self.doc_lengths = self.index.doc_lengths
+        with open(os.path.join(index_dir, "docno_list.txt"), "r") as f:
+            self.docno_list = [line.strip() for line in f.readlines()]
+        self.doc_store = open_doc_store(index_dir)
+        # snippets of an index built without --sentences parse the documents
+        self.sentence_store = None
+        if has_sentences(index_dir):
+            self.sentence_store = open_sentence_store(index_dir)
+        # maps DOCNOs and ids through the metadata table, if the index has one
+        self.lookup = DocumentLookup(index_dir)
+        self.metadata_table = self.lookup.table
+
+
+class SearchService:
+    def __init__(
+        self,
+        index_dir,
+        max_concurrent=4,
+        timeout=10.0,
+        queue_timeout=1.0,
+        cache=None,
+    ):
+        self.index_dir = index_dir
+        self.cache = cache
+        self.current = SearchIndex(index_dir)
+        self.reopen_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+
+    def snapshot(self):
+        """Return the open index, reopened first if it changed on disk."""
+        current = self.current
+        if index_version(self.index_dir) != current.version:
+            # one request reopens, the others go on with the open index
+            if self.reopen_lock.acquire(blocking=False):
+                try:
+                    self.current = current = SearchIndex(self.index_dir)
+                except FileNotFoundError:
+                    # a merge removed a segment while it was opened; retried next time
+                    pass
+                finally:
+                    self.reopen_lock.release()
+        return current
+
+    def run(self, handler, params):
+        """Run handler(params) in the pool, within the limit and the timeout."""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise ServiceError(503, "too many concurrent requests")
+        try:
+            future = self.pool.submit(handler, self, params)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ServiceError(504, f"request took longer than {self.timeout} s")
+
+    def search(self, params):
+        query = required(params, "q")
+        k = int_param(params, "k", 10)
+        if not 1 <= k <= MAX_K:
+            raise ServiceError(400, f"k must be between 1 and {MAX_K}")
+        data = self.snapshot()
+
+        start = time.perf_counter()
+        query_tokens = []
+        Tokenize(query, query_tokens)
+        ranked = self.top_k(data, query_terms(query_tokens, data.index), k)
+        results = []
+        for rank, (doc_id, score) in enumerate(ranked, start=1):
+            docno = data.docno_list[doc_id]
+            metadata = load_metadata(data.index_dir, docno, doc_id, data.metadata_table)
+            result = {
+                "rank": rank,
+                "docno": docno,
+                "id": doc_id,
+                "score": score,
+                "headline": metadata["headline"],
+                "date": metadata["date"],
+            }
+            if params.get("snippets") == "1":
+                result["snippet"] = document_snippet(data, doc_id, query_tokens)
+            results.append(result)
+        return {
+            "query": query,
+            "results": results,
+            "took_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def top_k(self, data, terms, k):
+        def compute():
+            return top_k_bm25(
+                terms,
+                data.index,
+                data.doc_lengths,
+                data.docno_list,
+                data.index.avg_doc_length,
+                k=k,
+            )
+
+        if self.cache is None:
+            return compute()
+        return cached_top_k(self.cache, data.version, terms, k, compute)
+
+    def stats(self, params):
+        return {"cache": self.cache.stats() if self.cache is not None else None}
+
+    def snippet(self, params):
+        query = required(params, "q")
+        data = self.snapshot()
+        doc_id, docno = document_id(data, params)
+        n = int_param(params, "n", 1)
+        window = int_param(params, "window", 1)
+        if not (1 <= n <= MAX_SNIPPET and 1 <= window <= MAX_SNIPPET):
+            raise ServiceError(400, f"n and window must be between 1 and {MAX_SNIPPET}")
+        query_tokens = []
+        Tokenize(query, query_tokens)
+        return {
+            "docno": docno,
+            "id": doc_id,
+            "snippet": document_snippet(data, doc_id, query_tokens, n, window),
+        }
+
+    def document(self, params):
+        data = self.snapshot()
+        doc_id, docno = document_id(data, params)
+        doc_text = data.doc_store.get(doc_id)
+        if doc_text is None:
+            raise ServiceError(404, f"document {docno} not found in the store")
+        metadata = load_metadata(data.index_dir, docno, doc_id, data.metadata_table)
+        return {
+            "docno": docno,
+            "id": doc_id,
+            "headline": metadata["headline"],
+            "date": metadata["date"],
+            "text": doc_text,
+        }
+
+
+def required(params, name):
+    value = params.get(name, "").strip()
+    if not value:
+        raise ServiceError(400, f"missing parameter '{name}'")
+    return value
+
+
+def int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise ServiceError(400, f"parameter '{name}' must be an integer")
+
+
+def document_id(data, params):
+    """Return the internal id and DOCNO named by the docno or id parameter."""
+    if "docno" in params:
+        docno = params["docno"]
+        doc_id = data.lookup.doc_id(docno)
+    else:
+        doc_id = int_param(params, "id", -1)
+        docno = data.lookup.docno(doc_id)
+    if doc_id is None or docno is None:
+        raise ServiceError(404, "document not found")
+    return doc_id, docno
+
+
+def document_snippet(data, doc_id, query_tokens, n=1, window=1):
+    if data.sentence_store is not None:
+        sentences = data.sentence_store.get(doc_id)
+        if sentences is None:
+            return ""
+        return stored_snippet(sentences, query_tokens, n, window)
+    doc_text = data.doc_store.get(doc_id)
+    if doc_text is None:
+        return ""
+    return generate_query_biased_snippet(doc_text, query_tokens, n, window)
+
+
+ROUTES = {
+    "/search": SearchService.search,
+    "/snippet": SearchService.snippet,
+    "/doc": SearchService.document,
+    "/stats": SearchService.stats,
+}
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            handler = ROUTES.get(url.path)
+            if handler is None:
+                raise ServiceError(404, f"unknown endpoint {url.path}")
+            status, body = 200, self.server.service.run(handler, params)
+        except ServiceError as e:
+            status, body = e.status, {"error": e.message}
+        except Exception as e:
+            traceback.print_exc()
+            status, body = 500, {"error": str(e)}
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # one line per request would slow the server down under load
+        pass
+
+
+class SearchServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+    def __init__(self, address, service):
+        super().__init__(address, SearchHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve BM25 search over an index as HTTP/JSON."
+    )
+    parser.add_argument("index_dir", help="output directory of IndexEngine")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=4,
+        help="number of requests worked on at the same time",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="seconds after which a request is answered with 504",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=1.0,
+        help="seconds a request waits for a free slot before a 503",
+    )
+    parser.add_argument(
+        "--merge-interval",
+        type=float,
+        help="apply the segment merge policy every this many seconds",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=float,
+        default=64,
+        help="memory bound of the result cache, 0 to disable it",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        help="seconds after which a cached result expires",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index_dir):
+        print(f"Error: Index directory '{args.index_dir}' does not exist.")
+        sys.exit(1)
+
+    print(f"Loading {args.index_dir}...")
+    cache = None
+    if args.cache_mb > 0:
+        cache = ResultCache(int(args.cache_mb * 1024 * 1024), args.cache_ttl)
+    service = SearchService(
+        args.index_dir, args.max_concurrent, args.timeout, args.queue_timeout, cache
+    )
+    # a client that stops sending doesn't hold a thread forever
+    SearchHandler.timeout = args.timeout
+    if args.merge_interval:
+        BackgroundMerger(args.index_dir, args.merge_interval).start()
+
+    server = SearchServer((args.host, args.port), service)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
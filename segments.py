@@ -0,0 +1,465 @@
+"""
+Incremental indexing with index segments.
+
+IndexEngine --append indexes a new batch of documents into a segment of its own
+(segments/seg-NNNN/, with its own lexicon, postings, document lengths and
+document store) instead of rebuilding the whole index. The documents of a
+segment get the internal ids following those already in the index, and their
+DOCNOs and lengths are appended to docno_list.txt and doc-lengths.txt, so ids
+stay global. Inside a segment, postings use local doc ids starting at 0; the
+segment's base id is added when the segment is read.
+
+segments.json lists the segments in id order with their base id and size. The
+index directory itself is the first segment, with base id 0.
+
+SegmentedIndex presents all segments as one index with global BM25 statistics:
+N and the average doc length over all segments, and df summed over segments.
+
+Small segments are merged by a log-structured policy: whenever MERGE_FACTOR
+adjacent segments have the same size level (log base MERGE_FACTOR of their
+number of documents), they are merged into one. Merges run in the background,
+either in the process started by IndexEngine --append or in a BackgroundMerger
+thread of a long-running process, so appends and queries don't wait for them.
+
+Usage:
+    python segments.py merge <index_dir>
+"""
+
+import fcntl
+import heapq
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import groupby, repeat
+from binary_index import (
+    DELETED_FILE,
+    META_FILE,
+    BinaryIndex,
+    read_deleted,
+    write_index,
+)
+from doc_store import DocStore, DocStoreWriter
+from metadata_table import MetadataTable, MetadataTableWriter, has_table
+from postings_codec import decode_block_positions, decode_blocks, read_position_offsets
+from sentence_store import SentenceStore, SentenceStoreWriter, has_sentences
+
+MANIFEST_FILE = "segments.json"
+SEGMENTS_DIR = "segments"
+LOCK_FILE = "segments.lock"
+MERGE_LOCK_FILE = "merge.lock"
+MERGE_FACTOR = 4
+
+
+@contextmanager
+def locked(index_dir, lock_name=LOCK_FILE, blocking=True):
+    """Hold an exclusive lock on index_dir; yields False if not blocking and busy."""
+    with open(os.path.join(index_dir, lock_name), "w") as lock:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"next_segment": 1, "segments": []}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(index_dir, manifest):
+    # readers see either the old or the new manifest, never a partial one
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def segment_path(index_dir, name):
+    return os.path.join(index_dir, SEGMENTS_DIR, name)
+
+
+def next_doc_id(index_dir, manifest):
+    root = BinaryIndex(index_dir)
+    return root.meta["num_docs"] + sum(seg["num_docs"] for seg in manifest["segments"])
+
+
+def new_segment(index_dir, manifest):
+    """Reserve the name of the next segment and create its directory."""
+    name = f"seg-{manifest['next_segment']:04d}"
+    manifest["next_segment"] += 1
+    os.makedirs(segment_path(index_dir, name), exist_ok=True)
+    return name
+
+
+class SegmentedIndex:
+    """Read-only view of an index directory and all of its segments."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.manifest = load_manifest(index_dir)
+        self.segments = [(0, BinaryIndex(index_dir))]
+        for seg in self.manifest["segments"]:
+            path = segment_path(index_dir, seg["name"])
+            self.segments.append((seg["base"], BinaryIndex(path)))
+        self.total_docs = sum(index.total_docs for _, index in self.segments)
+        total_length = sum(index.meta["total_length"] for _, index in self.segments)
+        self.avg_doc_length = total_length / self.total_docs if self.total_docs else 0.0
+        self.block_max = all(index.block_max for _, index in self.segments)
+        self.positional = all(index.positional for _, index in self.segments)
+        self.stemmed = self.segments[0][1].stemmed
+        # tombstones are kept by global doc id in the top-level directory
+        self.deleted = self.segments[0][1].deleted
+        self._doc_lengths = None
+
+    @property
+    def doc_lengths(self):
+        if self._doc_lengths is None:
+            lengths = array("I")
+            for _, index in self.segments:
+                lengths.extend(index.doc_lengths)
+            self._doc_lengths = lengths
+        return self._doc_lengths
+
+    def __contains__(self, term):
+        return any(term in index for _, index in self.segments)
+
+    def doc_freq(self, term):
+        return sum(index.doc_freq(term) for _, index in self.segments)
+
+    def blocks(self, term):
+        """Yield the postings of term with global doc ids, one block at a time."""
+        for base, index in self.segments:
+            for doc_ids, freqs in index.blocks(term):
+                if base:
+                    doc_ids = [doc_id + base for doc_id in doc_ids]
+                yield doc_ids, freqs
+
+    def postings(self, term):
+        doc_ids, freqs = array("I"), array("I")
+        for block_docs, block_freqs in self.blocks(term):
+            doc_ids.extend(block_docs)
+            freqs.extend(block_freqs)
+        return doc_ids, freqs
+
+
+class SegmentedDocStore:
+    """Documents, or with open_store=MetadataTable metadata, of all segments."""
+
+    def __init__(self, index_dir, open_store=DocStore):
+        manifest = load_manifest(index_dir)
+        self.stores = [(0, open_store(index_dir))]
+        for seg in manifest["segments"]:
+            path = segment_path(index_dir, seg["name"])
+            self.stores.append((seg["base"], open_store(path)))
+
+    def __len__(self):
+        return sum(len(store) for _, store in self.stores)
+
+    def get(self, doc_id):
+        for base, store in reversed(self.stores):
+            if doc_id >= base:
+                return store.get(doc_id - base)
+        return None
+
+    def get_many(self, doc_ids):
+        """Yield (doc_id, document) for increasing doc ids, see DocStore.get_many."""
+        doc_ids = list(doc_ids)
+        for i, (base, store) in enumerate(self.stores):
+            lo = bisect_left(doc_ids, base)
+            hi = len(doc_ids)
+            if i + 1 < len(self.stores):
+                hi = bisect_left(doc_ids, self.stores[i + 1][0], lo)
+            local = [doc_id - base for doc_id in doc_ids[lo:hi]]
+            for doc_id, doc in store.get_many(local):
+                yield base + doc_id, doc
+
+
+class SegmentedMetadataTable(SegmentedDocStore):
+    def __init__(self, index_dir):
+        super().__init__(index_dir, MetadataTable)
+
+    def doc_id(self, docno):
+        # an updated document's newest version is in the last segment holding it
+        for base, table in reversed(self.stores):
+            doc_id = table.doc_id(docno)
+            if doc_id is not None:
+                return base + doc_id
+        return None
+
+
+def index_version(index_dir):
+    """Return a value that changes whenever the index is modified.
+
+    Appends and merges rewrite the manifest, deletions the tombstones and
+    compaction the index meta file, so their modification times are enough.
+    """
+    versions = []
+    for name in (MANIFEST_FILE, DELETED_FILE, META_FILE):
+        try:
+            versions.append(os.stat(os.path.join(index_dir, name)).st_mtime_ns)
+        except FileNotFoundError:
+            versions.append(None)
+    return tuple(versions)
+
+
+def has_segments(index_dir):
+    return bool(load_manifest(index_dir)["segments"])
+
+
+def open_index(index_dir):
+    """Open an index directory, with its segments if it has any."""
+    if has_segments(index_dir):
+        return SegmentedIndex(index_dir)
+    return BinaryIndex(index_dir)
+
+
+def open_doc_store(index_dir):
+    if has_segments(index_dir):
+        return SegmentedDocStore(index_dir)
+    return DocStore(index_dir)
+
+
+def open_sentence_store(index_dir):
+    if has_segments(index_dir):
+        return SegmentedDocStore(index_dir, SentenceStore)
+    return SentenceStore(index_dir)
+
+
+def open_metadata_table(index_dir):
+    if has_segments(index_dir):
+        return SegmentedMetadataTable(index_dir)
+    return MetadataTable(index_dir)
+
+
+def size_level(num_docs):
+    return int(math.log(max(num_docs, 1), MERGE_FACTOR))
+
+
+def find_merge(segments):
+    """Return the first run of MERGE_FACTOR adjacent segments of the same level."""
+    for start in range(len(segments) - MERGE_FACTOR + 1):
+        window = segments[start : start + MERGE_FACTOR]
+        levels = {size_level(seg["num_docs"]) for seg in window}
+        if len(levels) == 1:
+            return window
+    return None
+
+
+def tagged_items(index, i):
+    for term, record in index.items():
+        yield term, i, record
+
+
+def merged_postings(parts, lexicon, deleted=frozenset(), positional=False):
+    """Yield the postings lists of several indexes as one, for write_index.
+
+    parts is a list of (doc id offset, BinaryIndex) in doc id order. Postings of
+    deleted doc ids (after the offset) are dropped, and so are terms left
+    without postings. Term ids are assigned to lexicon in term order. With
+    positional, the positions of the postings are merged too.
+    """
+    # items() is sorted by term, so the terms of all parts merge in order
+    merged = heapq.merge(
+        *(tagged_items(index, i) for i, (_, index) in enumerate(parts))
+    )
+    for term, entries in groupby(merged, key=lambda entry: entry[0]):
+        doc_ids, freqs, positions = array("I"), array("I"), array("I")
+        for _, i, record in entries:
+            offset, index = parts[i]
+            for block_docs, block_freqs, block_positions in index_blocks(
+                index, record, positional
+            ):
+                for doc_id, freq, where in zip(
+                    block_docs, block_freqs, block_positions
+                ):
+                    if doc_id + offset not in deleted:
+                        doc_ids.append(doc_id + offset)
+                        freqs.append(freq)
+                        positions.extend(where)
+        if doc_ids:
+            tid = lexicon[term] = len(lexicon)
+            if positional:
+                yield tid, doc_ids, freqs, positions
+            else:
+                yield tid, doc_ids, freqs
+
+
+def index_blocks(index, record, positional=False):
+    """Yield (doc_ids, freqs, positions) for every block of a term record.
+
+    positions has a list of positions per posting, or is empty if not positional.
+    """
+    df, offset = record[3], record[4]
+    blocks = decode_blocks(
+        index.postings_data, offset, df, index.codec, index.block_max
+    )
+    if not positional:
+        for doc_ids, freqs in blocks:
+            yield doc_ids, freqs, repeat(())
+        return
+    positions_offset = index.positions_offset(record)
+    end_offsets = read_position_offsets(index.positions_data, positions_offset, df)
+    for block, (doc_ids, freqs) in enumerate(blocks):
+        yield doc_ids, freqs, decode_block_positions(
+            index.positions_data, positions_offset, end_offsets, block, freqs
+        )
+
+
+def local_deleted(deleted, base, num_docs):
+    return frozenset(
+        doc_id - base for doc_id in deleted if base <= doc_id < base + num_docs
+    )
+
+
+def merge_segments(index_dir, to_merge, name):
+    """Write the adjacent segments to_merge as one segment called name.
+
+    Postings of documents deleted so far are purged from the new segment.
+    """
+    base = to_merge[0]["base"]
+    num_docs = sum(seg["num_docs"] for seg in to_merge)
+    paths = [segment_path(index_dir, seg["name"]) for seg in to_merge]
+    parts = [
+        (seg["base"] - base, BinaryIndex(path)) for seg, path in zip(to_merge, paths)
+    ]
+    output_dir = segment_path(index_dir, name)
+
+    # purged documents keep their doc ids, so the doc store and table keep them too
+    copy_doc_stores(paths, output_dir)
+    if all(has_sentences(path) for path in paths):
+        copy_doc_stores(paths, output_dir, SentenceStore, SentenceStoreWriter)
+    # segments written before the metadata table have none
+    if all(has_table(path) for path in paths):
+        copy_tables(paths, output_dir)
+    doc_lengths = array("I")
+    for _, index in parts:
+        doc_lengths.extend(index.doc_lengths)
+
+    deleted = local_deleted(read_deleted(index_dir), base, num_docs)
+    lexicon = {}
+    positional = all(index.positional for _, index in parts)
+    postings_lists = merged_postings(parts, lexicon, deleted, positional)
+    write_index(
+        output_dir,
+        lexicon,
+        postings_lists,
+        doc_lengths,
+        deleted=deleted,
+        stemmed=parts[0][1].stemmed,
+        positional=positional,
+    )
+
+
+def copy_doc_stores(paths, output_dir, open_store=DocStore, writer=DocStoreWriter):
+    doc_store = writer(output_dir)
+    for path in paths:
+        for data in open_store(path).records():
+            doc_store.add_record(data)
+    doc_store.close()
+
+
+def copy_tables(paths, output_dir):
+    writer = MetadataTableWriter(output_dir)
+    for path in paths:
+        table = MetadataTable(path)
+        for doc_id in range(len(table)):
+            writer.add(
+                table.docno(doc_id),
+                table.dates[doc_id],
+                table.headline(doc_id),
+                table.length(doc_id),
+            )
+    writer.close()
+
+
+def apply_merge_policy(index_dir):
+    """Merge segments until the policy finds nothing to merge.
+
+    Only one merge runs at a time; returns without merging if another process
+    or thread is already merging.
+    """
+    with locked(index_dir, MERGE_LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            return
+        while True:
+            with locked(index_dir):
+                manifest = load_manifest(index_dir)
+                to_merge = find_merge(manifest["segments"])
+                if to_merge is None:
+                    return
+                name = new_segment(index_dir, manifest)
+                save_manifest(index_dir, manifest)
+
+            # appends only add segments at the end and no other merge runs, so
+            # the segments being merged stay in place while this runs unlocked
+            try:
+                merge_segments(index_dir, to_merge, name)
+            except BaseException:
+                shutil.rmtree(segment_path(index_dir, name), ignore_errors=True)
+                raise
+
+            with locked(index_dir):
+                manifest = load_manifest(index_dir)
+                names = [seg["name"] for seg in to_merge]
+                start = [seg["name"] for seg in manifest["segments"]].index(names[0])
+                manifest["segments"][start : start + len(names)] = [
+                    {
+                        "name": name,
+                        "base": to_merge[0]["base"],
+                        "num_docs": sum(seg["num_docs"] for seg in to_merge),
+                    }
+                ]
+                save_manifest(index_dir, manifest)
+            for old_name in names:
+                shutil.rmtree(segment_path(index_dir, old_name))
+
+
+def start_background_merge(index_dir):
+    """Apply the merge policy in a detached process."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "segments.py")
+    subprocess.Popen(
+        [sys.executable, script, "merge", index_dir],
+        start_new_session=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class BackgroundMerger(threading.Thread):
+    """Periodically applies the merge policy from a long-running process."""
+
+    def __init__(self, index_dir, interval=60):
+        super().__init__(daemon=True)
+        self.index_dir = index_dir
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            apply_merge_policy(self.index_dir)
+
+    def stop(self):
+        self.stopped.set()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "merge":
+        print("Usage: python segments.py merge <index_dir>")
+        sys.exit(1)
+
+    apply_merge_policy(sys.argv[2])
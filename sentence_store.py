@@ -0,0 +1,121 @@
+"""
+Sentences of every document, precomputed for query-biased snippets.
+
+A snippet (see query_biased_summary.py) is the best scoring sentence of the TEXT
+of a document. Finding the sentences takes a regex over the raw document, a
+cleanup, a sentence split and a Tokenize pass over every sentence; IndexEngine
+--sentences does that once per document and stores the result here, so
+rendering a result only scores stored token ids.
+
+The record of a document:
+
+    header           4 x uint32: number of sentences, number of tokens, number
+                     of terms and the byte width of the token ids
+    sentence ends    num_sentences x uint32, character offsets into the text
+    token ends       num_sentences x uint32, offsets into the token ids
+    token ids        num_tokens ids into the terms, packed with the byte width
+    text             the cleaned sentences one after another, UTF-8
+    terms            the distinct tokens of the document, space separated, UTF-8
+
+Token ids are local to the document, so records are copied unchanged when
+segments are merged. The records are kept like the raw documents in
+sentences.bin with their offsets in sentences.idx (see doc_store.py), but
+zlib-compressed one by one: a result's snippet then decompresses its own record
+only, not a block of other documents. Indexes built without --sentences have
+no sentences-meta.json; their snippets are computed from the raw documents.
+"""
+
+import os
+from array import array
+from itertools import accumulate
+from doc_store import DocStore, DocStoreWriter
+from postings_codec import TYPECODES, byte_width
+from query_biased_summary import split_sentences
+from tokenizer import Tokenize
+
+SENTENCES_FILE = "sentences.bin"
+SENTENCES_INDEX_FILE = "sentences.idx"
+SENTENCES_META_FILE = "sentences-meta.json"
+
+HEADER_BYTES = 16
+
+
+def has_sentences(index_dir):
+    return os.path.exists(os.path.join(index_dir, SENTENCES_META_FILE))
+
+
+def sentence_record(doc_text):
+    """Return the record of the sentences of a raw document."""
+    sentences = split_sentences(doc_text)
+    tokens = []
+    token_ends = array("I")
+    for sentence in sentences:
+        Tokenize(sentence, tokens)
+        token_ends.append(len(tokens))
+    # ids in order of first occurrence, assigned in C
+    terms = dict.fromkeys(tokens)
+    ids = {term: i for i, term in enumerate(terms)}
+    width = byte_width(len(terms))
+    header = array("I", [len(sentences), len(tokens), len(terms), width])
+    return b"".join(
+        [
+            header.tobytes(),
+            array("I", accumulate(map(len, sentences))).tobytes(),
+            token_ends.tobytes(),
+            array(TYPECODES[width], map(ids.__getitem__, tokens)).tobytes(),
+            "".join(sentences).encode("utf-8"),
+            " ".join(terms).encode("utf-8"),
+        ]
+    )
+
+
+class DocumentSentences:
+    """The decoded record of a document."""
+
+    def __init__(self, data):
+        header = array("I")
+        header.frombytes(data[:HEADER_BYTES])
+        num_sentences, num_tokens, num_terms, width = header
+        pos = HEADER_BYTES
+        self.sentence_ends = array("I")
+        self.sentence_ends.frombytes(data[pos : pos + 4 * num_sentences])
+        pos += 4 * num_sentences
+        self.token_ends = array("I")
+        self.token_ends.frombytes(data[pos : pos + 4 * num_sentences])
+        pos += 4 * num_sentences
+        self.token_ids = array(TYPECODES[width])
+        self.token_ids.frombytes(data[pos : pos + width * num_tokens])
+        pos += width * num_tokens
+        text = bytes(data[pos:]).decode("utf-8")
+        # the terms follow the text; the text's length is its last sentence end
+        split = self.sentence_ends[-1] if num_sentences else 0
+        self.text = text[:split]
+        self.terms = text[split:].split(" ") if num_terms else []
+
+    def __len__(self):
+        return len(self.sentence_ends)
+
+    def __getitem__(self, i):
+        return self.text[self.sentence_ends[i - 1] if i else 0 : self.sentence_ends[i]]
+
+    def term_ids(self, tokens):
+        """Return the set of the ids of the tokens that occur in the document."""
+        tokens = set(tokens)
+        return {i for i, term in enumerate(self.terms) if term in tokens}
+
+
+class SentenceStoreWriter(DocStoreWriter):
+    files = (SENTENCES_FILE, SENTENCES_INDEX_FILE, SENTENCES_META_FILE)
+
+    def __init__(self, output_dir, compress=True, docs_per_block=1):
+        # a snippet decompresses the record of its document and no other
+        super().__init__(output_dir, compress, docs_per_block)
+
+
+class SentenceStore(DocStore):
+    """Sentences of the documents by internal id, see DocStore."""
+
+    files = SentenceStoreWriter.files
+
+    def decode(self, data):
+        return DocumentSentences(data)
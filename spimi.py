@@ -0,0 +1,96 @@
+"""
+Run files for single-pass in-memory indexing (SPIMI) under a memory budget.
+
+When the postings held in memory by IndexEngine reach the budget, they are
+written to a run file sorted by term id and dropped from memory. At the end all
+runs are merged with a k-way merge into the postings lists of the final index.
+Runs are written in collection order, so for a term that appears in several runs
+concatenating its lists in run order keeps the doc ids increasing.
+
+A run file is a sequence of records in increasing term id order:
+
+    term id, number of postings     2 x uint32
+    doc ids                         n x uint32
+    frequencies                     n x uint32
+    positions                       sum of the frequencies x uint32, only in the
+                                    runs of a positional index
+"""
+
+import heapq
+import os
+import struct
+from array import array
+from itertools import groupby
+
+RUN_HEADER = struct.Struct("<II")
+
+# rough size of one (doc id, freq) tuple in a postings list, list slot included
+POSTING_BYTES = 100
+
+# rough size of one position (int and list slot) of a positional index
+POSITION_BYTES = 36
+
+
+def write_run(path, postings, positions=None):
+    """Write the in-memory postings ({tid: [(doc_id, freq), ...]}) to a run file.
+
+    positions ({tid: [position, ...]}) holds the positions of every posting one
+    after another, for a positional index.
+    """
+    with open(path, "wb") as f:
+        for tid in sorted(postings):
+            plist = postings[tid]
+            f.write(RUN_HEADER.pack(tid, len(plist)))
+            array("I", [doc_id for doc_id, _ in plist]).tofile(f)
+            array("I", [freq for _, freq in plist]).tofile(f)
+            if positions is not None:
+                array("I", positions[tid]).tofile(f)
+
+
+def read_run(path, positional=False):
+    """Yield (tid, doc_ids, freqs), plus positions if positional, from a run file."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RUN_HEADER.size)
+            if not header:
+                return
+            tid, count = RUN_HEADER.unpack(header)
+            doc_ids = array("I")
+            doc_ids.fromfile(f, count)
+            freqs = array("I")
+            freqs.fromfile(f, count)
+            if not positional:
+                yield tid, doc_ids, freqs
+                continue
+            positions = array("I")
+            positions.fromfile(f, sum(freqs))
+            yield tid, doc_ids, freqs, positions
+
+
+def merge_runs(paths, positional=False):
+    """k-way merge of run files into (tid, doc_ids, freqs) in term id order.
+
+    With positional, the runs hold positions and they are merged too.
+    """
+    # heapq.merge is stable, so equal term ids come out in run order
+    merged = heapq.merge(
+        *(read_run(path, positional) for path in paths), key=lambda r: r[0]
+    )
+    for tid, parts in groupby(merged, key=lambda r: r[0]):
+        doc_ids = array("I")
+        freqs = array("I")
+        positions = array("I")
+        for _, part_docs, part_freqs, *part_positions in parts:
+            doc_ids.extend(part_docs)
+            freqs.extend(part_freqs)
+            if positional:
+                positions.extend(part_positions[0])
+        if positional:
+            yield tid, doc_ids, freqs, positions
+        else:
+            yield tid, doc_ids, freqs
+
+
+def remove_runs(paths):
+    for path in paths:
+        os.remove(path)
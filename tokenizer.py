@@ -0,0 +1,75 @@
+"""
+Tokenizer shared by indexing, retrieval and snippets.
+
+Text is lowercased and split into maximal runs of letters and digits; all other
+characters separate tokens. No stopwords are removed and nothing is stemmed.
+
+Almost all of the collection is ASCII, where letters and digits are exactly
+[a-z0-9] after lowercasing. There every other character is translated to a
+space with str.translate and the text is cut with str.split, both of which run
+in C, instead of a Python-level loop over every character. Text with other
+characters goes through the original character loop (str.isalpha/isdigit),
+which keeps the output identical for any input.
+
+Benchmark against the per-character loop:
+    python bench_tokenizer.py latimes.gz
+"""
+
+import string
+
+TOKEN_CHARS = string.ascii_lowercase + string.digits
+SEPARATORS = str.maketrans(
+    {chr(c): " " for c in range(128) if chr(c) not in TOKEN_CHARS}
+)
+
+# characters translated at a time by iter_tokens
+CHUNK_SIZE = 1 << 16
+
+
+def iter_tokens_per_char(text):
+    """Yield the tokens of text one character at a time (the reference version)."""
+    # Based on SimpleTokenizer by Trevor Strohman,
+    # http://www.galagosearch.org/
+    text = text.lower()
+    start = 0
+    i = 0
+    for currChar in text:
+        if not currChar.isdigit() and not currChar.isalpha():
+            if start != i:
+                yield text[start:i]
+            start = i + 1
+        i = i + 1
+    if start != i:
+        yield text[start:i]
+
+
+def tokenize(text):
+    """Return the list of tokens of text."""
+    if text.isascii():
+        return text.lower().translate(SEPARATORS).split()
+    return list(iter_tokens_per_char(text))
+
+
+def iter_tokens(text, chunk_size=CHUNK_SIZE):
+    """Yield the tokens of text, translating at most chunk_size characters at a time."""
+    if not text.isascii():
+        yield from iter_tokens_per_char(text)
+        return
+    carry = ""
+    for start in range(0, len(text), chunk_size):
+        chunk = carry + text[start : start + chunk_size].lower().translate(SEPARATORS)
+        tokens = chunk.split()
+        # a token that reaches the end of the chunk may go on in the next one
+        carry = tokens.pop() if tokens and chunk[-1] != " " else ""
+        yield from tokens
+    if carry:
+        yield carry
+
+
+def Tokenize(text, tokens):
+    tokens.extend(tokenize(text))
+
+
+def TokenizeStrings(strings, tokens):
+    for text in strings:
+        Tokenize(text, tokens)
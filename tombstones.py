@@ -0,0 +1,172 @@
+"""
+Deleting and updating documents with tombstones.
+
+Deleting a document doesn't rewrite postings, doc-lengths.txt or
+docno_list.txt. Its internal id is set in deleted.bin, a bitmap in the index
+directory that the evaluators check while they traverse postings
+(index.deleted), so the document stops matching queries right away. The
+collection statistics (N, average doc length, df) keep counting it until the
+index is compacted.
+
+Updating a document is deleting it and appending the new version as a new
+segment (see segments.py), which IndexEngine does with --update.
+
+Compaction rewrites the postings of every segment without the deleted
+documents and records how many were purged in index-meta.json, so N and the
+average doc length only count live documents. Doc ids and term ids don't
+change: deleted documents keep their entries in docno_list.txt, the doc lengths
+and the doc store. Impacts (impact_index.py) don't survive it: they are aligned
+with the old postings and weighted with the old statistics, so compaction
+removes them and they have to be built again. Segment merges purge deleted
+postings as well.
+
+Usage:
+    python tombstones.py delete <index_dir> <docno> [<docno> ...]
+    python tombstones.py compact <index_dir>
+"""
+
+import os
+import sys
+from array import array
+from collections import defaultdict
+from binary_index import (
+    DOC_LENGTHS_FILE,
+    META_FILE,
+    POSITIONS_FILE,
+    POSITIONS_INDEX_FILE,
+    POSTINGS_FILE,
+    TERM_STRINGS_FILE,
+    TERMS_FILE,
+    BinaryIndex,
+    read_deleted,
+    write_deleted,
+    write_index,
+)
+from impact_index import IMPACTS_FILE, IMPACTS_INDEX_FILE, IMPACTS_META_FILE
+from segments import (
+    MERGE_LOCK_FILE,
+    index_blocks,
+    load_manifest,
+    local_deleted,
+    locked,
+    segment_path,
+)
+
+
+def load_doc_ids(index_dir):
+    """Map every DOCNO to its internal ids, oldest version first."""
+    doc_ids = defaultdict(list)
+    with open(os.path.join(index_dir, "docno_list.txt"), "r") as f:
+        for doc_id, line in enumerate(f):
+            doc_ids[line.strip()].append(doc_id)
+    return doc_ids
+
+
+def mark_deleted(index_dir, doc_ids):
+    """Add doc_ids to the tombstones; the caller holds the segments lock."""
+    deleted = read_deleted(index_dir)
+    if not deleted.issuperset(doc_ids):
+        write_deleted(index_dir, deleted.union(doc_ids))
+
+
+def delete_docnos(index_dir, docnos):
+    """Delete every version of the given DOCNOs and return those not found."""
+    with locked(index_dir):
+        by_docno = load_doc_ids(index_dir)
+        mark_deleted(
+            index_dir,
+            [doc_id for docno in docnos for doc_id in by_docno.get(docno, [])],
+        )
+    return [docno for docno in docnos if docno not in by_docno]
+
+
+def purged_postings(index, by_tid, deleted):
+    for term, record in by_tid:
+        tid = record[2]
+        doc_ids, freqs, positions = array("I"), array("I"), array("I")
+        for block_docs, block_freqs, block_positions in index_blocks(
+            index, record, index.positional
+        ):
+            for doc_id, freq, where in zip(block_docs, block_freqs, block_positions):
+                if doc_id not in deleted:
+                    doc_ids.append(doc_id)
+                    freqs.append(freq)
+                    positions.extend(where)
+        # terms left without postings keep their term id with a df of 0
+        if doc_ids:
+            if index.positional:
+                yield tid, doc_ids, freqs, positions
+            else:
+                yield tid, doc_ids, freqs
+
+
+def compact_index(path, deleted):
+    """Purge the deleted (local) doc ids from the index in path.
+
+    Returns False if they had all been purged already.
+    """
+    index = BinaryIndex(path)
+    if len(deleted) == index.meta.get("deleted_docs", 0):
+        return False
+    by_tid = sorted(index.items(), key=lambda item: item[1][2])
+    lexicon = {term: record[2] for term, record in by_tid}
+
+    # readers keep their mmaps of the old files until they reopen the index
+    tmp_dir = os.path.join(path, "compact")
+    os.makedirs(tmp_dir, exist_ok=True)
+    write_index(
+        tmp_dir,
+        lexicon,
+        purged_postings(index, by_tid, deleted),
+        index.doc_lengths,
+        index.codec,
+        deleted,
+        index.stemmed,
+        index.positional,
+    )
+    names = [POSTINGS_FILE, TERMS_FILE, TERM_STRINGS_FILE, DOC_LENGTHS_FILE]
+    if index.positional:
+        names += [POSITIONS_FILE, POSITIONS_INDEX_FILE]
+    # the meta goes last, so the new statistics only show with the new postings
+    for name in names:
+        os.replace(os.path.join(tmp_dir, name), os.path.join(path, name))
+    os.replace(os.path.join(tmp_dir, META_FILE), os.path.join(path, META_FILE))
+    os.rmdir(tmp_dir)
+    # impacts no longer line up with the postings; the meta goes first
+    for name in (IMPACTS_META_FILE, IMPACTS_FILE, IMPACTS_INDEX_FILE):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    return True
+
+
+def compact(index_dir):
+    """Purge deleted documents from every segment; return how many were rewritten."""
+    with locked(index_dir, MERGE_LOCK_FILE), locked(index_dir):
+        deleted = read_deleted(index_dir)
+        manifest = load_manifest(index_dir)
+        root = BinaryIndex(index_dir)
+        parts = [(index_dir, 0, root.meta["num_docs"])]
+        for seg in manifest["segments"]:
+            path = segment_path(index_dir, seg["name"])
+            parts.append((path, seg["base"], seg["num_docs"]))
+
+        rewritten = 0
+        for path, base, num_docs in parts:
+            if compact_index(path, local_deleted(deleted, base, num_docs)):
+                rewritten += 1
+        return rewritten
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "delete":
+        missing = delete_docnos(sys.argv[2], sys.argv[3:])
+        for docno in missing:
+            print(f"Error: Document with DOCNO {docno} not found.")
+        sys.exit(1 if missing else 0)
+    elif len(sys.argv) == 3 and sys.argv[1] == "compact":
+        rewritten = compact(sys.argv[2])
+        print(f"Compacted {rewritten} segment(s).")
+    else:
+        print("Usage: python tombstones.py delete <index_dir> <docno> [<docno> ...]")
+        print("       python tombstones.py compact <index_dir>")
+        sys.exit(1)
@@ -0,0 +1,215 @@
+"""
+Top-k BM25 retrieval with Block-Max WAND dynamic pruning.
+
+compute_bm25 scores every posting of every query term. The evaluator here keeps
+a heap of the best k documents seen so far and uses score upper bounds to skip
+documents that cannot enter it:
+
+- every query term has an upper bound, the largest score any of its postings
+  can reach; documents are only evaluated once the bounds of the terms pointing
+  at or before them can beat the heap threshold (WAND)
+- every block of 128 postings has its own, tighter bound, so whole blocks are
+  skipped without being decoded when their bounds cannot beat the threshold
+  (Block-Max WAND)
+
+The bounds come from the block maxima (max frequency, min doc length) stored in
+the skip tables of the postings lists, see postings_codec.py. Documents that are
+evaluated are scored with exactly the same arithmetic and in the same term order
+as compute_bm25, so the top k (with ties broken by docno) is identical to the
+exhaustive ranking.
+
+Segmented indexes (segments.py) are evaluated one segment after the other with
+a single heap, so the threshold reached in one segment carries over to the next.
+Cursors use the segment's local doc ids; idf comes from the global df.
+"""
+
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from bm25 import bm25_idf, bm25_term_score, compute_bm25
+from postings_codec import decode_block, read_skip_table
+
+END = float("inf")
+
+# bounds are padded so that float rounding in the sum of the real term scores
+# can never make a document exceed them
+BOUND_SLACK = 1 + 1e-9
+
+
+class PostingsCursor:
+    def __init__(self, index, record, count, idf, base, doc_lengths, avg_doc_length):
+        _, _, _, self.df, self.offset, _ = record
+        self.data = index.postings_data
+        self.skip_table = read_skip_table(self.data, self.offset, self.df, True)
+        self.last_docs, _, max_freqs, min_lengths = self.skip_table
+        self.idf = idf
+        self.base = base
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = avg_doc_length
+        self.block_bounds = [
+            count
+            * bm25_term_score(max_freq, min_length, avg_doc_length, self.idf)
+            * BOUND_SLACK
+            for max_freq, min_length in zip(max_freqs, min_lengths)
+        ]
+        self.bound = max(self.block_bounds)
+        self.block = -1
+        self.doc = END
+        self.load_block(0)
+
+    def load_block(self, block):
+        if block >= len(self.last_docs):
+            self.doc = END
+            return
+        self.block = block
+        self.doc_ids, self.freqs = decode_block(
+            self.data, self.offset, self.df, self.skip_table, block
+        )
+        self.pos = 0
+        self.doc = self.doc_ids[0]
+
+    def next(self):
+        self.pos += 1
+        if self.pos < len(self.doc_ids):
+            self.doc = self.doc_ids[self.pos]
+        else:
+            self.load_block(self.block + 1)
+
+    def next_geq(self, target):
+        """Move to the first posting with doc id >= target."""
+        if self.doc >= target:
+            return
+        block = bisect_left(self.last_docs, target, self.block)
+        if block != self.block:
+            self.load_block(block)
+            if self.doc == END:
+                return
+        self.pos = bisect_left(self.doc_ids, target, self.pos)
+        self.doc = self.doc_ids[self.pos]
+
+    def shallow_block(self, target):
+        """Return the block that would hold target, without decoding it."""
+        return bisect_left(self.last_docs, target, self.block)
+
+    def score(self):
+        doc_length = self.doc_lengths[self.base + self.doc]
+        return bm25_term_score(
+            self.freqs[self.pos], doc_length, self.avg_doc_length, self.idf
+        )
+
+
+class HeapEntry:
+    __slots__ = ("score", "docno", "doc_id")
+
+    def __init__(self, score, docno, doc_id):
+        self.score = score
+        self.docno = docno
+        self.doc_id = doc_id
+
+    def __lt__(self, other):
+        # the heap keeps the worst entry on top: lower score first, and for
+        # equal scores the larger docno, which ranks lower
+        return (self.score, other.docno) < (other.score, self.docno)
+
+
+def top_k_bm25(query_tokens, index, doc_lengths, docno_list, avg_doc_length, k=1000):
+    """Return the k best (doc_id, score) pairs, ranked like calculate_bm25."""
+    if not index.block_max:
+        # indexes built without block maxima are scored exhaustively
+        scores = compute_bm25(
+            query_tokens, doc_lengths, avg_doc_length, index, index.total_docs
+        )
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], docno_list[x[0]]))
+        return ranked[:k]
+
+    counts = Counter(query_tokens)
+    idfs = {
+        term: bm25_idf(index.total_docs, index.doc_freq(term))
+        for term in counts
+        if term in index
+    }
+    heap = []
+    for base, segment in index.segments:
+        cursors = {}
+        for term, count in counts.items():
+            record = segment.lookup(term)
+            # compaction can leave a term without postings in a segment
+            if record is not None and record[3]:
+                cursors[term] = PostingsCursor(
+                    segment,
+                    record,
+                    count,
+                    idfs[term],
+                    base,
+                    doc_lengths,
+                    avg_doc_length,
+                )
+        evaluate_segment(
+            query_tokens, cursors, base, index.deleted, heap, docno_list, k
+        )
+
+    ranked = sorted(heap, key=lambda e: (-e.score, e.docno))
+    return [(entry.doc_id, entry.score) for entry in ranked]
+
+
+def evaluate_segment(query_tokens, cursors, base, deleted, heap, docno_list, k):
+    """Run Block-Max WAND over the cursors of one segment, updating heap."""
+    # terms are scored in query order, duplicates included, as in compute_bm25
+    scoring_order = [cursors[term] for term in query_tokens if term in cursors]
+    active = list(cursors.values())
+
+    while active:
+        active.sort(key=lambda c: c.doc)
+        threshold = heap[0].score if len(heap) == k else -END
+
+        # pivot: first cursor at which the summed term bounds reach the threshold
+        bound = 0.0
+        pivot = None
+        for i, cursor in enumerate(active):
+            if cursor.doc == END:
+                break
+            bound += cursor.bound
+            if bound >= threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break
+        pivot_doc = active[pivot].doc
+        while pivot + 1 < len(active) and active[pivot + 1].doc == pivot_doc:
+            pivot += 1
+
+        # block-max check on the blocks that would hold the pivot document;
+        # a cursor whose list ends before the pivot contributes nothing
+        block_bound = 0.0
+        target = END
+        for cursor in active[: pivot + 1]:
+            block = cursor.shallow_block(pivot_doc)
+            if block < len(cursor.last_docs):
+                block_bound += cursor.block_bounds[block]
+                target = min(target, cursor.last_docs[block] + 1)
+        if block_bound < threshold:
+            # no document before the end of the shortest of these blocks can
+            # make it into the heap
+            if pivot + 1 < len(active):
+                target = min(target, active[pivot + 1].doc)
+            for cursor in active[: pivot + 1]:
+                cursor.next_geq(target)
+        elif active[0].doc == pivot_doc:
+            doc_id = base + pivot_doc
+            if doc_id not in deleted:
+                score = 0.0
+                for cursor in scoring_order:
+                    if cursor.doc == pivot_doc:
+                        score += cursor.score()
+                entry = HeapEntry(score, docno_list[doc_id], doc_id)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif heap[0] < entry:
+                    heapq.heapreplace(heap, entry)
+            for cursor in active[: pivot + 1]:
+                cursor.next()
+        else:
+            for cursor in active[:pivot]:
+                cursor.next_geq(pivot_doc)
+
+        active = [cursor for cursor in active if cursor.doc != END]